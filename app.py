@@ -10,432 +10,176 @@ st.set_page_config(
 
 import pandas as pd
 import numpy as np
-import joblib
+import streamlit.components.v1 as components
 from streamlit_lottie import st_lottie
 import json
 import plotly.graph_objects as go
 import plotly.express as px
 from plotly.subplots import make_subplots
-from fpdf import FPDF
 import io
-from io import BytesIO
+import os
 import time
 from datetime import datetime, timedelta
 import base64
+import hmac
+import logging
+import uuid
+from cardioguard import memory, metrics, models, profiling
+from cardioguard.cohort import aggregate, content_hash, missing_columns, score_cohort, select
+from cardioguard.drift import open_monitor
+from cardioguard.features import DATASET_PATH, features_from_record
+from cardioguard.history import HistoryStore
+from cardioguard.neighbors import load_index
+from cardioguard.registry import ModelRegistry
+from cardioguard.reports import generate_advanced_pdf_report, generate_personalized_recommendations, get_risk_level
+from cardioguard.report_jobs import ReportJobs, prediction_key
+from cardioguard.session_store import SessionStore, SessionTooLarge
+from cardioguard.settings import data_path, env_float, env_int, env_list
+from cardioguard.shadow import ShadowScorer
+from cardioguard.trends import downsample_history
+from cardioguard.uncertainty import needs_review, predict_with_dispersion, review_std
 
-# Load models
+log = logging.getLogger("cardioguard.app")
+
+# Load models from the versioned registry; new ACTIVE versions are swapped in by a watcher thread
 @st.cache_resource
 def load_models():
-    rf_model = joblib.load("Tuned_random_forest_model.pkl")
-    stack_model = joblib.load("Stacking_classifier_model.pkl")
-    return rf_model, stack_model
+    # Under the pre-fork launcher the parent has already loaded and warmed them; otherwise
+    # they load in the background so the page renders without waiting for the pickles
+    registry = models.get_preloaded() or ModelRegistry()
+    if registry.current() is None:
+        registry.load_in_background()
+    registry.start_watcher()
+    return registry
 
-rf_model, stack_model = load_models()
+model_registry = load_models()
 
-# Load Lottie animation
+# Heart animation, kept on streamlit-lottie until the lottie-web player itself can be served from static/
 @st.cache_data
 def load_lottie(filepath: str):
     try:
         with open(filepath, "r") as f:
             return json.load(f)
-    except:
+    except (OSError, ValueError):
         return None
 
-lottie_heart = load_lottie("heart.json")
-
-# Advanced CSS Styling for Professional CHD Risk Dashboard Theme
-st.markdown("""
-<style>
-    /* Import modern fonts */
-    @import url('https://fonts.googleapis.com/css2?family=Poppins:wght@300;400;600;700;900&display=swap');
-
-    /* Global styles */
-    html, body, [class*="st-"] {
-        font-family: 'Poppins', sans-serif !important;
-        background: #0d1828 !important; /* Deep blue-black for medical/professional look */
-        color: #f7fafd !important; /* Very light blue for high contrast */
-    }
-
-    /* Hide default streamlit elements */
-    .stDeployButton {display: none;}
-    #MainMenu {visibility: hidden;}
-    footer {visibility: hidden;}
-
-    /* Custom background with animated gradient */
-    .stApp {
-        background: #0d1828 !important;
-        background-image: linear-gradient(120deg, #16213e 0%, #0d1828 100%);
-        background-attachment: fixed;
-        animation: bgmove 12s ease-in-out infinite alternate;
-    }
-    @keyframes bgmove {
-        0% {background-position: 0% 50%;}
-        100% {background-position: 100% 50%;}
-    }
-
-    /* Main container styling */
-    .main-container {
-        background: rgba(13, 24, 40, 0.98);
-        border-radius: 20px;
-        padding: 2rem;
-        margin: 1rem;
-        box-shadow: 0 20px 40px rgba(0,0,0,0.7);
-        backdrop-filter: blur(10px);
-        border: 1px solid rgba(255,255,255,0.08);
-    }
+lottie_heart = load_lottie(os.path.join("static", "heart.json"))
 
-    /* Animated title */
-    .main-title {
-        font-size: 3.5rem;
-        font-weight: 900;
-        background: linear-gradient(90deg, #ff6b6b, #ee5253, #54a0ff, #2ed573, #ffa502, #ff3838);
-        background-size: 400% 400%;
-        -webkit-background-clip: text;
-        -webkit-text-fill-color: transparent;
-        background-clip: text;
-        text-align: center;
-        margin: 2rem 0;
-        animation: gradientShift 5s ease-in-out infinite;
-        text-shadow: 0 4px 24px rgba(0,0,0,0.6);
-        letter-spacing: 2px;
-        filter: drop-shadow(0 2px 8px #000);
-    }
-    @keyframes gradientShift {
-        0% { background-position: 0% 50%; }
-        50% { background-position: 100% 50%; }
-        100% { background-position: 0% 50%; }
-    }
-
-    /* Subtitle styling */
-    .subtitle {
-        font-size: 1.3rem;
-        color: #b8c6e5;
-        text-align: center;
-        margin-bottom: 3rem;
-        font-weight: 300;
-        text-shadow: 0 2px 8px #000;
-        letter-spacing: 1px;
-        animation: fadeIn 1.2s;
-    }
+# Background PDF rendering shared across sessions, cached per prediction
+@st.cache_resource
+def get_report_jobs():
+    jobs = ReportJobs()
+    # Cached reports embed model outputs, so drop them when the model version changes
+    model_registry.on_swap(lambda previous, current: jobs.clear())
+    return jobs
 
-    /* Card styling */
-    .info-card {
-        background: linear-gradient(135deg, #16213e 0%, #22304a 100%);
-        color: #f7fafd;
-        padding: 2rem;
-        border-radius: 15px;
-        margin: 1rem 0;
-        box-shadow: 0 10px 30px rgba(0,0,0,0.7);
-        transition: all 0.3s ease;
-        border: 1px solid rgba(255,255,255,0.08);
-        animation: fadeInUp 0.8s;
-    }
-    .info-card:hover {
-        transform: translateY(-5px) scale(1.02);
-        box-shadow: 0 15px 40px rgba(0,0,0,0.85);
-        border-color: #54a0ff;
-    }
+report_jobs = get_report_jobs()
 
-    /* Risk cards */
-    .risk-card {
-        padding: 1.5rem;
-        border-radius: 15px;
-        margin: 1rem 0;
-        text-align: center;
-        transition: all 0.3s ease;
-        border: 2px solid transparent;
-        background: rgba(13,24,40,0.95);
-        box-shadow: 0 4px 16px rgba(0,0,0,0.7);
-        color: #f7fafd;
-        animation: fadeInUp 0.8s;
-    }
-    .risk-card:hover {
-        transform: scale(1.03);
-        border-color: #54a0ff;
-    }
-    .low-risk {
-        background: linear-gradient(135deg, #2ed573 60%, #16213e 100%);
-        color: #fff;
-        border: 2px solid #2ed573;
-        box-shadow: 0 0 16px #2ed57355;
-    }
-    .moderate-risk {
-        background: linear-gradient(135deg, #ffa502 60%, #16213e 100%);
-        color: #fff;
-        border: 2px solid #ffa502;
-        box-shadow: 0 0 16px #ffa50255;
-    }
-    .high-risk {
-        background: linear-gradient(135deg, #ff3838 60%, #16213e 100%);
-        color: #fff;
-        border: 2px solid #ff3838;
-        box-shadow: 0 0 16px #ff383855;
-    }
+# Per-session records live in a bounded store instead of st.session_state
+@st.cache_resource
+def get_session_store():
+    store = SessionStore(
+        data_path("sessions.sqlite3"),
+        max_record_bytes=env_int("CARDIOGUARD_SESSION_MAX_BYTES", 32 * 1024),
+        idle_seconds=env_int("CARDIOGUARD_SESSION_IDLE_SECONDS", 900),
+        expire_seconds=env_int("CARDIOGUARD_SESSION_EXPIRE_SECONDS", 7 * 24 * 3600),
+        # Reloaded from the history store on every rerun, so safe to drop when over the cap
+        transient_keys=("progress_checklist",),
+    )
+    metrics.register_collector("sessions", store.stats)
+    metrics.register_collector("report_jobs", report_jobs.stats)
+    metrics.register_collector("models", model_registry.stats)
+    metrics.register_collector("startup", models.startup_stats)
+    metrics.register_collector("memory", lambda: memory.stats(model_registry.current()))
+    memory.register_sizer("session_records", lambda: store.stats()["live_bytes"])
+    memory.register_sizer("report_jobs", lambda: report_jobs.stats()["cached_bytes"])
+    metrics_port = env_int("CARDIOGUARD_METRICS_PORT", 0)
+    if metrics_port:
+        metrics.start_metrics_server(metrics_port)
+    return store
 
-    /* Button styling */
-    .stButton > button {
-        width: 100%;
-        background: linear-gradient(90deg, #54a0ff, #2ed573, #ff6b6b);
-        color: #fff;
-        border: none;
-        padding: 1rem 2rem;
-        border-radius: 10px;
-        font-size: 1.1rem;
-        font-weight: 700;
-        transition: all 0.3s ease;
-        box-shadow: 0 5px 15px rgba(0,0,0,0.4);
-        text-transform: uppercase;
-        letter-spacing: 1px;
-        outline: none;
-        animation: pulse 2.5s infinite;
-    }
-    .stButton > button:hover {
-        transform: translateY(-2px) scale(1.03);
-        box-shadow: 0 8px 25px #54a0ff55;
-        background: linear-gradient(90deg, #2ed573, #54a0ff, #ff6b6b);
-        color: #fff;
-    }
+session_store = get_session_store()
 
-    /* Input styling */
-    .stSelectbox > div > div,
-    .stNumberInput > div > div,
-    .stSlider > div > div {
-        background: rgba(22, 33, 62, 0.98) !important;
-        border-radius: 10px !important;
-        border: 2px solid #16213e !important;
-        color: #f5f6fa !important;
-        transition: all 0.3s ease;
-    }
-    .stSelectbox > div > div:hover,
-    .stNumberInput > div > div:hover,
-    .stSlider > div > div:hover {
-        border-color: #54a0ff !important;
-        box-shadow: 0 5px 15px #54a0ff33;
-    }
-    .stSlider > div > div {
-        padding: 1rem;
-    }
+# Assessment history and checklists persisted per user
+@st.cache_resource
+def get_history_store():
+    store = HistoryStore(data_path("history.sqlite3"))
+    metrics.register_collector("history", store.stats)
+    return store
 
-    /* Metrics styling */
-    .stMetric {
-        background: rgba(22, 33, 62, 0.98) !important;
-        padding: 1rem;
-        border-radius: 10px;
-        box-shadow: 0 5px 15px rgba(0,0,0,0.5);
-        border: 1px solid #16213e;
-        color: #f5f6fa !important;
-    }
+history_store = get_history_store()
 
-    /* Expander styling */
-    .streamlit-expanderHeader {
-        background: linear-gradient(135deg, #16213e, #54a0ff);
-        color: #fff !important;
-        border-radius: 10px 10px 0 0;
-        padding: 1rem;
-        font-weight: 600;
-        border-bottom: 1px solid #16213e;
-    }
-    .streamlit-expanderContent {
-        background: rgba(22, 33, 62, 0.98) !important;
-        border-radius: 0 0 10px 10px;
-        padding: 1rem;
-        border: 1px solid #16213e;
-        color: #fff !important;
-    }
-
-    /* Progress bar */
-    .progress-container {
-        background: rgba(255,255,255,0.08);
-        border-radius: 10px;
-        height: 8px;
-        overflow: hidden;
-        margin: 1rem 0;
-    }
-    .progress-bar {
-        height: 100%;
-        background: linear-gradient(90deg, #54a0ff, #2ed573);
-        border-radius: 10px;
-        transition: width 0.5s ease;
-    }
+# Candidate model versions scored in the background against live traffic
+@st.cache_resource
+def get_shadow_scorer():
+    versions = env_list("CARDIOGUARD_SHADOW_VERSIONS")
+    if not versions:
+        return None
+    scorer = ShadowScorer(model_registry, versions, data_path("shadow.sqlite3"))
+    metrics.register_collector("shadow", scorer.stats)
+    return scorer
 
-    /* Floating elements */
-    .floating-card {
-        position: fixed;
-        top: 20px;
-        right: 20px;
-        background: rgba(22, 33, 62, 0.98);
-        padding: 1rem;
-        border-radius: 10px;
-        box-shadow: 0 10px 30px rgba(0,0,0,0.7);
-        backdrop-filter: blur(10px);
-        z-index: 1000;
-        border: 1px solid #16213e;
-        color: #fff;
-    }
+shadow_scorer = get_shadow_scorer()
 
-    /* Animation classes */
-    .fade-in {
-        animation: fadeIn 0.7s ease-in-out;
-    }
-    @keyframes fadeIn {
-        from { opacity: 0; transform: translateY(20px);}
-        to { opacity: 1; transform: translateY(0);}
-    }
-    .fadeInUp {
-        animation: fadeInUp 0.8s;
-    }
-    @keyframes fadeInUp {
-        from { opacity: 0; transform: translateY(40px);}
-        to { opacity: 1; transform: translateY(0);}
-    }
-    .pulse {
-        animation: pulse 2.5s infinite;
-    }
-    @keyframes pulse {
-        0% { transform: scale(1);}
-        50% { transform: scale(1.04);}
-        100% { transform: scale(1);}
-    }
-    .glow {
-        animation: glow 1.5s infinite alternate;
-    }
-    @keyframes glow {
-        from { box-shadow: 0 0 8px #54a0ff55;}
-        to { box-shadow: 0 0 24px #54a0ff;}
-    }
+# Input drift against the training distribution, updated off the request path
+@st.cache_resource
+def get_drift_monitor():
+    monitor = open_monitor(interval=env_float("CARDIOGUARD_DRIFT_INTERVAL", 60.0))
+    if monitor is None:
+        return None
+    metrics.register_collector("drift", monitor.stats)
+    return monitor
 
-    /* Responsive design */
-    @media (max-width: 768px) {
-        .main-title {
-            font-size: 2.2rem;
-        }
-        .subtitle {
-            font-size: 1rem;
-        }
-        .floating-card {
-            position: relative;
-            top: 0;
-            right: 0;
-            margin: 1rem 0;
-        }
-        .main-container {
-            padding: 1rem;
-        }
-    }
+drift_monitor = get_drift_monitor()
 
-    /* Health recommendation cards */
-    .health-recommendation {
-        background: linear-gradient(135deg, #16213e, #54a0ff 80%);
-        color: #fff;
-        padding: 1.5rem;
-        border-radius: 15px;
-        margin: 1rem 0;
-        box-shadow: 0 10px 30px rgba(0,0,0,0.7);
-        transition: all 0.3s ease;
-        border: 1px solid #16213e;
-        animation: fadeInUp 0.8s;
-    }
-    .health-recommendation:hover {
-        transform: translateY(-3px) scale(1.01);
-        box-shadow: 0 15px 40px #54a0ff55;
-        border-color: #54a0ff;
-    }
-    .recommendation-title {
-        font-size: 1.3rem;
-        font-weight: 600;
-        margin-bottom: 1rem;
-        color: #fff;
-        text-shadow: 0 2px 8px #000;
-    }
-    .recommendation-content {
-        font-size: 1rem;
-        line-height: 1.6;
-        color: #c8d6e5;
-    }
+# Dataset patients nearest to a profile; a new modification time of the dataset picks up appended rows
+@st.cache_resource(max_entries=1)
+def get_neighbor_index(modified):
+    return load_index()
 
-    /* Feature highlight */
-    .feature-highlight {
-        background: linear-gradient(135deg, #ff6b6b, #ee5253 80%);
-        color: #fff;
-        padding: 2rem;
-        border-radius: 15px;
-        margin: 2rem 0;
-        text-align: center;
-        box-shadow: 0 10px 30px rgba(0,0,0,0.7);
-        animation: pulse 3s infinite;
-        text-shadow: 0 2px 8px #000;
-    }
+def similar_patients(features):
+    # Observed 10-year outcomes of the most similar dataset patients, or None without the dataset
+    try:
+        index = get_neighbor_index(os.path.getmtime(DATASET_PATH))
+    except FileNotFoundError:
+        return None
+    similar = index.query(features)
+    metrics.observe("neighbors_seconds", similar["seconds"])
+    return similar
 
-    /* Success message styling */
-    .success-message {
-        background: linear-gradient(135deg, #2ed573 60%, #16213e 100%);
-        color: #fff;
-        padding: 1.5rem;
-        border-radius: 10px;
-        margin: 1rem 0;
-        text-align: center;
-        font-weight: 700;
-        box-shadow: 0 5px 15px #2ed57355;
-        border: 1px solid #2ed573;
-        animation: fadeIn 0.7s;
-    }
+# Advanced CSS Styling for Professional CHD Risk Dashboard Theme
+# Served once from static/ (server.enableStaticServing) and cached by the browser
+st.html('<style>@import url("app/static/cardioguard.css");</style>')
 
-    /* Warning message styling */
-    .warning-message {
-        background: linear-gradient(135deg, #ffa502 60%, #16213e 100%);
-        color: #fff;
-        padding: 1.5rem;
-        border-radius: 10px;
-        margin: 1rem 0;
-        text-align: center;
-        font-weight: 700;
-        box-shadow: 0 5px 15px #ffa50255;
-        border: 1px solid #ffa502;
-        animation: fadeIn 0.7s;
-    }
+# Initialize session state
+SESSION_DEFAULTS = {
+    'prediction_made': False,
+    'risk_percentage': 0,
+    'risk_level': "Low",
+    'user_data': {},
+}
 
-    /* Error message styling */
-    .error-message {
-        background: linear-gradient(135deg, #ff3838 60%, #16213e 100%);
-        color: #fff;
-        padding: 1.5rem;
-        border-radius: 10px;
-        margin: 1rem 0;
-        text-align: center;
-        font-weight: 700;
-        box-shadow: 0 5px 15px #ff383855;
-        border: 1px solid #ff3838;
-        animation: fadeIn 0.7s;
-    }
+def load_session():
+    if 'session_id' not in st.session_state:
+        st.session_state.session_id = uuid.uuid4().hex
+    session = dict(SESSION_DEFAULTS)
+    session.update(session_store.load(st.session_state.session_id))
+    return session
 
-    /* Table styles for dark mode */
-    table, th, td {
-        background: #16213e !important;
-        color: #f5f6fa !important;
-        border: 1px solid #34495e !important;
-    }
-    th {
-        background: #34495e !important;
-        color: #54a0ff !important;
-    }
-    tr:nth-child(even) {
-        background: #16213e !important;
-    }
-    tr:nth-child(odd) {
-        background: #101624 !important;
-    }
-</style>
-""", unsafe_allow_html=True)
+def auth_configured():
+    try:
+        return "auth" in st.secrets
+    except Exception:
+        return False
 
-# Initialize session state
-if 'prediction_made' not in st.session_state:
-    st.session_state.prediction_made = False
-if 'risk_percentage' not in st.session_state:
-    st.session_state.risk_percentage = 0
-if 'risk_level' not in st.session_state:
-    st.session_state.risk_level = "Low"
-if 'user_data' not in st.session_state:
-    st.session_state.user_data = {}
+def history_owner():
+    # History and checklists follow the signed-in account ([auth] in secrets.toml) or else this browser session,
+    # never anything typed into the form
+    if st.user.get("is_logged_in"):
+        subject = st.user.get("email") or st.user.get("sub")
+        if subject:
+            return f"user-{subject}"
+    return f"session-{st.session_state.session_id}"
 
 # Helper functions
 def get_risk_color(risk_percentage):
@@ -446,15 +190,21 @@ def get_risk_color(risk_percentage):
     else:
         return "#ff3838"
 
-def get_risk_level(risk_percentage):
-    if risk_percentage < 30:
-        return "Low"
-    elif risk_percentage < 60:
-        return "Moderate"
-    else:
-        return "High"
+def tree_spread(prediction):
+    # (std, low, high) in percent from cardioguard.uncertainty.predict_with_dispersion, first row
+    return tuple(prediction[key][0] * 100 for key in ("std", "low", "high"))
 
-def create_risk_gauge(risk_percentage, title):
+def create_risk_gauge(risk_percentage, title, spread=None):
+    # spread: (std, low, high) in percent across the forest's trees, drawn as a band under the needle
+    steps = [
+        {'range': [0, 30], 'color': 'rgba(46, 213, 115, 0.3)'},
+        {'range': [30, 60], 'color': 'rgba(255, 165, 2, 0.3)'},
+        {'range': [60, 100], 'color': 'rgba(255, 56, 56, 0.3)'}
+    ]
+    if spread is not None:
+        std, low, high = spread
+        steps.append({'range': [low, high], 'color': 'rgba(44, 62, 80, 0.35)', 'thickness': 0.5})
+        title = f"{title}<br><span style='font-size:0.7em'>±{std:.1f}% across trees (80% range {low:.0f}–{high:.0f}%)</span>"
     fig = go.Figure(go.Indicator(
         mode="gauge+number+delta",
         value=risk_percentage,
@@ -467,11 +217,7 @@ def create_risk_gauge(risk_percentage, title):
             'bgcolor': "white",
             'borderwidth': 2,
             'bordercolor': "gray",
-            'steps': [
-                {'range': [0, 30], 'color': 'rgba(46, 213, 115, 0.3)'},
-                {'range': [30, 60], 'color': 'rgba(255, 165, 2, 0.3)'},
-                {'range': [60, 100], 'color': 'rgba(255, 56, 56, 0.3)'}
-            ],
+            'steps': steps,
             'threshold': {
                 'line': {'color': "red", 'width': 4},
                 'thickness': 0.75,
@@ -489,190 +235,7 @@ def create_risk_gauge(risk_percentage, title):
     
     return fig
 
-def generate_personalized_recommendations(risk_percentage, user_data):
-    recommendations = {
-        "nutrition": [],
-        "exercise": [],
-        "lifestyle": [],
-        "medical": [],
-        "mental_health": []
-    }
-    
-    # Risk-based recommendations
-    if risk_percentage < 30:  # Low Risk
-        recommendations["nutrition"] = [
-            "🥗 Maintain Mediterranean diet with olive oil, nuts, and fish",
-            "🍎 Include 5-7 servings of fruits and vegetables daily",
-            "🥜 Add omega-3 rich foods like salmon, walnuts, and flaxseeds",
-            "🧂 Keep sodium intake under 2300mg per day",
-            "🫐 Include antioxidant-rich berries and dark leafy greens"
-        ]
-        
-        recommendations["exercise"] = [
-            "🏃‍♂️ Maintain 150 minutes of moderate exercise weekly",
-            "💪 Include strength training 2-3 times per week",
-            "🚶‍♀️ Take 8,000-10,000 steps daily",
-            "🧘‍♀️ Practice yoga or stretching 3 times weekly",
-            "🏊‍♂️ Try swimming or cycling for cardiovascular health"
-        ]
-        
-        recommendations["lifestyle"] = [
-            "😴 Maintain 7-9 hours of quality sleep",
-            "🚭 Continue avoiding smoking and secondhand smoke",
-            "🍷 Limit alcohol to 1 drink/day (women) or 2 drinks/day (men)",
-            "💧 Stay hydrated with 8-10 glasses of water daily",
-            "🧘‍♂️ Practice stress management techniques"
-        ]
-        
-        recommendations["medical"] = [
-            "🩺 Annual health checkups with lipid panel",
-            "🩸 Monitor blood pressure monthly",
-            "📊 Track BMI and waist circumference",
-            "💉 Stay up-to-date with vaccinations",
-            "🦷 Regular dental checkups (poor oral health linked to heart disease)"
-        ]
-        
-        recommendations["mental_health"] = [
-            "🧠 Practice mindfulness meditation 10-15 minutes daily",
-            "👥 Maintain strong social connections",
-            "📚 Engage in mentally stimulating activities",
-            "🎯 Set and achieve personal goals",
-            "😊 Practice gratitude journaling"
-        ]
-    
-    elif risk_percentage < 60:  # Moderate Risk
-        recommendations["nutrition"] = [
-            "🥗 Adopt strict Mediterranean or DASH diet",
-            "🍎 Increase fruits and vegetables to 7-9 servings daily",
-            "🐟 Include fatty fish 3-4 times per week",
-            "🥜 Add plant-based proteins like beans and lentils",
-            "🧂 Reduce sodium to under 1500mg daily",
-            "🚫 Eliminate processed and trans fats completely",
-            "🌾 Choose whole grains over refined carbohydrates"
-        ]
-        
-        recommendations["exercise"] = [
-            "🏃‍♂️ Increase to 200-300 minutes of moderate exercise weekly",
-            "💪 Strength training 3-4 times per week",
-            "🚶‍♀️ Aim for 10,000+ steps daily",
-            "🏊‍♂️ Include 2-3 cardio sessions weekly",
-            "🧘‍♀️ Daily yoga or stretching routine",
-            "⏰ Break up sitting time every 30 minutes"
-        ]
-        
-        recommendations["lifestyle"] = [
-            "😴 Prioritize 7-9 hours of quality sleep",
-            "🚭 Smoking cessation programs if applicable",
-            "🍷 Limit alcohol to 3-4 drinks per week maximum",
-            "💧 Increase water intake to 10-12 glasses daily",
-            "🧘‍♂️ Daily stress management practices",
-            "📱 Limit screen time and blue light exposure"
-        ]
-        
-        recommendations["medical"] = [
-            "🩺 Bi-annual comprehensive health checkups",
-            "🩸 Weekly blood pressure monitoring",
-            "📊 Monthly weight and BMI tracking",
-            "💊 Discuss preventive medications with doctor",
-            "🏥 Consider cardiac calcium scoring",
-            "🩹 Monitor for diabetes risk factors"
-        ]
-        
-        recommendations["mental_health"] = [
-            "🧠 Daily meditation or mindfulness practice",
-            "👥 Build and maintain social support network",
-            "😌 Consider counseling for stress management",
-            "🎯 Set realistic health goals with professional guidance",
-            "😊 Practice positive psychology techniques"
-        ]
-    
-    else:  # High Risk
-        recommendations["nutrition"] = [
-            "🥗 Strict therapeutic diet (consult nutritionist)",
-            "🍎 9+ servings of fruits and vegetables daily",
-            "🐟 Fatty fish 4+ times per week",
-            "🥜 Daily nuts and seeds (unsalted)",
-            "🧂 Sodium restriction to 1000-1500mg daily",
-            "🚫 Complete elimination of processed foods",
-            "🌾 100% whole grain choices",
-            "🥛 Consider plant-based milk alternatives",
-            "☕ Limit caffeine to 1-2 cups daily"
-        ]
-        
-        recommendations["exercise"] = [
-            "🏃‍♂️ Supervised exercise program (300+ minutes weekly)",
-            "💪 Resistance training 4-5 times per week",
-            "🚶‍♀️ 12,000+ steps daily with activity tracking",
-            "🏊‍♂️ Low-impact cardio 4-5 times weekly",
-            "🧘‍♀️ Daily flexibility and mobility work",
-            "⏰ Active breaks every 20-30 minutes",
-            "🎯 Work with exercise physiologist"
-        ]
-        
-        recommendations["lifestyle"] = [
-            "😴 Optimize sleep hygiene (7-9 hours nightly)",
-            "🚭 Immediate smoking cessation with medical support",
-            "🍷 Eliminate or severely limit alcohol",
-            "💧 12+ glasses of water daily",
-            "🧘‍♂️ Multiple daily stress reduction sessions",
-            "📱 Digital detox periods",
-            "🌡️ Monitor environmental stressors"
-        ]
-        
-        recommendations["medical"] = [
-            "🩺 Quarterly comprehensive health monitoring",
-            "🩸 Daily blood pressure and heart rate monitoring",
-            "📊 Weekly weight and symptom tracking",
-            "💊 Medications as prescribed by cardiologist",
-            "🏥 Regular cardiac imaging and stress tests",
-            "🩹 Intensive diabetes and cholesterol management",
-            "🚨 Emergency action plan for cardiac events"
-        ]
-        
-        recommendations["mental_health"] = [
-            "🧠 Professional stress management therapy",
-            "👥 Cardiac rehabilitation support groups",
-            "😌 Regular counseling sessions",
-            "🎯 Professional goal setting and monitoring",
-            "😊 Positive psychology interventions",
-            "🧘‍♂️ Mindfulness-based stress reduction (MBSR)",
-            "📞 24/7 mental health support access"
-        ]
-    
-    # Personalized adjustments based on user data
-    age = user_data.get('age', 50)
-    sex = user_data.get('sex', 0)
-    smoking = user_data.get('is_smoking', 0)
-    diabetes = user_data.get('diabetes', 0)
-    hypertension = user_data.get('prevalentHyp', 0)
-    
-    # Age-specific adjustments
-    if age > 65:
-        recommendations["exercise"].append("🦴 Include balance training to prevent falls")
-        recommendations["medical"].append("🧠 Annual cognitive health screening")
-        recommendations["nutrition"].append("🥛 Ensure adequate calcium and vitamin D")
-    
-    # Gender-specific adjustments
-    if sex == 0:  # Female
-        recommendations["medical"].append("🩺 Discuss hormone replacement therapy risks/benefits")
-        recommendations["nutrition"].append("🌸 Include phytoestrogen-rich foods")
-    
-    # Condition-specific adjustments
-    if smoking:
-        recommendations["lifestyle"].insert(0, "🚭 URGENT: Smoking cessation is your #1 priority")
-        recommendations["medical"].append("🫁 Pulmonary function testing")
-    
-    if diabetes:
-        recommendations["nutrition"].append("🍯 Strict blood sugar management")
-        recommendations["medical"].append("📊 HbA1c monitoring every 3 months")
-    
-    if hypertension:
-        recommendations["nutrition"].append("🧂 Ultra-low sodium diet (<1500mg)")
-        recommendations["medical"].append("🩸 Home blood pressure monitoring")
-    
-    return recommendations
-
-def create_health_dashboard():
+def create_health_dashboard(session):
     st.markdown("### 📊 Your Health Dashboard")
     
     col1, col2, col3, col4 = st.columns(4)
@@ -680,23 +243,23 @@ def create_health_dashboard():
     with col1:
         st.metric(
             label="🫀 CHD Risk Score",
-            value=f"{st.session_state.risk_percentage:.1f}%",
-            delta=f"{st.session_state.risk_level} Risk"
+            value=f"{session['risk_percentage']:.1f}%",
+            delta=f"{session['risk_level']} Risk"
         )
     
     with col2:
         st.metric(
             label="📈 Risk Category",
-            value=st.session_state.risk_level,
+            value=session['risk_level'],
             delta="Based on ML Analysis"
         )
     
     with col3:
-        target_risk = max(0, st.session_state.risk_percentage - 10)
+        target_risk = max(0, session['risk_percentage'] - 10)
         st.metric(
             label="🎯 Target Risk",
             value=f"{target_risk:.1f}%",
-            delta=f"-{st.session_state.risk_percentage - target_risk:.1f}%"
+            delta=f"-{session['risk_percentage'] - target_risk:.1f}%"
         )
     
     with col4:
@@ -706,19 +269,46 @@ def create_health_dashboard():
             delta="Recommended"
         )
 
-def create_interactive_risk_assessment():
+def create_similar_patients(session):
+    similar = similar_patients(features_from_record(session['user_data']))
+    if similar is None:
+        return
+    st.markdown("### 👥 Patients Like You")
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        st.metric(
+            label=f"🩺 CHD Rate, {similar['k']} Most Similar Patients",
+            value=f"{similar['rate']:.1%}",
+            delta=f"{(similar['rate'] - similar['base_rate']) * 100:+.1f} pts vs all patients",
+            delta_color="inverse"
+        )
+    with col2:
+        st.metric(
+            label="📋 Developed CHD Within 10 Years",
+            value=f"{similar['cases']} of {similar['k']}"
+        )
+    with col3:
+        st.metric(
+            label="🌐 All Dataset Patients",
+            value=f"{similar['base_rate']:.1%}",
+            delta=f"{similar['patients']:,} patients",
+            delta_color="off"
+        )
+    st.caption(f"Observed outcomes of the closest patients in the reference dataset, matched on age, sex, smoking, blood pressure, cholesterol, glucose and medical history (found in {similar['seconds'] * 1000:.1f} ms). This is not a prediction.")
+
+def create_interactive_risk_assessment(session):
     st.markdown("### 🔍 Interactive Risk Assessment")
     
     # Create risk factor radar chart
     categories = ['Age', 'Blood Pressure', 'Cholesterol', 'Smoking', 'Diabetes', 'BMI']
     
     # Normalize user values to 0-100 scale
-    age_score = min(100, (st.session_state.user_data.get('age', 50) - 18) / 62 * 100)
-    bp_score = min(100, (st.session_state.user_data.get('sysBP', 120) - 90) / 110 * 100)
-    chol_score = min(100, (st.session_state.user_data.get('totChol', 200) - 100) / 300 * 100)
-    smoke_score = st.session_state.user_data.get('is_smoking', 0) * 100
-    diabetes_score = st.session_state.user_data.get('diabetes', 0) * 100
-    bmi_score = min(100, (st.session_state.user_data.get('BMI', 25) - 18.5) / 21.5 * 100)
+    age_score = min(100, (session['user_data'].get('age', 50) - 18) / 62 * 100)
+    bp_score = min(100, (session['user_data'].get('sysBP', 120) - 90) / 110 * 100)
+    chol_score = min(100, (session['user_data'].get('totChol', 200) - 100) / 300 * 100)
+    smoke_score = session['user_data'].get('is_smoking', 0) * 100
+    diabetes_score = session['user_data'].get('diabetes', 0) * 100
+    bmi_score = min(100, (session['user_data'].get('BMI', 25) - 18.5) / 21.5 * 100)
     
     values = [age_score, bp_score, chol_score, smoke_score, diabetes_score, bmi_score]
     
@@ -758,75 +348,6 @@ def create_interactive_risk_assessment():
     
     st.plotly_chart(fig, use_container_width=True)
 
-def generate_advanced_pdf_report(input_data, rf_prob, stack_prob, recommendations):
-    pdf = FPDF()
-    pdf.add_page()
-    
-    # Header
-    pdf.set_font("Arial", 'B', 20)
-    pdf.set_text_color(102, 126, 234)
-    pdf.cell(200, 15, "CardioGuard AI - Comprehensive CHD Risk Report", ln=True, align='C')
-    
-    # Date and time
-    pdf.set_font("Arial", '', 10)
-    pdf.set_text_color(128, 128, 128)
-    pdf.cell(200, 10, f"Generated on: {datetime.now().strftime('%B %d, %Y at %I:%M %p')}", ln=True, align='C')
-    
-    pdf.ln(10)
-    
-    # Executive Summary
-    pdf.set_font("Arial", 'B', 14)
-    pdf.set_text_color(0, 0, 0)
-    pdf.cell(200, 10, "Executive Summary", ln=True)
-    pdf.set_font("Arial", '', 12)
-    
-    risk_level = get_risk_level(stack_prob * 100)
-    pdf.multi_cell(200, 8, f"Based on advanced machine learning analysis, your 10-year CHD risk is {stack_prob:.1%} ({risk_level} Risk). This report provides personalized recommendations for optimal cardiovascular health.")
-    
-    pdf.ln(5)
-    
-    # Risk Analysis
-    pdf.set_font("Arial", 'B', 14)
-    pdf.cell(200, 10, "Risk Analysis", ln=True)
-    pdf.set_font("Arial", '', 12)
-    
-    pdf.cell(200, 8, f"Random Forest Model Prediction: {rf_prob:.2%}", ln=True)
-    pdf.cell(200, 8, f"Stacking Ensemble Model Prediction: {stack_prob:.2%}", ln=True)
-    pdf.cell(200, 8, f"Risk Classification: {risk_level}", ln=True)
-    
-    pdf.ln(5)
-    
-    # Patient Information
-    pdf.set_font("Arial", 'B', 14)
-    pdf.cell(200, 10, "Patient Information", ln=True)
-    pdf.set_font("Arial", '', 12)
-    
-    for key, value in input_data.items():
-        pdf.cell(200, 6, f"{key}: {value}", ln=True)
-    
-    pdf.ln(5)
-    
-    # Key Recommendations
-    pdf.set_font("Arial", 'B', 14)
-    pdf.cell(200, 10, "Key Recommendations", ln=True)
-    pdf.set_font("Arial", '', 12)
-    
-    # Add top 3 recommendations from each category
-    categories = ['nutrition', 'exercise', 'lifestyle', 'medical']
-    for category in categories:
-        if category in recommendations:
-            pdf.set_font("Arial", 'B', 12)
-            pdf.cell(200, 8, f"{category.title()}:", ln=True)
-            pdf.set_font("Arial", '', 10)
-            for i, rec in enumerate(recommendations[category][:3]):
-                safe_rec = rec.replace("•", "-").replace("🥗", "").replace("🍎", "").replace("🐟", "").replace("🥜", "").replace("🧂", "").replace("🚫", "").replace("🌾", "").replace("🥛", "").replace("☕", "").replace("🍳", "").replace("🥣", "").replace("🍞", "").replace("🥤", "").replace("🍲", "").replace("🍗", "").replace("🍝", "").replace("🥘", "").replace("🫐", "").replace("🍷", "").replace("💧", "").replace("🧘‍♂️", "").replace("🧠", "").replace("👥", "").replace("📚", "").replace("🎯", "").replace("😊", "").replace("🦴", "").replace("🩺", "").replace("🩸", "").replace("📊", "").replace("💉", "").replace("🦷", "").replace("🫁", "").replace("🍯", "").replace("🚭", "").replace("🩹", "").replace("🏥", "").replace("🚨", "").replace("📞", "").replace("😴", "").replace("📱", "").replace("🌡️", "").replace("😌", "").replace("🧘‍♀️", "").replace("🤸‍♂️", "").replace("🤲", "").replace("🏃‍♂️", "").replace("🏃‍♀️", "").replace("🚶‍♂️", "").replace("🚶‍♀️", "").replace("🚴‍♂️", "").replace("🏊‍♀️", "").replace("🏋️‍♂️", "").replace("💪", "").replace("🧘‍♂️", "").replace("🧘‍♀️", "").replace("🤸‍♀️", "").replace("🧘‍♂️", "").replace("🧘‍♀️", "").replace("🤸‍♂️", "").replace("🤲", "").replace("🧘‍♂️", "").replace("🧘‍♀️", "").replace("🤸‍♂️", "").replace("🤲", "").replace("🧘‍♂️", "").replace("🧘‍♀️", "").replace("🤸‍♂️", "").replace("🤲", "").replace("🧘‍♂️", "").replace("🧘‍♀️", "").replace("🤸‍♂️", "").replace("🤲", "").replace("🧘‍♂️", "").replace("🧘‍♀️", "").replace("🤸‍♂️", "").replace("🤲", "").replace("🧘‍♂️", "").replace("🧘‍♀️", "").replace("🤸‍♂️", "").replace("🤲", "").replace("🧘‍♂️", "").replace("🧘‍♀️", "").replace("🤸‍♂️", "").replace("🤲", "").replace("🧘‍♂️", "").replace("🧘‍♀️", "").replace("🤸‍♂️", "").replace("🤲", "").replace("🧘‍♂️", "").replace("🧘‍♀️", "").replace("🤸‍♂️", "").replace("🤲", "").replace("🧘‍♂️", "").replace("🧘‍♀️", "").replace("🤸‍♂️", "").replace("🤲", "").replace("🧘‍♂️", "").replace("🧘‍♀️", "").replace("🤸‍♂️", "").replace("🤲", "").replace("🧘‍♂️", "").replace("🧘‍♀️", "").replace("🤸‍♂️", "").replace("🤲", "").replace("🧘‍♂️", "").replace("🧘‍♀️", "").replace("🤸‍♂️", "").replace("🤲", "").replace("🧘‍♂️", "").replace("🧘‍♀️", "").replace("🤸‍♂️", "").replace("🤲", "").replace("🧘‍♂️", "").replace("🧘‍♀️", "").replace("🤸‍♂️", "").replace("🤲", "")
-                pdf.multi_cell(200, 6, f"- {safe_rec}")
-            pdf.ln(2)
-    
-    # Generate PDF bytes
-    pdf_bytes = pdf.output(dest='S').encode('latin-1')
-    return BytesIO(pdf_bytes)
-
 def create_meal_plan_generator(risk_level):
     st.markdown("### 🍽️ Personalized Meal Plan Generator")
     
@@ -1018,7 +539,65 @@ def create_exercise_plan_generator(risk_level):
         for exercise in plan["flexibility"]:
             st.markdown(f"• {exercise}")
 
-def create_progress_tracker():
+def create_risk_history_chart(session):
+    st.markdown("### 📈 Your Risk Over Time")
+
+    total = history_store.count(session['user_id'])
+    if total < 2:
+        st.info("Complete more assessments to see how your risk changes over time.")
+        return
+
+    view = st.radio("View", ["Detailed", "Weekly", "Monthly"], horizontal=True, key="trend_view")
+
+    # Charts carry a bounded number of points regardless of history length
+    fig = go.Figure()
+    if view == "Detailed":
+        history = downsample_history(history_store.history(session['user_id']))
+        fig.add_trace(go.Scatter(
+            x=history["timestamp"], y=history["stack_prob"] * 100,
+            mode="lines+markers", name="Stacking Ensemble",
+            line=dict(color="#54a0ff", width=3)
+        ))
+        fig.add_trace(go.Scatter(
+            x=history["timestamp"], y=history["rf_prob"] * 100,
+            mode="lines", name="Random Forest",
+            line=dict(color="#2ed573", width=2, dash="dot")
+        ))
+        shown = len(history)
+    else:
+        rollup = history_store.rollup(session['user_id'], "week" if view == "Weekly" else "month")
+        fig.add_trace(go.Scatter(
+            x=rollup["timestamp"], y=rollup["stack_max"] * 100,
+            mode="lines", line=dict(width=0), showlegend=False, hoverinfo="skip"
+        ))
+        fig.add_trace(go.Scatter(
+            x=rollup["timestamp"], y=rollup["stack_min"] * 100,
+            mode="lines", line=dict(width=0), fill="tonexty",
+            fillcolor="rgba(84, 160, 255, 0.2)", name="Stacking range"
+        ))
+        fig.add_trace(go.Scatter(
+            x=rollup["timestamp"], y=rollup["stack_mean"] * 100,
+            mode="lines+markers", name="Stacking Ensemble (mean)",
+            line=dict(color="#54a0ff", width=3)
+        ))
+        fig.add_trace(go.Scatter(
+            x=rollup["timestamp"], y=rollup["rf_mean"] * 100,
+            mode="lines", name="Random Forest (mean)",
+            line=dict(color="#2ed573", width=2, dash="dot")
+        ))
+        shown = len(rollup)
+    fig.add_hrect(y0=0, y1=30, fillcolor="rgba(46, 213, 115, 0.1)", line_width=0)
+    fig.add_hrect(y0=30, y1=60, fillcolor="rgba(255, 165, 2, 0.1)", line_width=0)
+    fig.add_hrect(y0=60, y1=100, fillcolor="rgba(255, 56, 56, 0.1)", line_width=0)
+    fig.update_layout(
+        yaxis=dict(title="CHD Risk (%)", range=[0, 100]),
+        font=dict(family="Poppins"),
+        height=400
+    )
+    st.plotly_chart(fig, use_container_width=True)
+    st.caption(f"{total} assessments recorded, {shown} points shown")
+
+def create_progress_tracker(session):
     st.markdown("### 📝 Personalized Health Action Checklist")
 
     st.markdown("""
@@ -1026,7 +605,7 @@ def create_progress_tracker():
     """)
 
     # Define checklist items based on risk level
-    risk_level = st.session_state.get("risk_level", "Low")
+    risk_level = session.get("risk_level", "Low")
     checklist = []
 
     if risk_level == "Low":
@@ -1065,18 +644,24 @@ def create_progress_tracker():
             "Engage in professional stress management or counseling"
         ]
 
-    # Use session state to persist checklist
-    if "progress_checklist" not in st.session_state or len(st.session_state.progress_checklist) != len(checklist):
-        st.session_state.progress_checklist = [False] * len(checklist)
+    # Persist checklist per user and risk level so it survives reloads and level changes
+    user_id = session['user_id']
+    stored = history_store.checklist(user_id, risk_level)
+    if stored is None or len(stored) != len(checklist):
+        stored = [False] * len(checklist)
+    session['progress_checklist'] = list(stored)
 
     # Display checklist with checkboxes
     for i, item in enumerate(checklist):
-        checked = st.checkbox(item, value=st.session_state.progress_checklist[i], key=f"check_{i}")
-        st.session_state.progress_checklist[i] = checked
+        checked = st.checkbox(item, value=stored[i], key=f"check_{user_id}_{risk_level}_{i}")
+        session['progress_checklist'][i] = checked
+
+    if session['progress_checklist'] != stored:
+        history_store.save_checklist(user_id, risk_level, session['progress_checklist'])
 
 
     # Show completion progress
-    completed = sum(st.session_state.progress_checklist)
+    completed = sum(session['progress_checklist'])
     total = len(checklist)
     st.progress(completed / total if total else 0)
     st.markdown(f"**{completed} of {total} actions completed**")
@@ -1089,7 +674,276 @@ def create_progress_tracker():
     else:
         st.warning("Let's get started! Begin by checking off your first action.")
 
-def main():
+# Cohorts are scored once per file content and model version; aggregates are cached per filter selection
+@st.cache_resource(max_entries=4, show_spinner="Scoring cohort...")
+def scored_cohort(digest, model_version, _data, _bundle):
+    metrics.inc("cache_scored_cohort_misses")
+    return score_cohort(pd.read_csv(io.BytesIO(_data)), _bundle)
+
+@st.cache_data(max_entries=64, show_spinner=False)
+def cohort_aggregates(digest, model_version, sex, age_range, smoking, _data, _bundle):
+    metrics.inc("cache_cohort_aggregates_misses")
+    # Not counted as a scored_cohort call: create_cohort_analytics has just made (and counted) the same one
+    cohort, _ = scored_cohort(digest, model_version, _data, _bundle)
+    return aggregate(select(cohort, sex, age_range, smoking))
+
+@st.cache_resource(max_entries=1)
+def bundled_cohort_file(modified):
+    with open(DATASET_PATH, "rb") as f:
+        data = f.read()
+    return content_hash(data), data
+
+def cohort_file(uploaded):
+    # (digest, bytes); an upload is hashed once, then recognised by its file_id on later reruns
+    if uploaded is None:
+        return bundled_cohort_file(os.path.getmtime(DATASET_PATH))
+    data = uploaded.getvalue()
+    cached = st.session_state.get("cohort_upload")
+    if cached is None or cached[0] != uploaded.file_id:
+        cached = st.session_state["cohort_upload"] = (uploaded.file_id, content_hash(data))
+    return cached[1], data
+
+def create_cohort_analytics():
+    st.markdown("### 👥 Cohort Analytics")
+    # Every tab renders on every rerun, so the charts are built only once the view is switched on
+    if not st.toggle("Show cohort analytics", key="cohort_enabled"):
+        st.caption("Risk distribution, risk bands and alert prevalence across a patient file.")
+        return
+    source = st.radio("Patient file", ["Bundled dataset", "Upload CSV"], horizontal=True, key="cohort_source")
+    uploaded = None
+    if source == "Upload CSV":
+        uploaded = st.file_uploader("Patient records (Data_cardiovascular_risk.csv layout)", type="csv", key="cohort_upload_file")
+        if uploaded is None:
+            st.info("Upload a CSV with the same columns as the bundled dataset.")
+            return
+    bundle = model_registry.current()
+    if bundle is None or bundle.stack is None:
+        st.info("⏳ The prediction models are still warming up.")
+        return
+    digest, data = cohort_file(uploaded)
+    if uploaded is not None:
+        missing = missing_columns(pd.read_csv(io.BytesIO(data), nrows=0))
+        if missing:
+            st.error(f"The file is missing required columns: {', '.join(missing)}")
+            return
+    
+    metrics.inc("cache_scored_cohort_calls")
+    _, rejected = scored_cohort(digest, bundle.version, data, bundle)
+    if len(rejected):
+        st.warning(f"⚠️ {len(rejected):,} rows could not be scored and are left out of the analysis.")
+        with st.expander("Rows left out"):
+            st.dataframe(rejected["reason"].value_counts().rename_axis("Reason").reset_index(name="Rows"), hide_index=True, use_container_width=True)
+            st.dataframe(rejected.head(1000).rename(columns={"row": "Row", "reason": "Reason"}), hide_index=True, use_container_width=True)
+    
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        sex = st.selectbox("Sex", ["All", "Male", "Female"], key="cohort_sex")
+    with col2:
+        age_range = st.slider("Age range", 18, 100, (18, 100), key="cohort_age")
+    with col3:
+        smoking = st.selectbox("Smoking", ["All", "Smokers", "Non-smokers"], key="cohort_smoking")
+    
+    metrics.inc("cache_cohort_aggregates_calls")
+    results = cohort_aggregates(digest, bundle.version, sex, age_range, smoking, data, bundle)
+    summary = results["summary"]
+    if not summary["patients"]:
+        st.warning("No patients match these filters.")
+        return
+    
+    col4, col5, col6, col7 = st.columns(4)
+    col4.metric("Patients", f"{summary['patients']:,}")
+    col5.metric("Mean Predicted Risk", f"{summary['mean_risk']:.1f}%")
+    col6.metric("High Risk Share", f"{summary['high_risk_share']:.1%}")
+    observed = summary["observed_chd_rate"]
+    col7.metric("Observed 10-Year CHD", "n/a" if observed is None or np.isnan(observed) else f"{observed:.1%}")
+    
+    risk_colors = {"Low": "#2ed573", "Moderate": "#ffa502", "High": "#ff3838"}
+    distribution = results["distribution"]
+    fig_distribution = px.bar(
+        distribution, x=(distribution["risk_from"] + distribution["risk_to"]) / 2, y="patients",
+        labels={"x": "Predicted 10-year CHD risk (%)", "patients": "Patients"},
+        title="Risk Distribution",
+    )
+    fig_distribution.update_traces(width=5, marker_color="#667eea")
+    st.plotly_chart(fig_distribution, use_container_width=True)
+    
+    fig_bands = px.bar(
+        results["bands"], x="age_band", y="share", color="risk_band", facet_col="sex_label",
+        color_discrete_map=risk_colors, labels={"age_band": "Age", "share": "Share of patients", "risk_band": "Risk", "sex_label": "Sex"},
+        title="Risk Bands by Age and Sex",
+    )
+    fig_bands.update_layout(yaxis_tickformat=".0%")
+    st.plotly_chart(fig_bands, use_container_width=True)
+    
+    col8, col9 = st.columns(2)
+    with col8:
+        fig_alerts = px.bar(
+            results["prevalence"], x="prevalence", y="alert", orientation="h",
+            labels={"prevalence": "Share of patients", "alert": ""}, title="Alert Prevalence",
+        )
+        fig_alerts.update_layout(xaxis_tickformat=".0%")
+        st.plotly_chart(fig_alerts, use_container_width=True)
+    with col9:
+        st.markdown("#### Alert Prevalence by Age")
+        st.dataframe(results["prevalence_by_age"].style.format("{:.1%}", na_rep="–"), use_container_width=True)
+
+# Operator pages are shown only to sessions that enter CARDIOGUARD_ADMIN_TOKEN in the sidebar
+ADMIN_TOKEN = os.environ.get("CARDIOGUARD_ADMIN_TOKEN", "")
+
+def admin_session():
+    # The token entered in the sidebar matches; readable before the sidebar widget is drawn
+    entered = st.session_state.get("admin_token") or ""
+    return bool(ADMIN_TOKEN) and bool(entered) and hmac.compare_digest(entered.encode(), ADMIN_TOKEN.encode())
+
+def admin_authorized():
+    if not ADMIN_TOKEN:
+        return False
+    st.sidebar.text_input("🔐 Admin token", type="password", key="admin_token")
+    return admin_session()
+
+def format_bytes(size):
+    for unit in ("B", "KB", "MB", "GB"):
+        if abs(size) < 1024 or unit == "GB":
+            return f"{size:.0f} {unit}" if unit == "B" else f"{size:.1f} {unit}"
+        size /= 1024
+
+def create_memory_panel():
+    st.markdown("#### 🧠 Memory")
+    usage = memory.stats(model_registry.current())
+    col1, col2, col3, col4 = st.columns(4)
+    col1.metric("Process RSS", format_bytes(usage["rss_bytes"]))
+    col2.metric("Models", format_bytes(sum(usage["models"].values())), delta=", ".join(f"{name} {format_bytes(size)}" for name, size in usage["models"].items()) or "not loaded", delta_color="off")
+    col3.metric("Session Records", format_bytes(usage["stores"].get("session_records", 0)))
+    measured_at = usage["caches_measured_at"]
+    col4.metric("st.session_state", format_bytes(usage["st_session_state_bytes"]) if measured_at else "–")
+    
+    # Sizing the Streamlit caches walks every cached object, the models included, so it runs only when asked
+    col8, col9 = st.columns([1, 3])
+    if col8.button("📏 Measure cache sizes", key="admin_measure_caches"):
+        memory.measure_streamlit_caches()
+        st.rerun()
+    col9.caption(f"Cache sizes measured {datetime.fromtimestamp(measured_at).strftime('%H:%M:%S')}." if measured_at else "Cache sizes not measured yet.")
+    
+    caches = [("st.cache_data", name, size) for name, size in usage["st_cache_data"].items()]
+    caches += [("st.cache_resource", name, size) for name, size in usage["st_cache_resource"].items()]
+    caches += [("store", name, size) for name, size in usage["stores"].items()]
+    if caches:
+        cache_table = pd.DataFrame(caches, columns=["Kind", "Cache", "Bytes"]).sort_values("Bytes", ascending=False)
+        cache_table["Size"] = cache_table["Bytes"].map(format_bytes)
+        st.dataframe(cache_table, hide_index=True, use_container_width=True)
+    
+    col5, col6, col7 = st.columns(3)
+    if col5.button("▶️ Start tracemalloc", disabled=usage["tracing"], key="admin_trace_start"):
+        memory.start_tracing()
+        st.rerun()
+    if col6.button("⏹️ Stop tracemalloc", disabled=not usage["tracing"], key="admin_trace_stop"):
+        memory.stop_tracing()
+        st.rerun()
+    if usage["tracing"]:
+        col7.metric("Traced", format_bytes(usage["traced_bytes"]), delta=f"peak {format_bytes(usage['traced_peak_bytes'])}", delta_color="off")
+        if st.button("📸 Snapshot top allocators", key="admin_trace_snapshot"):
+            top = pd.DataFrame(memory.top_allocations(), columns=["Location", "Bytes", "Blocks"])
+            top["Size"] = top["Bytes"].map(format_bytes)
+            st.dataframe(top, hide_index=True, use_container_width=True)
+    else:
+        st.caption("tracemalloc slows every allocation while it runs; start it only for a snapshot.")
+
+def format_ms(seconds):
+    return f"{seconds * 1000:.0f} ms"
+
+# Reads only in-process counters, and refreshes itself so the numbers stay live without page reruns
+@st.fragment(run_every=5.0)
+def create_performance_panel():
+    st.markdown("#### ⚡ Performance")
+    snapshot = metrics.snapshot()
+    latency = snapshot["latency"]
+    model_stats = snapshot.get("models", {})
+    rerun = latency.get("rerun_seconds")
+    prediction = latency.get("prediction_seconds")
+    
+    col1, col2, col3, col4 = st.columns(4)
+    col1.metric("Active Sessions", snapshot.get("sessions", {}).get("live_sessions", 0))
+    load_seconds = model_stats.get("load_seconds")
+    col2.metric("Model Version", model_stats.get("version") or "loading", delta=f"loaded in {load_seconds:.2f}s" if load_seconds else None, delta_color="off")
+    col3.metric("Rerun p50 / p99", f"{format_ms(rerun['p50'])} / {format_ms(rerun['p99'])}" if rerun else "–")
+    col4.metric("Prediction p50 / p99", f"{format_ms(prediction['p50'])} / {format_ms(prediction['p99'])}" if prediction else "–")
+    
+    col5, col6 = st.columns(2)
+    with col5:
+        st.markdown("**Latency (last 1,024 per series)**")
+        if latency:
+            st.dataframe(pd.DataFrame([
+                {"Series": name, "Count": values["count"], **{key.upper(): format_ms(values[key]) for key in ("p50", "p90", "p99", "max")}}
+                for name, values in latency.items()
+            ]), hide_index=True, use_container_width=True)
+        else:
+            st.caption("No reruns recorded yet.")
+        
+        st.markdown("**Cache Hit Ratios**")
+        caches = [{"Cache": name, "Calls": int(values["calls"]), "Hit Ratio": f"{values['hit_ratio']:.1%}"} for name, values in metrics.cache_ratios().items()]
+        jobs = snapshot.get("report_jobs", {})
+        if jobs.get("hits", 0) + jobs.get("misses", 0):
+            calls = jobs["hits"] + jobs["misses"]
+            caches.append({"Cache": "report_jobs", "Calls": calls, "Hit Ratio": f"{jobs['hits'] / calls:.1%}"})
+        if caches:
+            st.dataframe(pd.DataFrame(caches), hide_index=True, use_container_width=True)
+        else:
+            st.caption("No cache lookups recorded yet.")
+    
+    with col6:
+        st.markdown("**Models**")
+        part_seconds = model_stats.get("part_seconds", {})
+        st.dataframe(pd.DataFrame([
+            {"Item": "Active version", "Value": str(model_stats.get("version"))},
+            {"Item": "Ready", "Value": str(model_stats.get("ready"))},
+            *({"Item": f"{name} load", "Value": f"{seconds:.2f}s"} for name, seconds in part_seconds.items()),
+            {"Item": "Swaps / rejected versions", "Value": f"{model_stats.get('swaps', 0)} / {model_stats.get('rejected_versions', 0)}"},
+            *({"Item": f"Startup: {event}", "Value": f"{seconds:.2f}s"} for event, seconds in snapshot.get("startup", {}).items()),
+        ]), hide_index=True, use_container_width=True)
+        
+        st.markdown("**Background Queues**")
+        queues = [{"Worker": name, "Queue Depth": data["queue_depth"]} for name, data in snapshot.items() if isinstance(data, dict) and "queue_depth" in data]
+        if jobs:
+            queues.append({"Worker": "report_jobs", "Queue Depth": jobs.get("pending", 0)})
+        st.dataframe(pd.DataFrame(queues, columns=["Worker", "Queue Depth"]), hide_index=True, use_container_width=True)
+    
+    st.markdown(f"**Slow Reruns (≥ {format_ms(profiling.SLOW_RERUN_SECONDS)})**")
+    slow = profiling.slow_reruns()
+    if not slow:
+        st.caption("No slow reruns recorded.")
+    for trace in reversed(slow):
+        with st.expander(f"{datetime.fromtimestamp(trace['at']).strftime('%H:%M:%S')} · {format_ms(trace['seconds'])} · session {trace['label']}"):
+            st.dataframe(pd.DataFrame(
+                [{"Span": name, "Started": format_ms(offset), "Duration": format_ms(seconds)} for name, offset, seconds in trace["spans"]],
+                columns=["Span", "Started", "Duration"],
+            ), hide_index=True, use_container_width=True)
+
+def create_admin_panel():
+    st.markdown("### 🛠️ Operator Dashboard")
+    create_performance_panel()
+    st.markdown("---")
+    create_memory_panel()
+
+def loaded_models(bundle):
+    return tuple(name for name in ("rf", "stack") if bundle is not None and getattr(bundle, name) is not None)
+
+# Polls the background model load and reruns the page as soon as another model is ready
+@st.fragment(run_every=1.0)
+def model_warmup_status(seen):
+    bundle = model_registry.current()
+    if model_registry.load_error:
+        st.error(f"⚠️ The prediction models could not be loaded: {model_registry.load_error}")
+        return
+    if loaded_models(bundle) != seen:
+        st.rerun()
+    if bundle is None:
+        st.button("⏳ Models warming up...", disabled=True, key="analyze_warming_up", help="The prediction models are still loading")
+    else:
+        names = {"rf": "Random Forest", "stack": "Stacking Ensemble"}
+        pending = [names[name] for name in names if name not in seen]
+        st.caption(f"⏳ {', '.join(names[name] for name in seen)} model ready; {', '.join(pending)} model still warming up.")
+
+def render_app(session):
     # Header with animation
     st.markdown('<div class="main-title">🩺 CardioGuard AI</div>', unsafe_allow_html=True)
     st.markdown('<div class="subtitle">Advanced Cardiovascular Risk Assessment & Personalized Healthcare Platform</div>', unsafe_allow_html=True)
@@ -1105,43 +959,27 @@ def main():
         "💊 Personalized Care",
         "📈 Progress Tracking",
         "📚 Health Education",
+        "👥 Cohort Analytics",
     ]
-    tab1, tab2, tab3, tab4, tab5 = st.tabs(tab_labels)
+    is_admin = admin_authorized()
+    if is_admin:
+        tab_labels.append("🛠️ Admin")
+    tabs = st.tabs(tab_labels)
+    tab1, tab2, tab3, tab4, tab5, tab6 = tabs[:6]
     
-    with tab1:
+    with tab1, profiling.span("Risk Assessment"):
         st.markdown("### 🧬 Comprehensive Health Assessment")
         
         # Reference table in expandable section
         with st.expander("📘 Reference Values for Healthy Individuals"):
-            st.markdown("""
-            <div style="background: linear-gradient(135deg, #667eea, #764ba2); color: white; padding: 2rem; border-radius: 15px; margin: 1rem 0;">
-                <h3 style="color: white; margin-bottom: 1rem;">🧾 Age-Based Health Reference Table</h3>
-                <div style="overflow-x: auto;">
-                    <table style="width: 100%; border-collapse: collapse;">
-                        <thead>
-                            <tr style="background: rgba(255,255,255,0.2);">
-                                <th style="padding: 12px; border: 1px solid rgba(255,255,255,0.3);">Age Group</th>
-                                <th style="padding: 12px; border: 1px solid rgba(255,255,255,0.3);">Systolic BP</th>
-                                <th style="padding: 12px; border: 1px solid rgba(255,255,255,0.3);">Diastolic BP</th>
-                                <th style="padding: 12px; border: 1px solid rgba(255,255,255,0.3);">Total Cholesterol</th>
-                                <th style="padding: 12px; border: 1px solid rgba(255,255,255,0.3);">BMI</th>
-                                <th style="padding: 12px; border: 1px solid rgba(255,255,255,0.3);">Glucose</th>
-                            </tr>
-                        </thead>
-                        <tbody>
-                            <tr><td style="padding: 10px; border: 1px solid rgba(255,255,255,0.2);">18–29</td><td style="padding: 10px; border: 1px solid rgba(255,255,255,0.2);">100–120</td><td style="padding: 10px; border: 1px solid rgba(255,255,255,0.2);">60–80</td><td style="padding: 10px; border: 1px solid rgba(255,255,255,0.2);">125–200</td><td style="padding: 10px; border: 1px solid rgba(255,255,255,0.2);">18.5–24.9</td><td style="padding: 10px; border: 1px solid rgba(255,255,255,0.2);">70–99</td></tr>
-                            <tr><td style="padding: 10px; border: 1px solid rgba(255,255,255,0.2);">30–39</td><td style="padding: 10px; border: 1px solid rgba(255,255,255,0.2);">105–125</td><td style="padding: 10px; border: 1px solid rgba(255,255,255,0.2);">65–85</td><td style="padding: 10px; border: 1px solid rgba(255,255,255,0.2);">130–210</td><td style="padding: 10px; border: 1px solid rgba(255,255,255,0.2);">18.5–24.9</td><td style="padding: 10px; border: 1px solid rgba(255,255,255,0.2);">70–99</td></tr>
-                            <tr><td style="padding: 10px; border: 1px solid rgba(255,255,255,0.2);">40–49</td><td style="padding: 10px; border: 1px solid rgba(255,255,255,0.2);">110–130</td><td style="padding: 10px; border: 1px solid rgba(255,255,255,0.2);">70–85</td><td style="padding: 10px; border: 1px solid rgba(255,255,255,0.2);">140–220</td><td style="padding: 10px; border: 1px solid rgba(255,255,255,0.2);">18.5–25.0</td><td style="padding: 10px; border: 1px solid rgba(255,255,255,0.2);">70–99</td></tr>
-                            <tr><td style="padding: 10px; border: 1px solid rgba(255,255,255,0.2);">50–59</td><td style="padding: 10px; border: 1px solid rgba(255,255,255,0.2);">115–135</td><td style="padding: 10px; border: 1px solid rgba(255,255,255,0.2);">70–90</td><td style="padding: 10px; border: 1px solid rgba(255,255,255,0.2);">150–230</td><td style="padding: 10px; border: 1px solid rgba(255,255,255,0.2);">18.5–25.0</td><td style="padding: 10px; border: 1px solid rgba(255,255,255,0.2);">70–99</td></tr>
-                            <tr><td style="padding: 10px; border: 1px solid rgba(255,255,255,0.2);">60+</td><td style="padding: 10px; border: 1px solid rgba(255,255,255,0.2);">120–140</td><td style="padding: 10px; border: 1px solid rgba(255,255,255,0.2);">70–90</td><td style="padding: 10px; border: 1px solid rgba(255,255,255,0.2);">160–240</td><td style="padding: 10px; border: 1px solid rgba(255,255,255,0.2);">19–26</td><td style="padding: 10px; border: 1px solid rgba(255,255,255,0.2);">70–105</td></tr>
-                        </tbody>
-                    </table>
-                </div>
-            </div>
-            """, unsafe_allow_html=True)
+            components.iframe("app/static/reference_table.html", height=470, scrolling=True)
         
         # User input form
         st.markdown("#### 👤 Personal Information")
+        session['user_id'] = history_owner()
+        if auth_configured() and not st.user.get("is_logged_in"):
+            st.button("🔑 Sign in to keep your history across visits", on_click=st.login)
+        
         col1, col2, col3 = st.columns(3)
         
         with col1:
@@ -1190,7 +1028,7 @@ def main():
             else:
                 st.markdown('<div class="success-message">✅ Normal Weight</div>', unsafe_allow_html=True)
         
-        # Feature engineering (same as original)
+        # Encode categorical inputs
         sex_encoded = 1 if sex == "Male" else 0
         is_smoking_encoded = 1 if is_smoking == "Yes" else 0
         BPMeds_encoded = 1 if BPMeds == "Yes" else 0
@@ -1198,36 +1036,8 @@ def main():
         prevalentHyp_encoded = 1 if prevalentHyp == "Yes" else 0
         diabetes_encoded = 1 if diabetes == "Yes" else 0
         
-        def smoking_level_fn(cigs):
-            if cigs == 0: return 0
-            elif cigs <= 10: return 1
-            elif cigs <= 20: return 2
-            else: return 3
-        
-        def bmi_category_fn(bmi):
-            if bmi < 18.5: return 0
-            elif bmi < 25: return 1
-            elif bmi < 30: return 2
-            else: return 3
-        
-        bp_ratio = round(sysBP / diaBP, 2)
-        chol_age_ratio = round(totChol / age, 2)
-        smoking_level = smoking_level_fn(cigsPerDay)
-        bmi_category = bmi_category_fn(BMI)
-        
-        # Prepare input data
-        input_df = pd.DataFrame([[
-            age, sex_encoded, is_smoking_encoded, BPMeds_encoded, prevalentStroke_encoded, 
-            prevalentHyp_encoded, diabetes_encoded, totChol, sysBP, diaBP, glucose, 
-            smoking_level, bp_ratio, chol_age_ratio, bmi_category
-        ]], columns=[
-            'age', 'sex', 'is_smoking', 'BPMeds', 'prevalentStroke', 'prevalentHyp',
-            'diabetes', 'totChol', 'sysBP', 'diaBP', 'glucose', 'smoking_level',
-            'bp_ratio', 'chol_age_ratio', 'bmi_category'
-        ])
-        
         # Store user data in session state
-        st.session_state.user_data = {
+        session['user_data'] = {
             'age': age, 'sex': sex_encoded, 'is_smoking': is_smoking_encoded,
             'BPMeds': BPMeds_encoded, 'prevalentStroke': prevalentStroke_encoded,
             'prevalentHyp': prevalentHyp_encoded, 'diabetes': diabetes_encoded,
@@ -1235,22 +1045,53 @@ def main():
             'BMI': BMI, 'cigsPerDay': cigsPerDay
         }
         
-        # Prediction button
-        if st.button("🩺 Analyze CHD Risk", help="Click to get your comprehensive risk assessment"):
+        # Feature engineering (shared with batch scoring)
+        input_df = features_from_record(session['user_data'])
+        
+        # Prediction button; one consistent model version per request, even if a swap happens mid-request
+        bundle = model_registry.current()
+        if bundle is None or not bundle.ready:
+            model_warmup_status(loaded_models(bundle))
+        if bundle is not None and st.button("🩺 Analyze CHD Risk", help="Click to get your comprehensive risk assessment"):
             with st.spinner("🔄 Analyzing your data with advanced AI models..."):
                 time.sleep(2)  # Simulate processing time
                 
-                # Make predictions
-                rf_pred = rf_model.predict(input_df)[0]
-                rf_proba = rf_model.predict_proba(input_df)[0][1]
+                # Whichever model has finished loading is used; the full assessment needs both
+                # One pass per model gives the class, the probability and its spread across trees
+                rf_pred = rf_proba = stack_pred = stack_proba = rf_out = stack_out = None
+                predict_started = time.perf_counter()
+                with profiling.span("predict"):
+                    if bundle.rf is not None:
+                        rf_out = predict_with_dispersion(bundle.rf, input_df)
+                        rf_pred = bundle.rf.classes_[rf_out["pred"][0]]
+                        rf_proba = rf_out["prob"][0]
+                    
+                    if bundle.stack is not None:
+                        stack_out = predict_with_dispersion(bundle.stack, input_df)
+                        stack_pred = bundle.stack.classes_[stack_out["pred"][0]]
+                        stack_proba = stack_out["prob"][0]
+                metrics.observe("prediction_seconds", time.perf_counter() - predict_started)
+                risk_proba = stack_proba if stack_proba is not None else rf_proba
+                models.mark_startup("first_prediction")
                 
-                stack_pred = stack_model.predict(input_df)[0]
-                stack_proba = stack_model.predict_proba(input_df)[0][1]
-                
-                # Update session state
-                st.session_state.prediction_made = True
-                st.session_state.risk_percentage = stack_proba * 100
-                st.session_state.risk_level = get_risk_level(stack_proba * 100)
+                if bundle.ready:
+                    if shadow_scorer is not None:
+                        shadow_scorer.submit(input_df.to_numpy(), stack_proba, bundle.version)
+                    if drift_monitor is not None:
+                        drift_monitor.observe(input_df.to_numpy())
+                    
+                    # Update session state
+                    session['prediction_made'] = True
+                    session['risk_percentage'] = stack_proba * 100
+                    session['risk_level'] = get_risk_level(stack_proba * 100)
+                    history_store.record_assessment(
+                        session['user_id'],
+                        session['user_data'],
+                        rf_proba,
+                        stack_proba,
+                        session['risk_level'],
+                        checklist=history_store.checklist(session['user_id'], session['risk_level'])
+                    )
                 
                 # Display results
                 st.markdown("---")
@@ -1259,79 +1100,94 @@ def main():
                 # Metrics display
                 col4, col5 = st.columns(2)
                 with col4:
-                    st.metric(
-                        "🤖 Random Forest Model", 
-                        "CHD Risk" if rf_pred else "No Risk", 
-                        delta=f"{rf_proba:.2%} probability"
-                    )
+                    if rf_proba is None:
+                        st.metric("🤖 Random Forest Model", "Warming up")
+                    else:
+                        st.metric(
+                            "🤖 Random Forest Model", 
+                            "CHD Risk" if rf_pred else "No Risk", 
+                            delta=f"{rf_proba:.2%} probability"
+                        )
                 with col5:
-                    st.metric(
-                        "🧠 Stacking Ensemble Model", 
-                        "CHD Risk" if stack_pred else "No Risk", 
-                        delta=f"{stack_proba:.2%} probability"
-                    )
+                    if stack_proba is None:
+                        st.metric("🧠 Stacking Ensemble Model", "Warming up")
+                    else:
+                        st.metric(
+                            "🧠 Stacking Ensemble Model", 
+                            "CHD Risk" if stack_pred else "No Risk", 
+                            delta=f"{stack_proba:.2%} probability"
+                        )
                 
                 # Risk gauges
                 col6, col7 = st.columns(2)
                 with col6:
-                    fig_rf = create_risk_gauge(rf_proba * 100, "Random Forest Risk Score")
-                    fig_rf.update_layout(font={'color': "white", 'family': 'Poppins'})
-                    fig_rf['layout']['paper_bgcolor'] = "rgba(0,0,0,0)"
-                    fig_rf['layout']['plot_bgcolor'] = "rgba(0,0,0,0)"
-                    fig_rf['layout']['title']['font']['color'] = "white"
-                    st.plotly_chart(fig_rf, use_container_width=True)
+                    if rf_proba is not None:
+                        fig_rf = create_risk_gauge(rf_proba * 100, "Random Forest Risk Score", tree_spread(rf_out))
+                        fig_rf.update_layout(font={'color': "white", 'family': 'Poppins'})
+                        fig_rf['layout']['paper_bgcolor'] = "rgba(0,0,0,0)"
+                        fig_rf['layout']['plot_bgcolor'] = "rgba(0,0,0,0)"
+                        fig_rf['layout']['title']['font']['color'] = "white"
+                        st.plotly_chart(fig_rf, use_container_width=True)
                 
                 with col7:
-                    fig_stack = create_risk_gauge(stack_proba * 100, "Stacking Model Risk Score")
-                    fig_stack.update_layout(font={'color': "white", 'family': 'Poppins'})
-                    fig_stack['layout']['paper_bgcolor'] = "rgba(0,0,0,0)"
-                    fig_stack['layout']['plot_bgcolor'] = "rgba(0,0,0,0)"
-                    fig_stack['layout']['title']['font']['color'] = "white"
-                    st.plotly_chart(fig_stack, use_container_width=True)
+                    if stack_proba is not None:
+                        fig_stack = create_risk_gauge(stack_proba * 100, "Stacking Model Risk Score", tree_spread(stack_out))
+                        fig_stack.update_layout(font={'color': "white", 'family': 'Poppins'})
+                        fig_stack['layout']['paper_bgcolor'] = "rgba(0,0,0,0)"
+                        fig_stack['layout']['plot_bgcolor'] = "rgba(0,0,0,0)"
+                        fig_stack['layout']['title']['font']['color'] = "white"
+                        st.plotly_chart(fig_stack, use_container_width=True)
                 # Risk assessment message
-                if stack_proba > 0.6:
+                if risk_proba > 0.6:
                     st.markdown('<div class="error-message">🔴 HIGH RISK: Immediate medical consultation recommended</div>', unsafe_allow_html=True)
-                elif stack_proba >= 0.3:
+                elif risk_proba >= 0.3:
                     st.markdown('<div class="warning-message">🟡 MODERATE RISK: Lifestyle changes and monitoring advised</div>', unsafe_allow_html=True)
                 else:
                     st.markdown('<div class="success-message">🟢 LOW RISK: Continue healthy lifestyle habits</div>', unsafe_allow_html=True)
+                low_confidence = stack_out is not None and bool(needs_review(stack_out["std"][0], review_std(bundle)))
+                if low_confidence:
+                    st.warning(f"⚠️ Low confidence: the ensemble's trees disagree on this profile (±{stack_out['std'][0]:.1%}). Please have the result reviewed by a clinician.")
                 
-                # Generate personalized recommendations
-                recommendations = generate_personalized_recommendations(stack_proba * 100, st.session_state.user_data)
-                
-                # Generate and offer PDF download
-                pdf_buffer = generate_advanced_pdf_report(
-                    st.session_state.user_data, 
-                    rf_proba, 
-                    stack_proba, 
-                    recommendations
-                )
-                
-                st.download_button(
-                    label="📄 Download Comprehensive Report",
-                    data=pdf_buffer,
-                    file_name=f"CardioGuard_Report_{datetime.now().strftime('%Y%m%d_%H%M%S')}.pdf",
-                    mime="application/pdf",
-                    help="Download your complete health assessment report"
-                )
+                if not bundle.ready:
+                    st.info("⏳ Preliminary result from the model that has finished loading. Analyze again in a moment for the full assessment, dashboard and PDF report.")
+                else:
+                    # Generate personalized recommendations
+                    recommendations = generate_personalized_recommendations(stack_proba * 100, session['user_data'])
+                    
+                    # Render the PDF off the request path; the download waits only if it is not ready yet
+                    report_key = prediction_key(session['user_data'], rf_proba, stack_proba, bundle.version)
+                    uncertainty = {"stack_std": stack_out["std"][0], "stack_low": stack_out["low"][0], "stack_high": stack_out["high"][0], "needs_review": low_confidence}
+                    report_args = (dict(session['user_data']), rf_proba, stack_proba, recommendations, uncertainty, similar_patients(input_df))
+                    report_jobs.submit(report_key, generate_advanced_pdf_report, *report_args)
+                    
+                    st.download_button(
+                        label="📄 Download Comprehensive Report",
+                        data=lambda: report_jobs.result(report_key, generate_advanced_pdf_report, *report_args),
+                        file_name=f"CardioGuard_Report_{datetime.now().strftime('%Y%m%d_%H%M%S')}.pdf",
+                        mime="application/pdf",
+                        help="Download your complete health assessment report",
+                        on_click="ignore"
+                    )
     
-    with tab2:
-        if st.session_state.prediction_made:
-            create_health_dashboard()
+    with tab2, profiling.span("Health Dashboard"):
+        if session['prediction_made']:
+            create_health_dashboard(session)
+            st.markdown("---")
+            create_similar_patients(session)
             st.markdown("---")
-            create_interactive_risk_assessment()
+            create_interactive_risk_assessment(session)
         else:
             st.markdown("### 📊 Complete Risk Assessment First")
             st.info("Please complete the risk assessment in the first tab to view your personalized dashboard.")
     
-    with tab3:
-        if st.session_state.prediction_made:
+    with tab3, profiling.span("Personalized Care"):
+        if session['prediction_made']:
             st.markdown("### 💊 Your Personalized Healthcare Plan")
             
             # Get recommendations
             recommendations = generate_personalized_recommendations(
-                st.session_state.risk_percentage, 
-                st.session_state.user_data
+                session['risk_percentage'], 
+                session['user_data']
             )
             
             # Display recommendations in organized sections
@@ -1343,7 +1199,7 @@ def main():
                     st.markdown(f"• {rec}")
                 
                 st.markdown("---")
-                create_meal_plan_generator(st.session_state.risk_level)
+                create_meal_plan_generator(session['risk_level'])
             
             with rec_tabs[1]:
                 st.markdown("#### 🏋️‍♀️ Exercise Recommendations")
@@ -1351,7 +1207,7 @@ def main():
                     st.markdown(f"• {rec}")
                 
                 st.markdown("---")
-                create_exercise_plan_generator(st.session_state.risk_level)
+                create_exercise_plan_generator(session['risk_level'])
             
             with rec_tabs[2]:
                 st.markdown("#### 🧘‍♀️ Lifestyle Recommendations")
@@ -1375,14 +1231,16 @@ def main():
             st.markdown("### 💊 Complete Risk Assessment First")
             st.info("Please complete the risk assessment in the first tab to view your personalized care plan.")
     
-    with tab4:
-        if st.session_state.prediction_made:
-            create_progress_tracker()
+    with tab4, profiling.span("Progress Tracking"):
+        if session['prediction_made']:
+            create_risk_history_chart(session)
+            st.markdown("---")
+            create_progress_tracker(session)
         else:
             st.markdown("### 📈 Complete Risk Assessment First")
             st.info("Please complete the risk assessment in the first tab to view your progress dashboard.")
     
-    with tab5:
+    with tab5, profiling.span("Health Education"):
         st.markdown("### 📚 Health Education & Resources")
         st.markdown("""
         - [American Heart Association - Prevention](https://www.heart.org/en/healthy-living)
@@ -1394,6 +1252,32 @@ def main():
         st.markdown("---")
         st.markdown("#### ℹ️ Disclaimer")
         st.info("This tool is for educational purposes only and does not replace professional medical advice. Always consult your healthcare provider for personalized recommendations.")
+    
+    with tab6, profiling.span("Cohort Analytics"):
+        create_cohort_analytics()
+    
+    if is_admin:
+        with tabs[6], profiling.span("Admin"):
+            create_admin_panel()
+
+def main():
+    session = load_session()
+    # ?profile= writes dumps to disk on every rerun, so only admin sessions may ask for it
+    profile_mode = profiling.requested_mode(st.query_params.get("profile") if admin_session() else None)
+    try:
+        with profiling.trace_rerun(st.session_state.session_id[:8]):
+            if profile_mode is None:
+                render_app(session)
+            else:
+                with profiling.profile_rerun(profile_mode, st.session_state.session_id[:8]):
+                    render_app(session)
+        models.mark_startup("first_paint")
+    finally:
+        try:
+            session_store.save(st.session_state.session_id, session)
+        except SessionTooLarge as exc:
+            # Keep the last record that fit rather than failing the rerun
+            log.warning("session %s not saved: %s", st.session_state.session_id[:8], exc)
 
 if __name__ == "__main__":
     main()
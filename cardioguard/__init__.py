@@ -0,0 +1 @@
+# Supporting modules for the CardioGuard AI Streamlit app (app.py)
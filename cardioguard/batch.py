@@ -0,0 +1,199 @@
+# Multi-process batch scoring over shared-memory feature matrices
+#
+#   python -m cardioguard.batch score patients.csv scores.csv --processes 8
+#   python -m cardioguard.batch bench --rows 200000 --processes 1 2 4 8
+#
+# The feature matrix and the result array live in multiprocessing.shared_memory;
+# workers receive only (start, stop) row ranges and write probabilities in place,
+# along with their tree-vote dispersion (cardioguard.uncertainty); rows whose
+# stacked score is unstable across trees get needs_review=True.
+# Each worker holds the model bundle once: inherited copy-on-write under fork,
+# loaded from the registry in the initializer otherwise. score also writes the input
+# drift of the file against the training data to <output>.drift.json.
+import argparse
+import logging
+import multiprocessing as mp
+import os
+import sys
+import time
+from multiprocessing import shared_memory
+
+import numpy as np
+import pandas as pd
+
+from cardioguard.drift import open_monitor, write_report
+from cardioguard.features import DATASET_PATH, FEATURE_COLUMNS, engineer_features, load_dataset, scorable_features
+from cardioguard.registry import LEGACY_VERSION, ModelRegistry
+from cardioguard.uncertainty import SCORE_COLUMNS, needs_review, review_std, score_columns
+
+log = logging.getLogger(__name__)
+
+OUTPUT_COLUMNS = SCORE_COLUMNS
+DEFAULT_CHUNK_ROWS = 4096
+
+# Set in the parent before a fork pool starts, and in each worker by _init_worker
+_bundle = None
+_worker = {}
+
+
+def _single_threaded(model):
+    # One process per core; nested joblib threads inside forests would oversubscribe
+    stack = [model]
+    while stack:
+        estimator = stack.pop()
+        if hasattr(estimator, "n_jobs"):
+            estimator.n_jobs = 1
+        stack.extend(getattr(estimator, "estimators_", None) or [])
+        stack.extend(getattr(estimator, "named_estimators_", {}).values())
+        final = getattr(estimator, "final_estimator_", None)
+        if final is not None:
+            stack.append(final)
+    return model
+
+
+def _attach(name, shape):
+    block = shared_memory.SharedMemory(name=name)
+    return block, np.ndarray(shape, dtype=np.float64, buffer=block.buf)
+
+
+def _init_worker(features_name, results_name, rows, version):
+    bundle = _bundle if _bundle is not None else ModelRegistry().load_version(version)
+    _single_threaded(bundle.rf)
+    _single_threaded(bundle.stack)
+    features_block, features = _attach(features_name, (rows, len(FEATURE_COLUMNS)))
+    results_block, results = _attach(results_name, (rows, len(OUTPUT_COLUMNS)))
+    _worker.update(
+        bundle=bundle, features=features, results=results,
+        blocks=(features_block, results_block),
+    )
+
+
+def _score_range(bounds):
+    start, stop = bounds
+    bundle = _worker["bundle"]
+    inputs = pd.DataFrame(_worker["features"][start:stop], columns=FEATURE_COLUMNS)
+    scores = score_columns(bundle, inputs)
+    _worker["results"][start:stop] = np.column_stack([scores[column] for column in OUTPUT_COLUMNS])
+    return stop - start
+
+
+def _chunks(rows, processes, chunk_rows):
+    # Small enough to balance the pool, large enough to amortise per-call overhead
+    size = max(1, min(chunk_rows, -(-rows // (processes * 4))))
+    return [(start, min(start + size, rows)) for start in range(0, rows, size)]
+
+
+def score_matrix(features, processes=None, chunk_rows=DEFAULT_CHUNK_ROWS, bundle=None, version=None):
+    # features: DataFrame with FEATURE_COLUMNS; returns OUTPUT_COLUMNS plus needs_review on the same index
+    global _bundle
+    processes = processes or os.cpu_count() or 1
+    matrix = np.ascontiguousarray(features[FEATURE_COLUMNS].to_numpy(dtype=np.float64))
+    rows = len(matrix)
+    if bundle is None:
+        registry = ModelRegistry()
+        bundle = registry.load_version(version or registry.active_version() or LEGACY_VERSION)
+    if not rows:
+        return pd.DataFrame(columns=OUTPUT_COLUMNS, index=features.index, dtype=float).assign(needs_review=False)
+
+    features_block = shared_memory.SharedMemory(create=True, size=matrix.nbytes)
+    results_block = shared_memory.SharedMemory(create=True, size=rows * len(OUTPUT_COLUMNS) * 8)
+    try:
+        np.ndarray(matrix.shape, dtype=np.float64, buffer=features_block.buf)[:] = matrix
+        results = np.ndarray((rows, len(OUTPUT_COLUMNS)), dtype=np.float64, buffer=results_block.buf)
+        results.fill(np.nan)
+        method = "fork" if "fork" in mp.get_all_start_methods() else None
+        context = mp.get_context(method)
+        _bundle = bundle if method == "fork" else None
+        try:
+            with context.Pool(
+                processes,
+                initializer=_init_worker,
+                initargs=(features_block.name, results_block.name, rows, bundle.version),
+            ) as pool:
+                scored = sum(pool.imap_unordered(_score_range, _chunks(rows, processes, chunk_rows)))
+        finally:
+            _bundle = None
+        if scored != rows:
+            raise RuntimeError(f"scored {scored} of {rows} rows")
+        output = pd.DataFrame(results.copy(), columns=OUTPUT_COLUMNS, index=features.index)
+        output["needs_review"] = needs_review(output["stack_std"], review_std(bundle))
+    finally:
+        features_block.close()
+        features_block.unlink()
+        results_block.close()
+        results_block.unlink()
+    return output
+
+
+def score_frame(frame, monitor=None, **kwargs):
+    # Dataset-style records (as in Data_cardiovascular_risk.csv) -> records plus probabilities;
+    # rows that cannot be scored get empty probabilities and the reason in "error"
+    features, errors = scorable_features(frame)
+    if monitor is not None and len(features):
+        monitor.observe(features[FEATURE_COLUMNS].to_numpy())
+    scored = frame.join(score_matrix(features, **kwargs))
+    scored["needs_review"] = scored["needs_review"].eq(True)
+    scored["error"] = errors
+    return scored
+
+
+def benchmark(rows, process_counts, chunk_rows=DEFAULT_CHUNK_ROWS, dataset_path=DATASET_PATH, seed=0):
+    raw, _ = load_dataset(dataset_path)
+    sample = raw.sample(rows, replace=True, random_state=seed).reset_index(drop=True)
+    features = engineer_features(sample)
+    registry = ModelRegistry()
+    bundle = registry.load_version(registry.active_version() or LEGACY_VERSION)
+    timings = []
+    reference = None
+    for processes in process_counts:
+        started = time.perf_counter()
+        output = score_matrix(features, processes, chunk_rows, bundle=bundle)
+        elapsed = time.perf_counter() - started
+        if reference is None:
+            reference = output
+        elif not np.allclose(output[OUTPUT_COLUMNS].to_numpy(), reference[OUTPUT_COLUMNS].to_numpy()):
+            raise RuntimeError(f"{processes}-process scores differ from the {process_counts[0]}-process run")
+        timings.append((processes, elapsed))
+    return timings
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Score patient records across a process pool.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    score = commands.add_parser("score", help="score a CSV of patient records")
+    score.add_argument("input")
+    score.add_argument("output")
+    score.add_argument("--processes", type=int, default=os.cpu_count() or 1)
+    score.add_argument("--chunk-rows", type=int, default=DEFAULT_CHUNK_ROWS)
+    score.add_argument("--version", help="registry version (default: ACTIVE)")
+    bench = commands.add_parser("bench", help="time scoring at several process counts")
+    bench.add_argument("--rows", type=int, default=200_000)
+    bench.add_argument("--processes", type=int, nargs="+", default=[1, 2, 4, 8])
+    bench.add_argument("--chunk-rows", type=int, default=DEFAULT_CHUNK_ROWS)
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(name)s %(message)s")
+
+    if args.command == "score":
+        started = time.perf_counter()
+        frame = pd.read_csv(args.input)
+        monitor = open_monitor(background=False)
+        scored = score_frame(frame, monitor, processes=args.processes, chunk_rows=args.chunk_rows, version=args.version)
+        scored.to_csv(args.output, index=False)
+        log.info("scored %d rows (%d rejected) in %.2fs", len(scored), int((scored["error"] != "").sum()),
+                 time.perf_counter() - started)
+        if monitor is not None:
+            write_report(monitor, args.output + ".drift.json")
+        return 0
+
+    timings = benchmark(args.rows, args.processes, args.chunk_rows)
+    baseline = timings[0][1] * timings[0][0]
+    print(f"{'processes':>9}{'seconds':>10}{'rows/s':>12}{'speedup':>9}{'efficiency':>12}")
+    for processes, elapsed in timings:
+        speedup = baseline / elapsed
+        print(f"{processes:>9}{elapsed:>10.2f}{args.rows / elapsed:>12,.0f}{speedup:>9.2f}{speedup / processes:>12.0%}")
+    print(f"(cpu_count={os.cpu_count()})")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
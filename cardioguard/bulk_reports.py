@@ -0,0 +1,224 @@
+# Bulk per-patient PDF export, rendered in a process pool and streamed into a ZIP archive
+#
+#   python -m cardioguard.bulk_reports export scores.csv reports.zip --processes 4
+#   python -m cardioguard.bulk_reports bench --reports 1000 --processes 1 2 4
+#
+# Input is a CSV of patient records (Data_cardiovascular_risk.csv layout), read in
+# chunks. Rows that already carry rf_prob/stack_prob (cardioguard.batch or
+# cardioguard.stream output) are used as-is; otherwise they are scored first.
+# Rows that cannot be scored are logged and skipped.
+# At most --in-flight reports exist at once, so memory is bounded by the pool, not
+# the cohort; each finished PDF is written to the archive and dropped. The archive
+# can be any writable stream, including a non-seekable HTTP response body.
+import argparse
+import logging
+import os
+import re
+import resource
+import sys
+import tempfile
+import time
+import zipfile
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+import numpy as np
+import pandas as pd
+
+from cardioguard.features import DATASET_PATH, RAW_COLUMNS, prepare_dataset
+from cardioguard.reports import generate_advanced_pdf_report, generate_personalized_recommendations
+
+log = logging.getLogger(__name__)
+
+DEFAULT_CHUNK_ROWS = 1000
+ID_COLUMNS = ("patient_id", "id")
+UNCERTAINTY_COLUMNS = ("stack_std", "stack_low", "stack_high")
+
+
+def _display(value):
+    # Dataset values come back as floats; show whole numbers the way the form does
+    value = float(value)
+    return int(value) if value.is_integer() else round(value, 2)
+
+
+def render_report(task):
+    # Runs in a worker process; returns (archive name, PDF bytes)
+    name, user_data, rf_prob, stack_prob, uncertainty = task
+    recommendations = generate_personalized_recommendations(stack_prob * 100, user_data)
+    pdf = generate_advanced_pdf_report(user_data, rf_prob, stack_prob, recommendations, uncertainty)
+    return name, pdf.getvalue()
+
+
+def _safe_name(value):
+    return re.sub(r"[^A-Za-z0-9._-]+", "_", str(value)).strip("._") or "patient"
+
+
+def iter_tasks(path, chunk_rows=DEFAULT_CHUNK_ROWS, bundle=None):
+    # (name, user_data, rf_prob, stack_prob, uncertainty) per patient, one chunk of rows in memory at a time
+    from cardioguard.stream import iter_chunks, score_chunk
+
+    row_number = 0
+    for chunk in iter_chunks(path, chunk_rows):
+        if not {"rf_prob", "stack_prob"} <= set(chunk.columns):
+            if bundle is None:
+                from cardioguard.registry import LEGACY_VERSION, ModelRegistry
+
+                registry = ModelRegistry()
+                bundle = registry.load_version(registry.active_version() or LEGACY_VERSION)
+            chunk = score_chunk(chunk, bundle)
+        raw = prepare_dataset(chunk)
+        # Pre-scored files from before dispersion was recorded simply omit it from the report
+        spread = [column for column in UNCERTAINTY_COLUMNS if column in chunk.columns]
+        spread = spread if len(spread) == len(UNCERTAINTY_COLUMNS) else []
+        id_column = next((column for column in ID_COLUMNS if column in chunk.columns), None)
+        for i, (_, row) in enumerate(raw.iterrows()):
+            row_number += 1
+            label = chunk[id_column].iloc[i] if id_column else f"{row_number:07d}"
+            if not np.isfinite(chunk["stack_prob"].iloc[i]):
+                # Rejected by score_chunk (or left unscored in a pre-scored file): no report to render
+                log.warning("row %d (%s): not scored, no report: %s", row_number, label,
+                            chunk["error"].iloc[i] if "error" in chunk else "missing probabilities")
+                continue
+            user_data = {column: _display(row[column]) for column in RAW_COLUMNS}
+            yield (
+                f"CardioGuard_Report_{_safe_name(label)}.pdf",
+                user_data,
+                float(chunk["rf_prob"].iloc[i]),
+                float(chunk["stack_prob"].iloc[i]),
+                _uncertainty(chunk, i, spread),
+            )
+
+
+def _uncertainty(chunk, i, spread):
+    if not spread:
+        return None
+    uncertainty = {column: float(chunk[column].iloc[i]) for column in spread}
+    if "needs_review" in chunk:
+        uncertainty["needs_review"] = bool(chunk["needs_review"].iloc[i])
+    return uncertainty
+
+
+def _unique_name(name, seen):
+    # Repeated IDs get _2, _3, ...; a suffixed name can also be a later patient's real ID, so check each
+    if name not in seen:
+        return name
+    stem, ext = os.path.splitext(name)
+    copy = 2
+    while f"{stem}_{copy}{ext}" in seen:
+        copy += 1
+    return f"{stem}_{copy}{ext}"
+
+
+def write_archive(tasks, fileobj, processes=None, in_flight=None, compression=zipfile.ZIP_DEFLATED):
+    # Renders tasks in a process pool and appends each PDF to the ZIP as soon as it is ready
+    processes = processes or os.cpu_count() or 1
+    in_flight = in_flight or processes * 2
+    written = 0
+    seen = set()
+    tasks = iter(tasks)
+    with zipfile.ZipFile(fileobj, "w", compression=compression, compresslevel=1) as archive, \
+            ProcessPoolExecutor(processes) as pool:
+        pending = set()
+        exhausted = False
+        while pending or not exhausted:
+            while not exhausted and len(pending) < in_flight:
+                task = next(tasks, None)
+                if task is None:
+                    exhausted = True
+                else:
+                    pending.add(pool.submit(render_report, task))
+            if not pending:
+                break
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                name, pdf_bytes = future.result()
+                name = _unique_name(name, seen)
+                seen.add(name)
+                archive.writestr(name, pdf_bytes)
+                written += 1
+    return written
+
+
+def export_reports(path, destination, processes=None, chunk_rows=DEFAULT_CHUNK_ROWS, in_flight=None):
+    tasks = iter_tasks(path, chunk_rows)
+    if hasattr(destination, "write"):
+        return write_archive(tasks, destination, processes, in_flight)
+    try:
+        with open(destination + ".tmp", "wb") as f:
+            count = write_archive(tasks, f, processes, in_flight)
+        os.replace(destination + ".tmp", destination)
+    except BaseException:
+        # A failed export leaves neither a partial archive nor its temporary file
+        try:
+            os.remove(destination + ".tmp")
+        except FileNotFoundError:
+            pass
+        raise
+    return count
+
+
+def peak_rss():
+    # Parent and largest child, in bytes (ru_maxrss is KiB on Linux)
+    own = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+    children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss * 1024
+    return own, children
+
+
+def benchmark(reports, process_counts, dataset_path=DATASET_PATH):
+    from cardioguard.registry import LEGACY_VERSION, ModelRegistry
+    from cardioguard.stream import score_chunk
+
+    # Scored up front so the timings cover rendering and archiving only
+    registry = ModelRegistry()
+    bundle = registry.load_version(registry.active_version() or LEGACY_VERSION)
+    frame = pd.read_csv(dataset_path)
+    sample = score_chunk(frame.sample(reports, replace=True, random_state=0).reset_index(drop=True), bundle)
+    results = []
+    with tempfile.TemporaryDirectory() as directory:
+        source = os.path.join(directory, "patients.csv")
+        sample.to_csv(source, index=False)
+        for processes in process_counts:
+            started = time.perf_counter()
+            with open(os.path.join(directory, "reports.zip"), "wb") as f:
+                count = write_archive(iter_tasks(source), f, processes)
+            elapsed = time.perf_counter() - started
+            results.append((processes, count, elapsed))
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Export one PDF report per patient into a ZIP archive.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    export = commands.add_parser("export", help="render reports for a CSV of patients")
+    export.add_argument("input")
+    export.add_argument("output", help="ZIP path, or - for stdout")
+    export.add_argument("--processes", type=int, default=os.cpu_count() or 1)
+    export.add_argument("--in-flight", type=int, help="reports rendered or buffered at once (default 2 per process)")
+    export.add_argument("--chunk-rows", type=int, default=DEFAULT_CHUNK_ROWS)
+    bench = commands.add_parser("bench", help="measure reports per second")
+    bench.add_argument("--reports", type=int, default=1000)
+    bench.add_argument("--processes", type=int, nargs="+", default=[1, 2, 4])
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(name)s %(message)s")
+
+    if args.command == "export":
+        started = time.perf_counter()
+        destination = sys.stdout.buffer if args.output == "-" else args.output
+        count = export_reports(args.input, destination, args.processes, args.chunk_rows, args.in_flight)
+        elapsed = time.perf_counter() - started
+        own, children = peak_rss()
+        log.info(
+            "%d reports in %.1fs (%.1f reports/s, peak rss parent %.0fMB, worker %.0fMB)",
+            count, elapsed, count / elapsed, own / 2**20, children / 2**20,
+        )
+        return 0
+
+    print(f"{'processes':>9}{'reports':>9}{'seconds':>9}{'reports/s':>11}")
+    for processes, count, elapsed in benchmark(args.reports, args.processes):
+        print(f"{processes:>9}{count:>9}{elapsed:>9.2f}{count / elapsed:>11.1f}")
+    own, children = peak_rss()
+    print(f"peak rss: parent {own / 2**20:.0f}MB, largest worker {children / 2**20:.0f}MB (cpu_count={os.cpu_count()})")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
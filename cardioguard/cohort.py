@@ -0,0 +1,88 @@
+# Cohort analytics: vectorised risk distributions, risk bands and alert prevalence for a patient file
+import hashlib
+
+import numpy as np
+import pandas as pd
+
+from cardioguard.features import RAW_COLUMNS, TARGET_COLUMN, prepare_dataset, scorable_features
+
+# The alert conditions the assessment form flags in red
+ALERTS = {
+    "High Blood Pressure (sysBP > 140)": ("sysBP", 140),
+    "High Cholesterol (totChol > 240)": ("totChol", 240),
+    "Obesity (BMI > 30)": ("BMI", 30),
+}
+AGE_BINS = [0, 40, 50, 60, 70, np.inf]
+AGE_LABELS = ["<40", "40-49", "50-59", "60-69", "70+"]
+# Same cut points as reports.get_risk_level
+RISK_BINS = [-np.inf, 30, 60, np.inf]
+RISK_LABELS = ["Low", "Moderate", "High"]
+HISTOGRAM_BINS = np.linspace(0, 100, 21)
+
+
+def content_hash(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+def missing_columns(frame):
+    return [column for column in RAW_COLUMNS if column not in frame.columns]
+
+
+def score_cohort(frame, bundle):
+    # Raw file -> (one row per scorable patient with inputs, bands and predicted risk (percent),
+    # the 1-based row number and reason of every row that could not be scored)
+    features, errors = scorable_features(frame)
+    raw = prepare_dataset(frame.loc[features.index])
+    risk = bundle.stack.predict_proba(features)[:, 1] * 100 if len(features) else np.empty(0)
+    cohort = raw.assign(
+        risk=risk,
+        sex_label=np.where(raw["sex"] == 1, "Male", "Female"),
+        age_band=pd.cut(raw["age"], AGE_BINS, labels=AGE_LABELS, right=False),
+    )
+    cohort["risk_band"] = pd.cut(cohort["risk"], RISK_BINS, labels=RISK_LABELS, right=False)
+    if TARGET_COLUMN in frame.columns:
+        cohort[TARGET_COLUMN] = pd.to_numeric(frame.loc[features.index, TARGET_COLUMN], errors="coerce")
+    for label, (column, limit) in ALERTS.items():
+        cohort[label] = cohort[column] > limit
+    failed = errors[errors != ""]
+    rejected = pd.DataFrame({"row": np.flatnonzero((errors != "").to_numpy()) + 1, "reason": failed.to_numpy()})
+    return cohort, rejected
+
+
+def select(cohort, sex="All", age_range=(0, 200), smoking="All"):
+    mask = cohort["age"].between(*age_range)
+    if sex != "All":
+        mask &= cohort["sex_label"] == sex
+    if smoking != "All":
+        mask &= cohort["is_smoking"] == (1 if smoking == "Smokers" else 0)
+    return cohort[mask]
+
+
+def aggregate(cohort):
+    # Small frames only, so results are cheap to cache and to send to the browser
+    counts, edges = np.histogram(cohort["risk"], bins=HISTOGRAM_BINS)
+    distribution = pd.DataFrame({"risk_from": edges[:-1], "risk_to": edges[1:], "patients": counts})
+    bands = (
+        cohort.groupby(["sex_label", "age_band", "risk_band"], observed=False).size()
+        .rename("patients").reset_index()
+    )
+    totals = bands.groupby(["sex_label", "age_band"], observed=False)["patients"].transform("sum")
+    bands["share"] = bands["patients"] / totals.where(totals > 0)
+    alerts = list(ALERTS)
+    prevalence = cohort[alerts].mean().rename("prevalence").rename_axis("alert").reset_index()
+    prevalence_by_age = cohort.groupby("age_band", observed=False)[alerts].mean()
+    summary = {
+        "patients": int(len(cohort)),
+        "mean_risk": float(cohort["risk"].mean()) if len(cohort) else 0.0,
+        "high_risk_share": float((cohort["risk_band"] == "High").mean()) if len(cohort) else 0.0,
+        "observed_chd_rate": (
+            float(cohort[TARGET_COLUMN].mean()) if TARGET_COLUMN in cohort and len(cohort) else None
+        ),
+    }
+    return {
+        "summary": summary,
+        "distribution": distribution,
+        "bands": bands,
+        "prevalence": prevalence,
+        "prevalence_by_age": prevalence_by_age,
+    }
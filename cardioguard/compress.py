@@ -0,0 +1,288 @@
+# Forest pruning and compressed export, with a size / latency / accuracy report
+#
+#   python -m cardioguard.compress --rf rf.pkl --stack stack.pkl --output-dir build/compressed --target-latency-ms 15
+#   python -m cardioguard.compress --target-bytes 20000000 --publish
+#
+# Every random forest inside a model (the standalone forest, and the stack's
+# best_rf base learner) is reduced in three steps:
+#   1. subtrees whose leaves all predict the same class distribution collapse to a
+#      leaf (lossless: predict_proba is unchanged)
+#   2. minimal cost-complexity post-pruning at ccp_alpha, as sklearn's ccp_alpha
+#      would have pruned at fit time, applied to the already-fitted trees
+#   3. greedy forward selection keeps the n trees that add most to held-out AUC
+# Trees are rebuilt compactly so dropped nodes free their memory. The held-out
+# SMOTE split from cardioguard.training is halved: one half picks the
+# (ccp_alpha, n_trees) setting, the other half is used for the report.
+import argparse
+import io
+import json
+import logging
+import os
+import pickle
+import sys
+import time
+from copy import deepcopy
+
+import joblib
+import numpy as np
+from sklearn.ensemble import RandomForestClassifier
+from sklearn.metrics import roc_auc_score
+from sklearn.model_selection import train_test_split
+
+from cardioguard.models import RF_MODEL_PATH, STACK_MODEL_PATH
+from cardioguard.registry import golden_inputs
+from cardioguard.training import RANDOM_STATE, STACK_THRESHOLD, evaluate, training_data
+
+log = logging.getLogger(__name__)
+
+ALPHA_GRID = (0.0, 1e-5, 3e-5, 1e-4, 3e-4, 1e-3)
+TREE_FRACTIONS = (1.0, 0.75, 0.5, 0.375, 0.25, 0.125)
+THRESHOLDS = {"rf": 0.5, "stack": STACK_THRESHOLD}
+
+
+def forests(model):
+    # Fitted random forests anywhere inside a (possibly stacked) model
+    stack = [model]
+    while stack:
+        estimator = stack.pop()
+        if isinstance(estimator, RandomForestClassifier):
+            yield estimator
+            continue
+        stack.extend(getattr(estimator, "estimators_", None) or [])
+        final = getattr(estimator, "final_estimator_", None)
+        if final is not None:
+            stack.append(final)
+
+
+def _prune_mask(tree, alpha, tol=1e-12):
+    # Bottom-up pass over the fitted arrays; sklearn numbers children after their parents
+    left, right = tree.children_left, tree.children_right
+    values = tree.value[:, 0, :]
+    values = values / values.sum(axis=1, keepdims=True)
+    risk = tree.impurity * tree.weighted_n_node_samples / tree.weighted_n_node_samples[0]
+    subtree_cost = risk + alpha
+    uniform = np.ones(tree.node_count, dtype=bool)
+    collapse = np.zeros(tree.node_count, dtype=bool)
+    for node in range(tree.node_count - 1, -1, -1):
+        l, r = left[node], right[node]
+        if l == -1:
+            continue
+        uniform[node] = (
+            uniform[l] and uniform[r]
+            and np.abs(values[l] - values[r]).max() <= tol
+            and np.abs(values[node] - values[l]).max() <= tol
+        )
+        children_cost = subtree_cost[l] + subtree_cost[r]
+        if uniform[node] or (alpha > 0 and risk[node] + alpha <= children_cost):
+            collapse[node] = True
+        else:
+            subtree_cost[node] = children_cost
+    return collapse
+
+
+def _rebuild(tree, collapse):
+    # Compact copy of the reachable nodes, with collapsed nodes turned into leaves
+    cls, args, state = tree.__reduce__()
+    nodes, values = state["nodes"], state["values"]
+    order, depths, stack = [], [], [(0, 0)]
+    while stack:
+        node, depth = stack.pop()
+        order.append(node)
+        depths.append(depth)
+        if nodes["left_child"][node] != -1 and not collapse[node]:
+            stack.append((nodes["right_child"][node], depth + 1))
+            stack.append((nodes["left_child"][node], depth + 1))
+    order = np.asarray(order)
+    remap = np.full(len(nodes), -1, dtype=np.int64)
+    remap[order] = np.arange(len(order))
+    compact = nodes[order].copy()
+    leaf = (compact["left_child"] == -1) | collapse[order]
+    compact["left_child"] = np.where(leaf, -1, remap[compact["left_child"]])
+    compact["right_child"] = np.where(leaf, -1, remap[compact["right_child"]])
+    compact["feature"][leaf] = -2
+    compact["threshold"][leaf] = -2.0
+    rebuilt = cls(*args)
+    rebuilt.__setstate__({
+        "max_depth": int(max(depths)),
+        "node_count": len(order),
+        "nodes": compact,
+        "values": np.ascontiguousarray(values[order]),
+    })
+    return rebuilt
+
+
+def prune_forest(forest, alpha):
+    for estimator in forest.estimators_:
+        estimator.tree_ = _rebuild(estimator.tree_, _prune_mask(estimator.tree_, alpha))
+    return forest
+
+
+def tree_order(forest, X, y):
+    # Greedy forward selection: each step adds the tree that most improves the averaged forest's AUC
+    scores = np.vstack([estimator.predict_proba(X.to_numpy())[:, 1] for estimator in forest.estimators_])
+    y = np.asarray(y)
+    remaining = list(range(len(scores)))
+    chosen, total = [], np.zeros(scores.shape[1])
+    while remaining:
+        aucs = [roc_auc_score(y, (total + scores[i]) / (len(chosen) + 1)) for i in remaining]
+        best = remaining.pop(int(np.argmax(aucs)))
+        chosen.append(best)
+        total += scores[best]
+    return chosen
+
+
+def keep_trees(forest, order, n_trees):
+    forest.estimators_ = [forest.estimators_[i] for i in sorted(order[:n_trees])]
+    forest.n_estimators = len(forest.estimators_)
+    return forest
+
+
+def model_bytes(model):
+    return len(pickle.dumps(model, protocol=pickle.HIGHEST_PROTOCOL))
+
+
+def node_count(model):
+    return sum(estimator.tree_.node_count for forest in forests(model) for estimator in forest.estimators_)
+
+
+def single_row_latency(model, repeats=30):
+    inputs = golden_inputs()
+    timings = []
+    for i in range(repeats):
+        row = inputs.iloc[[i % len(inputs)]]
+        started = time.perf_counter()
+        model.predict_proba(row)
+        timings.append(time.perf_counter() - started)
+    return float(np.median(timings))
+
+
+def describe(model, X, y, threshold):
+    return {
+        "bytes": model_bytes(model),
+        "nodes": node_count(model),
+        "trees": sum(len(forest.estimators_) for forest in forests(model)),
+        "latency_ms": single_row_latency(model) * 1000,
+        **evaluate(model, X, y, threshold),
+    }
+
+
+def compress(model, alpha, n_trees_fraction, orders):
+    pruned = deepcopy(model)
+    for forest, order in zip(forests(pruned), orders):
+        prune_forest(forest, alpha)
+        keep_trees(forest, order, max(1, round(len(order) * n_trees_fraction)))
+    return pruned
+
+
+def search(model, name, select, report, target_bytes=None, target_latency_ms=None, alpha=None, trees=None,
+           max_auc_drop=0.005):
+    # Among settings that meet the target, take the smallest within max_auc_drop of the unpruned
+    # AUC on the selection half; if none is that close, the most accurate one
+    X_select, y_select = select
+    threshold = THRESHOLDS[name]
+    baseline = evaluate(model, X_select, y_select, threshold)["roc_auc"]
+    lossless = compress(model, 0.0, 1.0, [list(range(len(f.estimators_))) for f in forests(model)])
+    orders = [tree_order(forest, X_select, y_select) for forest in forests(lossless)]
+    grid = [(a, t) for a in ([alpha] if alpha is not None else ALPHA_GRID)
+            for t in ([trees] if trees is not None else TREE_FRACTIONS)]
+    feasible = []
+    for a, t in grid:
+        candidate = compress(lossless, a, t, orders)
+        size = model_bytes(candidate)
+        latency = single_row_latency(candidate) * 1000
+        auc = evaluate(candidate, X_select, y_select, threshold)["roc_auc"]
+        log.info("%s alpha=%g trees=%.3f: %.1fMB %.1fms auc=%.4f", name, a, t, size / 2**20, latency, auc)
+        if target_bytes is not None and size > target_bytes:
+            continue
+        if target_latency_ms is not None and latency > target_latency_ms:
+            continue
+        feasible.append((auc, size, a, t, candidate))
+    if not feasible:
+        return None
+    close = [entry for entry in feasible if baseline - entry[0] <= max_auc_drop]
+    if close:
+        _, _, a, t, candidate = min(close, key=lambda entry: entry[1])
+    else:
+        _, _, a, t, candidate = max(feasible, key=lambda entry: entry[0])
+    X_report, y_report = report
+    before = describe(model, X_report, y_report, threshold)
+    after = describe(candidate, X_report, y_report, threshold)
+    return candidate, {
+        "ccp_alpha": a,
+        "tree_fraction": t,
+        "before": before,
+        "after": after,
+        "delta": {key: after[key] - before[key] for key in ("roc_auc", "f1", "precision", "recall", "accuracy")},
+        "bytes_ratio": after["bytes"] / before["bytes"],
+        "latency_ratio": after["latency_ms"] / before["latency_ms"],
+    }
+
+
+def _format_report(report):
+    lines = [f"{'model':<7}{'':<8}{'MB':>8}{'nodes':>10}{'trees':>7}{'ms/row':>8}{'AUC':>8}{'F1':>8}"]
+    for name, entry in report.items():
+        for label in ("before", "after"):
+            row = entry[label]
+            lines.append(
+                f"{name if label == 'before' else '':<7}{label:<8}{row['bytes'] / 2**20:>8.2f}{row['nodes']:>10,}"
+                f"{row['trees']:>7}{row['latency_ms']:>8.2f}{row['roc_auc']:>8.4f}{row['f1']:>8.4f}"
+            )
+        lines.append(
+            f"{'':<7}{'change':<8}{entry['bytes_ratio'] - 1:>8.0%}{'':>10}{'':>7}{entry['latency_ratio'] - 1:>8.0%}"
+            f"{entry['delta']['roc_auc']:>+8.4f}{entry['delta']['f1']:>+8.4f}"
+            f"   (ccp_alpha={entry['ccp_alpha']:g}, trees x{entry['tree_fraction']:g})"
+        )
+    return "\n".join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Prune and compress the forests, then report size, latency and accuracy.")
+    parser.add_argument("--rf", default=RF_MODEL_PATH)
+    parser.add_argument("--stack", default=STACK_MODEL_PATH)
+    parser.add_argument("--output-dir", default="build/compressed")
+    parser.add_argument("--target-bytes", type=int, help="largest acceptable pickled size per model")
+    parser.add_argument("--target-latency-ms", type=float, help="largest acceptable single-row latency per model")
+    parser.add_argument("--ccp-alpha", type=float, help="fix ccp_alpha instead of searching")
+    parser.add_argument("--trees", type=float, help="fix the fraction of trees kept instead of searching")
+    parser.add_argument("--max-auc-drop", type=float, default=0.005,
+                        help="AUC loss on the selection half accepted in exchange for a smaller model")
+    parser.add_argument("--compress", type=int, default=3, help="joblib compression level for the exported files")
+    parser.add_argument("--publish", action="store_true", help="publish the compressed pair to the model registry")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(name)s %(message)s")
+
+    _, X_test, _, y_test = training_data()
+    X_select, X_report, y_select, y_report = train_test_split(
+        X_test, y_test, test_size=0.5, stratify=y_test, random_state=RANDOM_STATE,
+    )
+    os.makedirs(args.output_dir, exist_ok=True)
+    report, paths = {}, {}
+    for name, path in (("rf", args.rf), ("stack", args.stack)):
+        model = joblib.load(path)
+        result = search(
+            model, name, (X_select, y_select), (X_report, y_report),
+            args.target_bytes, args.target_latency_ms, args.ccp_alpha, args.trees, args.max_auc_drop,
+        )
+        if result is None:
+            print(f"{name}: no setting meets the target", file=sys.stderr)
+            return 1
+        compressed, report[name] = result
+        paths[name] = os.path.join(args.output_dir, f"{name}.pkl")
+        joblib.dump(compressed, paths[name], compress=args.compress)
+        buffer = io.BytesIO()
+        joblib.dump(model, buffer, compress=args.compress)
+        report[name]["file_bytes"] = {"before": len(buffer.getvalue()), "after": os.path.getsize(paths[name])}
+
+    with open(os.path.join(args.output_dir, "compression_report.json"), "w") as f:
+        json.dump(report, f, indent=2)
+    print(_format_report(report))
+    if args.publish:
+        from cardioguard.registry import ModelRegistry
+
+        metrics = {"compression": report}
+        print(ModelRegistry().publish(paths["rf"], paths["stack"], metrics, notes="pruned and compressed"))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
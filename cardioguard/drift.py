@@ -0,0 +1,232 @@
+# Streaming input-drift monitor: constant-memory sketches compared against the training data
+#
+# The app and the service (/bulk) feed a background monitor whose scores are
+# exported with the other metrics. The batch and stream CLIs update one inline
+# (background=False) and write the scores for the file they scored to
+# <output>.drift.json; stream keeps the sketches in its checkpoint, so a resumed
+# job reports on the whole file.
+import hashlib
+import json
+import logging
+import os
+import queue
+import threading
+import time
+
+import numpy as np
+
+from cardioguard.features import DATASET_PATH, FEATURE_COLUMNS, engineer_features, load_dataset
+from cardioguard.settings import data_path
+
+log = logging.getLogger(__name__)
+
+QUANTILE_BINS = 10
+PSI_EPSILON = 1e-4
+
+
+def _bin_edges(values):
+    uniques = np.unique(values)
+    if len(uniques) <= QUANTILE_BINS:
+        # Discrete features get one bin per observed value
+        return (uniques[:-1] + uniques[1:]) / 2
+    edges = np.unique(np.quantile(values, np.linspace(0, 1, QUANTILE_BINS + 1)[1:-1]))
+    return edges
+
+
+def _histogram(values, edges):
+    return np.bincount(np.searchsorted(edges, values, side="right"), minlength=len(edges) + 1)
+
+
+def build_reference(path=DATASET_PATH):
+    raw, _ = load_dataset(path)
+    features = engineer_features(raw)
+    reference = {}
+    for column in FEATURE_COLUMNS:
+        values = features[column].to_numpy(dtype=float)
+        edges = _bin_edges(values)
+        counts = _histogram(values, edges)
+        reference[column] = {
+            "edges": edges.tolist(),
+            "proportions": (counts / counts.sum()).tolist(),
+            "mean": float(values.mean()),
+            "std": float(values.std()),
+        }
+    return reference
+
+
+def load_reference(cache_path, dataset_path=DATASET_PATH):
+    # Precomputed once per dataset version and cached next to the other runtime state
+    with open(dataset_path, "rb") as f:
+        digest = hashlib.sha256(f.read()).hexdigest()
+    if os.path.exists(cache_path):
+        with open(cache_path) as f:
+            cached = json.load(f)
+        if cached.get("dataset_sha256") == digest:
+            return cached["features"]
+    reference = build_reference(dataset_path)
+    with open(cache_path + ".tmp", "w") as f:
+        json.dump({"dataset_sha256": digest, "features": reference}, f)
+    os.replace(cache_path + ".tmp", cache_path)
+    return reference
+
+
+def psi(expected, actual):
+    expected = np.clip(expected, PSI_EPSILON, None)
+    actual = np.clip(actual, PSI_EPSILON, None)
+    return float(np.sum((actual - expected) * np.log(actual / expected)))
+
+
+def ks_distance(expected, actual):
+    # KS statistic evaluated on the shared bin edges
+    return float(np.max(np.abs(np.cumsum(expected) - np.cumsum(actual))))
+
+
+class FeatureSketch:
+    __slots__ = ("edges", "counts", "window_counts", "n", "mean", "m2")
+
+    def __init__(self, edges):
+        self.edges = np.asarray(edges, dtype=float)
+        self.counts = np.zeros(len(edges) + 1, dtype=np.int64)
+        self.window_counts = np.zeros(len(edges) + 1, dtype=np.int64)
+        self.n = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+
+    def update(self, values):
+        # Chan et al. parallel update of running mean/variance, plus fixed-bin counts
+        values = np.asarray(values, dtype=float)
+        batch_n = len(values)
+        if not batch_n:
+            return
+        batch_mean = values.mean()
+        batch_m2 = float(((values - batch_mean) ** 2).sum())
+        total = self.n + batch_n
+        delta = batch_mean - self.mean
+        self.mean += delta * batch_n / total
+        self.m2 += batch_m2 + delta * delta * self.n * batch_n / total
+        self.n = total
+        hist = _histogram(values, self.edges)
+        self.counts += hist
+        self.window_counts += hist
+
+    @property
+    def variance(self):
+        return self.m2 / self.n if self.n else 0.0
+
+    def state(self):
+        return {"counts": self.counts.tolist(), "n": self.n, "mean": self.mean, "m2": self.m2}
+
+    def restore(self, state):
+        self.counts[:] = state["counts"]
+        self.n, self.mean, self.m2 = state["n"], state["mean"], state["m2"]
+
+
+class DriftMonitor:
+    def __init__(self, reference, interval=60.0, max_queue=4096, min_window=30, background=True):
+        self.reference = reference
+        self.interval = interval
+        self.min_window = min_window
+        self.dropped = 0
+        self.latest = {}
+        self._sketches = {column: FeatureSketch(reference[column]["edges"]) for column in FEATURE_COLUMNS}
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._lock = threading.Lock()
+        self._worker = None
+        if background:
+            self._worker = threading.Thread(target=self._run, name="drift-monitor", daemon=True)
+            self._worker.start()
+
+    def observe(self, features):
+        # Accepts one row or a batch (n x len(FEATURE_COLUMNS)); drops instead of blocking
+        block = np.atleast_2d(np.asarray(features, dtype=float))
+        if self._worker is None:
+            self._update(block)
+            return True
+        try:
+            self._queue.put_nowait(block)
+            return True
+        except queue.Full:
+            self.dropped += 1
+            return False
+
+    def _update(self, block):
+        with self._lock:
+            for i, column in enumerate(FEATURE_COLUMNS):
+                self._sketches[column].update(block[:, i])
+
+    def snapshot(self):
+        with self._lock:
+            return {column: sketch.state() for column, sketch in self._sketches.items()}
+
+    def restore(self, snapshot):
+        with self._lock:
+            for column, state in snapshot.items():
+                self._sketches[column].restore(state)
+
+    def _run(self):
+        next_report = time.monotonic() + self.interval
+        while True:
+            try:
+                block = self._queue.get(timeout=max(0.0, next_report - time.monotonic()))
+            except queue.Empty:
+                block = None
+            if block is not None:
+                self._update(block)
+            if time.monotonic() >= next_report:
+                self.latest = self.compute_scores()
+                next_report = time.monotonic() + self.interval
+
+    def compute_scores(self, reset_window=True):
+        scores = {}
+        with self._lock:
+            for column, sketch in self._sketches.items():
+                expected = np.asarray(self.reference[column]["proportions"])
+                window_n = int(sketch.window_counts.sum())
+                entry = {
+                    "n": sketch.n,
+                    "mean": sketch.mean,
+                    "std": sketch.variance ** 0.5,
+                    "mean_shift": (sketch.mean - self.reference[column]["mean"]) / (self.reference[column]["std"] or 1.0),
+                }
+                if sketch.n:
+                    overall = sketch.counts / sketch.n
+                    entry["psi"] = psi(expected, overall)
+                    entry["ks"] = ks_distance(expected, overall)
+                if window_n >= self.min_window:
+                    window = sketch.window_counts / window_n
+                    entry["window_n"] = window_n
+                    entry["window_psi"] = psi(expected, window)
+                    entry["window_ks"] = ks_distance(expected, window)
+                    if reset_window:
+                        sketch.window_counts[:] = 0
+                scores[column] = entry
+        return scores
+
+    def stats(self):
+        data = {"queue_depth": self._queue.qsize(), "dropped": self.dropped}
+        for column, entry in self.latest.items():
+            data[column] = {key: value for key, value in entry.items() if key in ("n", "psi", "ks", "window_psi", "window_ks", "mean_shift")}
+        return data
+
+
+def open_monitor(**kwargs):
+    # A DriftMonitor against the cached training reference, or None without the dataset
+    try:
+        reference = load_reference(data_path("drift_reference.json"))
+    except FileNotFoundError:
+        return None
+    return DriftMonitor(reference, **kwargs)
+
+
+def write_report(monitor, path):
+    # Scores over everything observed, to path; the most shifted feature is logged
+    scores = monitor.compute_scores(reset_window=False)
+    with open(path + ".tmp", "w") as f:
+        json.dump(scores, f, indent=2)
+    os.replace(path + ".tmp", path)
+    shifted = [(entry["psi"], column) for column, entry in scores.items() if "psi" in entry]
+    if shifted:
+        value, column = max(shifted)
+        log.info("input drift over %d rows: largest PSI %.3f (%s), ks %.3f -> %s",
+                 scores[column]["n"], value, column, scores[column]["ks"], path)
+    return scores
@@ -0,0 +1,140 @@
+# Feature engineering shared by the app, batch tools and services
+import numpy as np
+import pandas as pd
+
+# Raw inputs collected by the assessment form (binary fields already encoded as 0/1)
+RAW_COLUMNS = [
+    'age', 'sex', 'is_smoking', 'cigsPerDay', 'BPMeds', 'prevalentStroke', 'prevalentHyp',
+    'diabetes', 'totChol', 'sysBP', 'diaBP', 'BMI', 'glucose'
+]
+
+# Model input columns, in training order
+FEATURE_COLUMNS = [
+    'age', 'sex', 'is_smoking', 'BPMeds', 'prevalentStroke', 'prevalentHyp',
+    'diabetes', 'totChol', 'sysBP', 'diaBP', 'glucose', 'smoking_level',
+    'bp_ratio', 'chol_age_ratio', 'bmi_category'
+]
+
+# Form defaults, also used to warm models up
+DEFAULT_RECORD = {
+    'age': 50, 'sex': 1, 'is_smoking': 0, 'cigsPerDay': 0, 'BPMeds': 0, 'prevalentStroke': 0,
+    'prevalentHyp': 0, 'diabetes': 0, 'totChol': 200, 'sysBP': 120, 'diaBP': 80,
+    'BMI': 25.0, 'glucose': 100
+}
+
+# Accepted range of each raw input: the assessment form's widget bounds, 0/1 for binary fields
+INPUT_BOUNDS = {
+    'age': (18, 100), 'sex': (0, 1), 'is_smoking': (0, 1), 'cigsPerDay': (0, 50), 'BPMeds': (0, 1),
+    'prevalentStroke': (0, 1), 'prevalentHyp': (0, 1), 'diabetes': (0, 1), 'totChol': (100, 400),
+    'sysBP': (90, 200), 'diaBP': (60, 140), 'BMI': (10.0, 50.0), 'glucose': (50, 300)
+}
+
+
+DATASET_PATH = "Data_cardiovascular_risk.csv"
+TARGET_COLUMN = "TenYearCHD"
+
+# Medians of the training data (Data_cardiovascular_risk.csv), used to impute missing values
+IMPUTE_VALUES = {
+    'cigsPerDay': 0.0, 'BPMeds': 0.0, 'totChol': 234.0, 'BMI': 25.38, 'glucose': 78.0,
+    'age': 49.0, 'sysBP': 128.5, 'diaBP': 82.0, 'prevalentStroke': 0.0,
+    'prevalentHyp': 0.0, 'diabetes': 0.0
+}
+
+_SEX_CODES = {'M': 1, 'F': 0, 'MALE': 1, 'FEMALE': 0, '1': 1, '0': 0, '1.0': 1, '0.0': 0}
+_YES_NO_CODES = {'YES': 1, 'NO': 0, 'Y': 1, 'N': 0, 'TRUE': 1, 'FALSE': 0, '1': 1, '0': 0, '1.0': 1, '0.0': 0}
+BINARY_COLUMNS = ['BPMeds', 'prevalentStroke', 'prevalentHyp', 'diabetes']
+# Divisors in engineer_features (bp_ratio, chol_age_ratio), so zero is as unusable as negative
+POSITIVE_COLUMNS = ['age', 'diaBP']
+
+
+def _encode(series, codes):
+    if pd.api.types.is_numeric_dtype(series):
+        return series.astype(float)
+    return series.astype(str).str.strip().str.upper().map(codes).astype(float)
+
+
+def prepare_dataset(frame):
+    # Dataset-style records (sex M/F, is_smoking YES/NO, gaps) -> RAW_COLUMNS, imputed
+    raw = pd.DataFrame(index=frame.index)
+    for column in RAW_COLUMNS:
+        if column == 'sex':
+            raw[column] = _encode(frame[column], _SEX_CODES)
+        elif column == 'is_smoking':
+            raw[column] = _encode(frame[column], _YES_NO_CODES)
+        else:
+            raw[column] = pd.to_numeric(frame[column], errors='coerce')
+    if raw['is_smoking'].isna().any():
+        raw['is_smoking'] = raw['is_smoking'].fillna((raw['cigsPerDay'] > 0).astype(float))
+    return raw.fillna(IMPUTE_VALUES)
+
+
+def dataset_errors(frame):
+    # Why each dataset-style record cannot be scored ('' if it can); gaps are fine, they are imputed
+    errors = pd.Series('', index=frame.index, dtype=object)
+
+    def flag(mask, message):
+        errors[mask & (errors == '')] = message
+
+    for column in RAW_COLUMNS:
+        values = frame[column] if column in frame else pd.Series(np.nan, index=frame.index)
+        present = values.notna()
+        if column == 'sex':
+            flag(~present, "sex: missing")
+            flag(present & _encode(values, _SEX_CODES).isna(), "sex: expected M/F or 1/0")
+        elif column == 'is_smoking':
+            flag(present & _encode(values, _YES_NO_CODES).isna(), "is_smoking: expected YES/NO or 1/0")
+        else:
+            numeric = pd.to_numeric(values, errors='coerce')
+            flag(present & numeric.isna(), f"{column}: not a number")
+            flag(np.isinf(numeric) | (numeric < 0), f"{column}: out of range")
+            if column in POSITIVE_COLUMNS:
+                flag(numeric <= 0, f"{column}: must be greater than 0")
+            if column in BINARY_COLUMNS:
+                flag(numeric.notna() & ~numeric.isin([0, 1]), f"{column}: expected 0 or 1")
+    return errors
+
+
+def scorable_features(frame):
+    # (engineered features of the rows that can be scored, reason per row as from dataset_errors)
+    errors = dataset_errors(frame)
+    features = engineer_features(prepare_dataset(frame[errors == '']))
+    finite = np.isfinite(features.to_numpy(dtype=np.float64)).all(axis=1)
+    errors[features.index[~finite]] = "derived features are not finite"
+    return features[finite], errors
+
+
+def load_dataset(path=DATASET_PATH):
+    frame = pd.read_csv(path)
+    return prepare_dataset(frame), frame[TARGET_COLUMN] if TARGET_COLUMN in frame else None
+
+
+def smoking_level(cigs):
+    cigs = np.asarray(cigs, dtype=float)
+    return np.select([cigs == 0, cigs <= 10, cigs <= 20], [0, 1, 2], default=3)
+
+
+def bmi_category(bmi):
+    bmi = np.asarray(bmi, dtype=float)
+    return np.select([bmi < 18.5, bmi < 25, bmi < 30], [0, 1, 2], default=3)
+
+
+def round2(values):
+    # Python's round() (correctly rounded), not np.round, to match single-row scoring exactly
+    values = np.asarray(values, dtype=float)
+    return np.fromiter((round(v, 2) for v in values.tolist()), dtype=float, count=len(values))
+
+
+def engineer_features(raw):
+    # raw: DataFrame with RAW_COLUMNS; returns the model matrix with FEATURE_COLUMNS
+    features = pd.DataFrame(index=raw.index)
+    for column in FEATURE_COLUMNS[:11]:
+        features[column] = raw[column]
+    features['smoking_level'] = smoking_level(raw['cigsPerDay'])
+    features['bp_ratio'] = round2(raw['sysBP'] / raw['diaBP'])
+    features['chol_age_ratio'] = round2(raw['totChol'] / raw['age'])
+    features['bmi_category'] = bmi_category(raw['BMI'])
+    return features
+
+
+def features_from_record(record):
+    return engineer_features(pd.DataFrame([record], columns=RAW_COLUMNS))
@@ -0,0 +1,194 @@
+# Golden prediction corpus and numerical-equivalence harness for alternative inference paths
+#
+#   python -m cardioguard.golden build [--rf rf.pkl --stack stack.pkl | --version V]
+#   python -m cardioguard.golden check --engine dispersion
+#   python -m cardioguard.golden check --rf build/compressed/rf.pkl --stack build/compressed/stack.pkl --tolerance 0.05
+#
+# build scores every row of Data_cardiovascular_risk.csv, every corner of the
+# assessment form's input box (each slider at its lower or upper bound, each
+# yes/no field either way) and the registry's one-field-at-a-time golden inputs
+# with the reference models loaded by joblib, and stores inputs and outputs in
+# build/golden. check replays the corpus through a candidate (another engine,
+# another pair of pickles, or a registry version) and reports the maximum and
+# mean deviation and the number of patients whose side of each app threshold
+# changes. It exits non-zero if the maximum deviation exceeds --tolerance or the
+# flips exceed --max-flips.
+import argparse
+import itertools
+import json
+import os
+import sys
+import time
+
+import joblib
+import numpy as np
+import pandas as pd
+import sklearn
+
+from cardioguard.features import (
+    DATASET_PATH, FEATURE_COLUMNS, INPUT_BOUNDS, RAW_COLUMNS, engineer_features, load_dataset,
+)
+from cardioguard.models import RF_MODEL_PATH, STACK_MODEL_PATH
+from cardioguard.registry import ModelBundle, ModelRegistry, golden_inputs, sha256_file
+
+DEFAULT_DIR = "build/golden"
+# Low/Moderate/High risk cut points and the predicted-class boundary used by the app
+APP_THRESHOLDS = (0.3, 0.5, 0.6)
+SOURCES = ("dataset", "grid", "registry")
+
+
+def grid_records():
+    # Every corner of the form: 2 ** 13 records
+    fields = [column for column in RAW_COLUMNS if column in INPUT_BOUNDS]
+    return pd.DataFrame(
+        [dict(zip(fields, corner)) for corner in itertools.product(*(INPUT_BOUNDS[f] for f in fields))],
+        columns=RAW_COLUMNS,
+    )
+
+
+def corpus_inputs(dataset_path=DATASET_PATH):
+    # (features, source) with source indexing SOURCES
+    dataset, _ = load_dataset(dataset_path)
+    parts = [engineer_features(dataset), engineer_features(grid_records()), golden_inputs()]
+    features = pd.concat(parts, ignore_index=True)[FEATURE_COLUMNS]
+    source = np.repeat(np.arange(len(parts)), [len(part) for part in parts])
+    return features, source
+
+
+def sklearn_engine(bundle, features):
+    return bundle.rf.predict_proba(features)[:, 1], bundle.stack.predict_proba(features)[:, 1]
+
+
+def dispersion_engine(bundle, features):
+    from cardioguard.uncertainty import score_columns
+
+    scores = score_columns(bundle, features)
+    return scores["rf_prob"], scores["stack_prob"]
+
+
+def batch_engine(bundle, features):
+    from cardioguard.batch import score_matrix
+
+    scores = score_matrix(features, bundle=bundle)
+    return scores["rf_prob"].to_numpy(), scores["stack_prob"].to_numpy()
+
+
+ENGINES = {"sklearn": sklearn_engine, "dispersion": dispersion_engine, "batch": batch_engine}
+
+
+def load_bundle(rf_path=None, stack_path=None, version=None):
+    if version:
+        return ModelRegistry().load_version(version), {"version": version}
+    rf_path, stack_path = rf_path or RF_MODEL_PATH, stack_path or STACK_MODEL_PATH
+    source = {
+        "rf": os.path.abspath(rf_path), "stack": os.path.abspath(stack_path),
+        "rf_sha256": sha256_file(rf_path), "stack_sha256": sha256_file(stack_path),
+    }
+    return ModelBundle("golden", joblib.load(rf_path), joblib.load(stack_path)), source
+
+
+def build(directory=DEFAULT_DIR, rf_path=None, stack_path=None, version=None, dataset_path=DATASET_PATH):
+    bundle, models = load_bundle(rf_path, stack_path, version)
+    features, source = corpus_inputs(dataset_path)
+    rf, stack = sklearn_engine(bundle, features)
+    os.makedirs(directory, exist_ok=True)
+    np.savez_compressed(
+        os.path.join(directory, "golden.npz"),
+        features=features.to_numpy(dtype=np.float64), source=source, rf=rf, stack=stack,
+    )
+    meta = {
+        "created": time.time(),
+        "models": models,
+        "sklearn": sklearn.__version__,
+        "rows": {name: int(np.sum(source == i)) for i, name in enumerate(SOURCES)},
+        "features": FEATURE_COLUMNS,
+    }
+    with open(os.path.join(directory, "golden.json"), "w") as f:
+        json.dump(meta, f, indent=2)
+    return meta
+
+
+def load_corpus(directory=DEFAULT_DIR):
+    with open(os.path.join(directory, "golden.json")) as f:
+        meta = json.load(f)
+    with np.load(os.path.join(directory, "golden.npz")) as arrays:
+        corpus = {name: arrays[name] for name in arrays.files}
+    corpus["features"] = pd.DataFrame(corpus["features"], columns=meta["features"])
+    return corpus, meta
+
+
+def compare(reference, candidate, source, thresholds=APP_THRESHOLDS):
+    deviation = np.abs(np.asarray(candidate, dtype=np.float64) - reference)
+    worst = int(np.argmax(deviation))
+    return {
+        "max_deviation": float(deviation[worst]),
+        "mean_deviation": float(deviation.mean()),
+        "worst_row": worst,
+        "worst_source": SOURCES[int(source[worst])],
+        "flips": {f"{t:g}": int(np.sum((reference >= t) != (candidate >= t))) for t in thresholds},
+    }
+
+
+def check(corpus, bundle, engine="sklearn"):
+    started = time.perf_counter()
+    rf, stack = ENGINES[engine](bundle, corpus["features"])
+    seconds = time.perf_counter() - started
+    return {
+        "engine": engine,
+        "rows": len(corpus["source"]),
+        "seconds": seconds,
+        "rf": compare(corpus["rf"], rf, corpus["source"]),
+        "stack": compare(corpus["stack"], stack, corpus["source"]),
+    }
+
+
+def _format_report(report, tolerance):
+    lines = [f"engine={report['engine']} rows={report['rows']} ({report['seconds']:.2f}s)"]
+    header = f"{'model':<6}{'max dev':>10}{'mean dev':>10}" + "".join(f"{'flips@' + t:>12}" for t in report["rf"]["flips"])
+    lines.append(header)
+    for name in ("rf", "stack"):
+        result = report[name]
+        lines.append(
+            f"{name:<6}{result['max_deviation']:>10.2e}{result['mean_deviation']:>10.2e}"
+            + "".join(f"{count:>12}" for count in result["flips"].values())
+            + ("" if result["max_deviation"] <= tolerance else f"  worst: row {result['worst_row']} ({result['worst_source']})")
+        )
+    return "\n".join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Build a golden prediction corpus and check candidates against it.")
+    parser.add_argument("--dir", default=DEFAULT_DIR)
+    commands = parser.add_subparsers(dest="command", required=True)
+    for name, help_text in (("build", "score the corpus with the reference models"),
+                            ("check", "replay the corpus through a candidate")):
+        command = commands.add_parser(name, help=help_text)
+        command.add_argument("--rf", help=f"forest pickle (default {RF_MODEL_PATH})")
+        command.add_argument("--stack", help=f"stacking pickle (default {STACK_MODEL_PATH})")
+        command.add_argument("--version", help="use a registry version instead of pickle paths")
+    check_parser = commands.choices["check"]
+    check_parser.add_argument("--engine", choices=sorted(ENGINES), default="sklearn")
+    check_parser.add_argument("--tolerance", type=float, default=1e-9, help="largest acceptable absolute deviation")
+    check_parser.add_argument("--max-flips", type=int, help="largest acceptable flips at any threshold (default: report only)")
+    check_parser.add_argument("--json", action="store_true", help="print the report as JSON")
+    args = parser.parse_args(argv)
+
+    if args.command == "build":
+        meta = build(args.dir, args.rf, args.stack, args.version)
+        print(f"golden corpus in {args.dir}: {meta['rows']}")
+        return 0
+
+    corpus, meta = load_corpus(args.dir)
+    if meta["sklearn"] != sklearn.__version__:
+        print(f"note: corpus built with scikit-learn {meta['sklearn']}, running {sklearn.__version__}", file=sys.stderr)
+    bundle, _ = load_bundle(args.rf, args.stack, args.version)
+    report = check(corpus, bundle, args.engine)
+    print(json.dumps(report, indent=2) if args.json else _format_report(report, args.tolerance))
+    failed = any(report[name]["max_deviation"] > args.tolerance for name in ("rf", "stack"))
+    if args.max_flips is not None:
+        failed |= any(count > args.max_flips for name in ("rf", "stack") for count in report[name]["flips"].values())
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
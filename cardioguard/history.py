@@ -0,0 +1,233 @@
+# Persistent assessment history (SQLite, WAL) with a batched background writer
+import json
+import logging
+import queue
+import sqlite3
+import threading
+import time
+
+import pandas as pd
+
+from cardioguard.trends import bucket_start
+
+log = logging.getLogger(__name__)
+
+ROLLUP_PERIODS = ("week", "month")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS assessments (
+    id INTEGER PRIMARY KEY,
+    user_id TEXT NOT NULL,
+    ts REAL NOT NULL,
+    inputs TEXT NOT NULL,
+    rf_prob REAL NOT NULL,
+    stack_prob REAL NOT NULL,
+    risk_level TEXT NOT NULL,
+    checklist TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_assessments_user_ts ON assessments (user_id, ts);
+CREATE TABLE IF NOT EXISTS checklists (
+    user_id TEXT NOT NULL,
+    risk_level TEXT NOT NULL,
+    items TEXT NOT NULL,
+    updated REAL NOT NULL,
+    PRIMARY KEY (user_id, risk_level)
+);
+CREATE TABLE IF NOT EXISTS rollups (
+    user_id TEXT NOT NULL,
+    period TEXT NOT NULL,
+    bucket REAL NOT NULL,
+    n INTEGER NOT NULL,
+    stack_sum REAL NOT NULL,
+    stack_min REAL NOT NULL,
+    stack_max REAL NOT NULL,
+    rf_sum REAL NOT NULL,
+    PRIMARY KEY (user_id, period, bucket)
+);
+"""
+
+_INSERT_ASSESSMENT = (
+    "INSERT INTO assessments (user_id, ts, inputs, rf_prob, stack_prob, risk_level, checklist) "
+    "VALUES (?, ?, ?, ?, ?, ?, ?)"
+)
+_UPSERT_CHECKLIST = (
+    "INSERT INTO checklists (user_id, risk_level, items, updated) VALUES (?, ?, ?, ?) "
+    "ON CONFLICT (user_id, risk_level) DO UPDATE SET items = excluded.items, updated = excluded.updated"
+)
+_UPSERT_ROLLUP = (
+    "INSERT INTO rollups (user_id, period, bucket, n, stack_sum, stack_min, stack_max, rf_sum) "
+    "VALUES (?, ?, ?, 1, ?, ?, ?, ?) "
+    "ON CONFLICT (user_id, period, bucket) DO UPDATE SET "
+    "n = n + 1, stack_sum = stack_sum + excluded.stack_sum, "
+    "stack_min = min(stack_min, excluded.stack_min), stack_max = max(stack_max, excluded.stack_max), "
+    "rf_sum = rf_sum + excluded.rf_sum"
+)
+
+
+# Queued by flush(): the writer commits what it has batched so far instead of waiting out flush_interval
+_FLUSH = object()
+
+
+def _rollup_rows(user_id, ts, rf_prob, stack_prob):
+    return [
+        (user_id, period, bucket_start(ts, period), stack_prob, stack_prob, stack_prob, rf_prob)
+        for period in ROLLUP_PERIODS
+    ]
+
+
+def _connect(path):
+    conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    return conn
+
+
+class HistoryStore:
+    def __init__(self, path, batch_size=64, flush_interval=0.5):
+        self.path = path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._queue = queue.Queue()
+        self._reader = _connect(path)
+        self._reader.executescript(_SCHEMA)
+        self._read_lock = threading.Lock()
+        self._backfill_rollups()
+        self.rows_written = 0
+        self.batches_written = 0
+        self.batches_failed = 0
+        self.rows_dropped = 0
+        self._writer = threading.Thread(target=self._write_loop, name="history-writer", daemon=True)
+        self._writer.start()
+
+    # Writes are queued and committed in batches by the writer thread
+    def record_assessment(self, user_id, inputs, rf_prob, stack_prob, risk_level, checklist=None, ts=None):
+        ts = time.time() if ts is None else ts
+        rf_prob, stack_prob = float(rf_prob), float(stack_prob)
+        insert = (_INSERT_ASSESSMENT, (
+            user_id,
+            ts,
+            json.dumps(inputs, sort_keys=True, default=float),
+            rf_prob,
+            stack_prob,
+            risk_level,
+            None if checklist is None else json.dumps(checklist),
+        ))
+        # Weekly/monthly aggregates are maintained on write so trend views never scan raw rows;
+        # they are queued with the insert as one unit so a batch never commits one without the other
+        rollups = [(_UPSERT_ROLLUP, row) for row in _rollup_rows(user_id, ts, rf_prob, stack_prob)]
+        self._queue.put([insert, *rollups])
+
+    def save_checklist(self, user_id, risk_level, items):
+        self._queue.put([(_UPSERT_CHECKLIST, (user_id, risk_level, json.dumps(list(items)), time.time()))])
+
+    def flush(self):
+        self._queue.put(_FLUSH)
+        self._queue.join()
+
+    def _write_loop(self):
+        conn = None
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size and batch[-1] is not _FLUSH:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            writes = [item for item in batch if item is not _FLUSH]
+            try:
+                if writes:
+                    conn = conn or _connect(self.path)
+                    with conn:
+                        for unit in writes:
+                            for statement, params in unit:
+                                conn.execute(statement, params)
+                    self.rows_written += sum(len(unit) for unit in writes)
+                    self.batches_written += 1
+            except Exception:
+                # A locked or full database loses this batch, not the writer: flush() and reads must not hang
+                log.exception("history batch of %d writes dropped", len(writes))
+                self.batches_failed += 1
+                self.rows_dropped += sum(len(unit) for unit in writes)
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+    # Reads see queued writes: pending work is flushed first
+    def history(self, user_id, since=None, until=None, limit=None):
+        if self._queue.unfinished_tasks:
+            self.flush()
+        where = "user_id = ?"
+        params = [user_id]
+        if since is not None:
+            where += " AND ts >= ?"
+            params.append(since)
+        if until is not None:
+            where += " AND ts < ?"
+            params.append(until)
+        # Newest-first with LIMIT keeps "last N" queries on the (user_id, ts) index
+        sql = f"SELECT ts, rf_prob, stack_prob, risk_level FROM assessments WHERE {where} ORDER BY ts DESC"
+        if limit is not None:
+            sql += " LIMIT ?"
+            params.append(int(limit))
+        with self._read_lock:
+            rows = self._reader.execute(sql, params).fetchall()
+        rows.reverse()
+        frame = pd.DataFrame(rows, columns=["ts", "rf_prob", "stack_prob", "risk_level"])
+        frame["timestamp"] = pd.to_datetime(frame["ts"], unit="s")
+        return frame
+
+    def rollup(self, user_id, period):
+        if period not in ROLLUP_PERIODS:
+            raise ValueError(f"Unknown rollup period: {period!r}")
+        if self._queue.unfinished_tasks:
+            self.flush()
+        with self._read_lock:
+            rows = self._reader.execute(
+                "SELECT bucket, n, stack_sum / n, stack_min, stack_max, rf_sum / n FROM rollups "
+                "WHERE user_id = ? AND period = ? ORDER BY bucket",
+                (user_id, period),
+            ).fetchall()
+        frame = pd.DataFrame(rows, columns=["bucket", "n", "stack_mean", "stack_min", "stack_max", "rf_mean"])
+        frame["timestamp"] = pd.to_datetime(frame["bucket"], unit="s")
+        return frame
+
+    def count(self, user_id):
+        if self._queue.unfinished_tasks:
+            self.flush()
+        with self._read_lock:
+            return self._reader.execute(
+                "SELECT COUNT(*) FROM assessments WHERE user_id = ?", (user_id,)
+            ).fetchone()[0]
+
+    def _backfill_rollups(self):
+        # One-off migration for stores created before rollups existed
+        with self._read_lock:
+            if self._reader.execute("SELECT 1 FROM rollups LIMIT 1").fetchone():
+                return
+            rows = self._reader.execute("SELECT user_id, ts, rf_prob, stack_prob FROM assessments")
+            with self._reader:
+                for user_id, ts, rf_prob, stack_prob in rows.fetchall():
+                    self._reader.executemany(_UPSERT_ROLLUP, _rollup_rows(user_id, ts, rf_prob, stack_prob))
+
+    def checklist(self, user_id, risk_level):
+        if self._queue.unfinished_tasks:
+            self.flush()
+        with self._read_lock:
+            row = self._reader.execute(
+                "SELECT items FROM checklists WHERE user_id = ? AND risk_level = ?",
+                (user_id, risk_level),
+            ).fetchone()
+        return None if row is None else json.loads(row[0])
+
+    def stats(self):
+        return {
+            "queue_depth": self._queue.qsize(),
+            "rows_written": self.rows_written,
+            "batches_written": self.batches_written,
+            "batches_failed": self.batches_failed,
+            "rows_dropped": self.rows_dropped,
+        }
@@ -0,0 +1,170 @@
+# Memory accounting: process RSS, model footprints, cache and session sizes, tracemalloc on demand
+import gc
+import os
+import resource
+import sys
+import threading
+import time
+import tracemalloc
+import types
+from collections import defaultdict
+from collections.abc import Mapping
+
+import numpy as np
+
+_lock = threading.Lock()
+_sizers = {}
+_model_bytes = {}
+# Last measure_streamlit_caches() result; stats() reports it rather than measuring
+_cache_sizes = {"at": None, "sizes": {}}
+
+# Objects that are shared with the rest of the interpreter, not owned by what is being measured
+_SHARED = (type, types.ModuleType, types.FunctionType, types.BuiltinFunctionType, types.MethodType)
+
+
+def register_sizer(name, fn):
+    # fn() returns the bytes held by one cache or store, read only when memory stats are collected
+    with _lock:
+        _sizers[name] = fn
+
+
+def process_rss():
+    # Current resident set size; peak RSS where /proc is unavailable
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        scale = 1 if sys.platform == "darwin" else 1024
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale
+
+
+def _tree_bytes(tree):
+    # sklearn's Cython Tree keeps its node and value arrays outside the Python object graph
+    from sklearn.tree._tree import NODE_DTYPE
+
+    return tree.capacity * (NODE_DTYPE.itemsize + tree.n_outputs * tree.max_n_classes * 8)
+
+
+def object_bytes(obj):
+    # Approximate footprint of everything reachable from obj that is not shared interpreter state
+    from sklearn.tree._tree import Tree
+
+    seen = set()
+    pending = [obj]
+    total = 0
+    while pending:
+        item = pending.pop()
+        if id(item) in seen or isinstance(item, _SHARED):
+            continue
+        seen.add(id(item))
+        total += sys.getsizeof(item)
+        if isinstance(item, np.ndarray):
+            # getsizeof already includes the buffer of an array that owns its data
+            if item.base is not None:
+                pending.append(item.base)
+            continue
+        if isinstance(item, Tree):
+            total += _tree_bytes(item)
+            continue
+        pending.extend(gc.get_referents(item))
+    return total
+
+
+def model_bytes(bundle):
+    # Measured once per loaded model object; models are immutable once published
+    sizes = {}
+    for name in ("rf", "stack"):
+        model = getattr(bundle, name, None) if bundle is not None else None
+        if model is None:
+            continue
+        key = (bundle.version, name, id(model))
+        with _lock:
+            size = _model_bytes.get(key)
+        if size is None:
+            size = object_bytes(model)
+            with _lock:
+                for stale in [k for k in _model_bytes if k[1] == name]:
+                    del _model_bytes[stale]
+                _model_bytes[key] = size
+        sizes[name] = size
+    return sizes
+
+
+def streamlit_caches():
+    # Bytes per Streamlit cache, as reported by the runtime's own stats providers
+    try:
+        from streamlit.runtime import Runtime
+    except ImportError:
+        return {}
+    if not Runtime.exists():
+        return {}
+    stats = Runtime.instance().stats_mgr.get_stats()
+    if isinstance(stats, Mapping):
+        stats = [stat for family in stats.values() for stat in family]
+    totals = defaultdict(int)
+    for stat in stats:
+        if hasattr(stat, "byte_length"):
+            totals[(stat.category_name, stat.cache_name)] += stat.byte_length
+    return totals
+
+
+def measure_streamlit_caches():
+    # asizeof over every cache entry (models included) and every session: seconds, so on request only
+    sizes = streamlit_caches()
+    with _lock:
+        _cache_sizes.update(at=time.time(), sizes=sizes)
+    return sizes
+
+
+def stats(bundle=None):
+    # Cheap enough for every metrics scrape: Streamlit cache sizes are the last measured ones, if any
+    with _lock:
+        caches, measured_at = _cache_sizes["sizes"], _cache_sizes["at"]
+    data = {
+        "rss_bytes": process_rss(),
+        "models": model_bytes(bundle),
+        "st_cache_data": {name or "-": size for (category, name), size in caches.items() if category == "st_cache_data"},
+        "st_cache_resource": {
+            name or "-": size for (category, name), size in caches.items() if category == "st_cache_resource"
+        },
+        "st_session_state_bytes": sum(size for (category, _), size in caches.items() if category == "st_session_state"),
+        "caches_measured_at": measured_at,
+        "tracing": tracemalloc.is_tracing(),
+    }
+    with _lock:
+        sizers = dict(_sizers)
+    data["stores"] = {}
+    for name, fn in sizers.items():
+        try:
+            data["stores"][name] = fn()
+        except Exception:
+            data["stores"][name] = -1
+    if tracemalloc.is_tracing():
+        current, peak = tracemalloc.get_traced_memory()
+        data["traced_bytes"], data["traced_peak_bytes"] = current, peak
+    return data
+
+
+def start_tracing(frames=10):
+    if not tracemalloc.is_tracing():
+        tracemalloc.start(frames)
+
+
+def stop_tracing():
+    if tracemalloc.is_tracing():
+        tracemalloc.stop()
+
+
+def top_allocations(limit=15, group_by="lineno"):
+    # [(location, bytes, count)] from a snapshot taken now; tracing must have been started
+    if not tracemalloc.is_tracing():
+        return []
+    snapshot = tracemalloc.take_snapshot().filter_traces([
+        tracemalloc.Filter(False, tracemalloc.__file__),
+        tracemalloc.Filter(False, "<frozen importlib._bootstrap*>"),
+    ])
+    rows = []
+    for stat in snapshot.statistics(group_by)[:limit]:
+        frame = stat.traceback[0]
+        rows.append((f"{frame.filename}:{frame.lineno}", stat.size, stat.count))
+    return rows
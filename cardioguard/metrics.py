@@ -0,0 +1,125 @@
+# In-process metrics registry: counters, gauges and pluggable collectors
+import json
+import threading
+from collections import defaultdict, deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+_lock = threading.Lock()
+_counters = defaultdict(float)
+_gauges = {}
+_collectors = {}
+_server = None
+# Recent observations per name for percentiles; appending is O(1) and bounded
+OBSERVATION_WINDOW = 1024
+_observations = defaultdict(lambda: deque(maxlen=OBSERVATION_WINDOW))
+_observed_total = defaultdict(int)
+
+
+def inc(name, value=1):
+    with _lock:
+        _counters[name] += value
+
+
+def set_gauge(name, value):
+    with _lock:
+        _gauges[name] = value
+
+
+def observe(name, value):
+    with _lock:
+        _observations[name].append(value)
+        _observed_total[name] += 1
+
+
+def _percentile(ordered, q):
+    # Nearest rank on an already sorted list
+    return ordered[min(len(ordered) - 1, int(q / 100 * len(ordered)))]
+
+
+def percentiles(name=None, qs=(50, 90, 99)):
+    # {name: {count, p50, p90, p99, max}} over the last OBSERVATION_WINDOW observations
+    with _lock:
+        names = [name] if name is not None else list(_observations)
+        windows = {key: (sorted(_observations[key]), _observed_total[key]) for key in names if _observations[key]}
+    return {
+        key: {"count": total, **{f"p{q}": _percentile(values, q) for q in qs}, "max": values[-1]}
+        for key, (values, total) in windows.items()
+    }
+
+
+def cache_ratios():
+    # From cache_<name>_calls / cache_<name>_misses counters, for caches without their own stats
+    with _lock:
+        counters = dict(_counters)
+    ratios = {}
+    for key, calls in counters.items():
+        if key.startswith("cache_") and key.endswith("_calls") and calls:
+            name = key[len("cache_"):-len("_calls")]
+            ratios[name] = {"calls": calls, "hit_ratio": 1 - counters.get(f"cache_{name}_misses", 0) / calls}
+    return ratios
+
+
+def register_collector(name, fn):
+    # fn() returns a flat dict of numbers, read only when metrics are scraped
+    with _lock:
+        _collectors[name] = fn
+
+
+def snapshot():
+    with _lock:
+        data = {"counters": dict(_counters), "gauges": dict(_gauges)}
+        collectors = dict(_collectors)
+    data["latency"] = percentiles()
+    for name, fn in collectors.items():
+        try:
+            data[name] = fn()
+        except Exception as exc:
+            data[name] = {"error": repr(exc)}
+    return data
+
+
+def _flatten(prefix, value, out):
+    if isinstance(value, dict):
+        for key, item in value.items():
+            _flatten(f"{prefix}_{key}" if prefix else str(key), item, out)
+    elif isinstance(value, (int, float)) and not isinstance(value, bool):
+        out.append((prefix, value))
+    elif isinstance(value, bool):
+        out.append((prefix, int(value)))
+
+
+def render_prometheus():
+    samples = []
+    _flatten("cardioguard", snapshot(), samples)
+    lines = []
+    for name, value in samples:
+        safe = "".join(c if c.isalnum() or c == "_" else "_" for c in name)
+        lines.append(f"{safe} {value}")
+    return "\n".join(lines) + "\n"
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path == "/metrics":
+            body, content_type = render_prometheus().encode(), "text/plain; version=0.0.4"
+        elif self.path == "/metrics.json":
+            body, content_type = json.dumps(snapshot(), default=str).encode(), "application/json"
+        else:
+            self.send_error(404)
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_metrics_server(port, host="127.0.0.1"):
+    global _server
+    if _server is None:
+        _server = ThreadingHTTPServer((host, port), _MetricsHandler)
+        threading.Thread(target=_server.serve_forever, name="metrics-http", daemon=True).start()
+    return _server
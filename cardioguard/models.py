@@ -0,0 +1,59 @@
+# Model loading outside of Streamlit, with warm-up and pre-fork sharing
+import logging
+import os
+import time
+
+import joblib
+
+from cardioguard.features import DEFAULT_RECORD, features_from_record
+
+log = logging.getLogger(__name__)
+
+RF_MODEL_PATH = "Tuned_random_forest_model.pkl"
+STACK_MODEL_PATH = "Stacking_classifier_model.pkl"
+LEGACY_PATHS = {"rf": RF_MODEL_PATH, "stack": STACK_MODEL_PATH}
+
+# Model registry loaded by the pre-fork launcher before workers start; inherited copy-on-write
+_preloaded = None
+
+# Startup timeline, relative to the first time this module is imported (the first script run)
+_started = time.perf_counter()
+_startup = {}
+
+
+def load_model(path, base_dir="."):
+    started = time.perf_counter()
+    model = joblib.load(os.path.join(base_dir, path))
+    log.info("Loaded %s in %.2fs", path, time.perf_counter() - started)
+    return model
+
+
+def load_model_pair(base_dir="."):
+    return load_model(RF_MODEL_PATH, base_dir), load_model(STACK_MODEL_PATH, base_dir)
+
+
+def warm_up(*models):
+    # One throwaway prediction so the first real request skips lazy initialisation
+    sample = features_from_record(DEFAULT_RECORD)
+    for model in models:
+        model.predict_proba(sample)
+
+
+def set_preloaded(registry):
+    global _preloaded
+    _preloaded = registry
+
+
+def get_preloaded():
+    return _preloaded
+
+
+def mark_startup(event):
+    # Only the first occurrence counts (first paint, first prediction, ...)
+    if event not in _startup:
+        _startup[event] = time.perf_counter() - _started
+        log.info("startup: %s after %.2fs", event, _startup[event])
+
+
+def startup_stats():
+    return dict(_startup)
@@ -0,0 +1,78 @@
+# Websocket payload per rerun, measured on the scripted load-test path
+#
+#   python -m cardioguard.payload [--script app.py] [--reruns 5]
+#
+# Replays first load, an Analyze click and idle reruns through Streamlit's
+# AppTest harness and reports the serialized ForwardMsg bytes each step sends.
+import argparse
+import os
+import sys
+import time
+
+from streamlit.testing.v1 import AppTest
+from streamlit.testing.v1.local_script_runner import LocalScriptRunner
+
+
+class _PayloadRecorder:
+    def __init__(self):
+        self.steps = []
+        self._original_run = LocalScriptRunner.run
+
+    def __enter__(self):
+        recorder = self
+
+        def run(runner, *args, **kwargs):
+            tree = recorder._original_run(runner, *args, **kwargs)
+            messages = runner.forward_msgs()
+            recorder.steps.append((len(messages), sum(msg.ByteSize() for msg in messages)))
+            return tree
+
+        LocalScriptRunner.run = run
+        return self
+
+    def __exit__(self, *exc):
+        LocalScriptRunner.run = self._original_run
+
+
+def model_registry_warming(app):
+    return any("warming up" in caption.value for caption in app.caption)
+
+
+def measure(script, reruns=5, timeout=60):
+    results = []
+    with _PayloadRecorder() as recorder:
+        app = AppTest.from_file(os.path.abspath(script), default_timeout=timeout).run()
+        results.append(("first load", *recorder.steps[-1]))
+        # Models load in the background; wait for the Analyze button before the scripted click
+        deadline = time.monotonic() + timeout
+        while not any("Analyze" in button.label for button in app.button) or model_registry_warming(app):
+            if time.monotonic() > deadline:
+                raise TimeoutError("models did not finish loading")
+            time.sleep(0.25)
+            app.run()
+        analyze = next(button for button in app.button if "Analyze" in button.label)
+        analyze.click().run()
+        results.append(("analyze", *recorder.steps[-1]))
+        for i in range(reruns):
+            app.run()
+            results.append((f"idle rerun {i + 1}", *recorder.steps[-1]))
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Measure websocket bytes per rerun.")
+    parser.add_argument("--script", default="app.py")
+    parser.add_argument("--reruns", type=int, default=5)
+    args = parser.parse_args(argv)
+    results = measure(args.script, args.reruns)
+    print(f"{'step':<16}{'messages':>10}{'bytes':>12}")
+    for step, count, size in results:
+        print(f"{step:<16}{count:>10}{size:>12,}")
+    idle = [size for step, _, size in results if step.startswith("idle")]
+    if idle:
+        print(f"mean idle rerun: {sum(idle) / len(idle):,.0f} bytes")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
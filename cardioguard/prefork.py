@@ -0,0 +1,147 @@
+# Pre-fork launcher: load and warm the models once, then fork workers that share them
+#
+#   python -m cardioguard.prefork --workers 4 --base-port 8501
+#
+# Each worker serves the Streamlit app on base-port + index; put a sticky
+# load balancer in front. Linux only (fork, /proc).
+import argparse
+import gc
+import logging
+import os
+import signal
+import sys
+import time
+
+from cardioguard import models
+from cardioguard.registry import ModelRegistry
+
+log = logging.getLogger("cardioguard.prefork")
+
+
+def _run_streamlit(index, args):
+    from streamlit.web import cli as stcli
+
+    sys.argv = [
+        "streamlit", "run", args.app,
+        "--server.port", str(args.base_port + index),
+        "--server.headless", "true",
+        "--server.fileWatcherType", "none",
+    ]
+    return stcli.main()
+
+
+WORKER_TARGETS = {"streamlit": _run_streamlit}
+
+
+def memory_usage(pid):
+    # Unique (private) RSS is what each worker costs on top of the shared parent pages
+    usage = {}
+    try:
+        with open(f"/proc/{pid}/smaps_rollup") as f:
+            for line in f:
+                key, _, rest = line.partition(":")
+                if key in ("Rss", "Pss", "Private_Clean", "Private_Dirty", "Shared_Clean", "Shared_Dirty"):
+                    usage[key] = int(rest.split()[0]) * 1024
+    except OSError:
+        return None
+    usage["Uss"] = usage.get("Private_Clean", 0) + usage.get("Private_Dirty", 0)
+    return usage
+
+
+def _format_mb(value):
+    return f"{value / 2**20:.1f}MB"
+
+
+def report_memory(children):
+    for index, pid in sorted(children.items(), key=lambda item: item[1]):
+        usage = memory_usage(pid)
+        if usage is None:
+            continue
+        log.info(
+            "worker %d pid=%d uss=%s pss=%s rss=%s",
+            index, pid, _format_mb(usage["Uss"]), _format_mb(usage["Pss"]), _format_mb(usage["Rss"]),
+        )
+
+
+def _spawn(index, args):
+    pid = os.fork()
+    if pid == 0:
+        signal.signal(signal.SIGTERM, signal.SIG_DFL)
+        signal.signal(signal.SIGINT, signal.SIG_DFL)
+        code = 1
+        try:
+            code = WORKER_TARGETS[args.target](index, args) or 0
+        finally:
+            os._exit(code)
+    log.info("started worker %d pid=%d", index, pid)
+    return pid
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Load the models once, then fork app workers that share them.")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 2)
+    parser.add_argument("--base-port", type=int, default=8501)
+    parser.add_argument("--app", default="app.py")
+    parser.add_argument("--target", choices=sorted(WORKER_TARGETS), default="streamlit")
+    parser.add_argument("--report-interval", type=float, default=60.0)
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(name)s %(message)s")
+
+    if not hasattr(os, "fork"):
+        parser.error("the pre-fork launcher needs os.fork (Linux/macOS)")
+
+    # Workers start their own registry watcher; threads do not survive fork
+    started = time.perf_counter()
+    registry = ModelRegistry()
+    registry.refresh()
+    models.set_preloaded(registry)
+    log.info(
+        "model version %s loaded and warmed in %.2fs",
+        registry.current().version, time.perf_counter() - started,
+    )
+
+    # Keep the GC from touching (and so copying) the inherited model pages
+    gc.collect()
+    gc.freeze()
+
+    children = {index: _spawn(index, args) for index in range(args.workers)}
+    stopping = False
+
+    def _stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+        for pid in children.values():
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGTERM, _stop)
+    signal.signal(signal.SIGINT, _stop)
+
+    parent = memory_usage(os.getpid())
+    if parent:
+        log.info("parent pid=%d rss=%s", os.getpid(), _format_mb(parent["Rss"]))
+
+    next_report = time.monotonic() + args.report_interval
+    while children:
+        try:
+            pid, status = os.waitpid(-1, os.WNOHANG)
+        except ChildProcessError:
+            break
+        if pid:
+            index = next(i for i, p in children.items() if p == pid)
+            del children[index]
+            log.warning("worker %d pid=%d exited with status %d", index, pid, status)
+            if not stopping:
+                children[index] = _spawn(index, args)
+            continue
+        if time.monotonic() >= next_report:
+            report_memory(children)
+            next_report = time.monotonic() + args.report_interval
+        time.sleep(0.5)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
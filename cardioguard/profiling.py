@@ -0,0 +1,157 @@
+# Opt-in per-rerun profiling: cProfile (.pstats) or a stack sampler (.folded flamegraph input)
+#
+# Enable for every session with CARDIOGUARD_PROFILE=cprofile|sample, or for one
+# admin session (see CARDIOGUARD_ADMIN_TOKEN) with ?profile=cprofile|sample. Only one
+# rerun at a time runs under cProfile; concurrent ones fall back to the stack
+# sampler. Files go to data/profiles (override with
+# CARDIOGUARD_PROFILE_DIR) and only the newest CARDIOGUARD_PROFILE_KEEP are kept.
+# Render .folded files with flamegraph.pl or speedscope; open .pstats with snakeviz.
+#
+# Independently of that, every rerun records a few coarse spans (tab renders, model
+# calls) at the cost of two perf_counter() calls each. Reruns slower than
+# CARDIOGUARD_SLOW_RERUN_MS keep their spans in a short in-memory list for the Admin tab.
+import cProfile
+import os
+import sys
+import threading
+import time
+from collections import Counter, deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from cardioguard import metrics
+from cardioguard.settings import data_path, env_float, env_int
+
+SLOW_RERUN_SECONDS = env_float("CARDIOGUARD_SLOW_RERUN_MS", 1000) / 1000
+_slow_reruns = deque(maxlen=env_int("CARDIOGUARD_SLOW_RERUN_KEEP", 20))
+_slow_lock = threading.Lock()
+_trace = ContextVar("cardioguard_rerun_trace", default=None)
+
+MODES = ("cprofile", "sample")
+_ALIASES = {"1": "cprofile", "true": "cprofile", "yes": "cprofile"}
+_cprofile_lock = threading.Lock()
+
+
+def requested_mode(query_value=None):
+    value = query_value or os.environ.get("CARDIOGUARD_PROFILE")
+    if not value:
+        return None
+    value = str(value).strip().lower()
+    value = _ALIASES.get(value, value)
+    return value if value in MODES else None
+
+
+def profile_dir():
+    directory = os.environ.get("CARDIOGUARD_PROFILE_DIR") or data_path("profiles")
+    os.makedirs(directory, exist_ok=True)
+    return directory
+
+
+def _rotate(directory, keep):
+    entries = sorted(
+        (entry for entry in os.scandir(directory) if entry.name.endswith((".pstats", ".folded"))),
+        key=lambda entry: entry.stat().st_mtime,
+    )
+    for entry in entries[:-keep] if keep > 0 else entries:
+        try:
+            os.remove(entry.path)
+        except OSError:
+            pass
+
+
+class StackSampler:
+    def __init__(self, thread_id, interval):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="rerun-sampler", daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                frame = frame.f_back
+            if stack:
+                self.stacks[";".join(reversed(stack))] += 1
+
+    def write_folded(self, path):
+        with open(path, "w") as f:
+            for stack, count in self.stacks.most_common():
+                f.write(f"{stack} {count}\n")
+
+
+@contextmanager
+def profile_rerun(mode, label="rerun"):
+    directory = profile_dir()
+    now = time.time()
+    stamp = time.strftime("%Y%m%d-%H%M%S", time.localtime(now)) + f".{int(now * 1000) % 1000:03d}"
+    stem = os.path.join(directory, f"{stamp}-{label}")
+    # One cProfile at a time per process (Python 3.12+ raises on a second enable()); others are sampled
+    if mode == "cprofile" and _cprofile_lock.acquire(blocking=False):
+        try:
+            profiler = cProfile.Profile()
+            profiler.enable()
+            try:
+                yield
+            finally:
+                profiler.disable()
+                profiler.dump_stats(stem + ".pstats")
+                _rotate(directory, env_int("CARDIOGUARD_PROFILE_KEEP", 50))
+        finally:
+            _cprofile_lock.release()
+        return
+    sampler = StackSampler(threading.get_ident(), env_float("CARDIOGUARD_PROFILE_INTERVAL", 0.005))
+    sampler.start()
+    try:
+        yield
+    finally:
+        sampler.stop()
+        sampler.write_folded(stem + ".folded")
+        _rotate(directory, env_int("CARDIOGUARD_PROFILE_KEEP", 50))
+
+
+@contextmanager
+def trace_rerun(label="rerun"):
+    # Times the whole rerun into the rerun_seconds percentiles and keeps the spans of slow ones
+    started = time.perf_counter()
+    spans = []
+    token = _trace.set((started, spans))
+    try:
+        yield
+    finally:
+        _trace.reset(token)
+        total = time.perf_counter() - started
+        metrics.observe("rerun_seconds", total)
+        if total >= SLOW_RERUN_SECONDS:
+            with _slow_lock:
+                _slow_reruns.append({"at": time.time(), "label": label, "seconds": total, "spans": spans})
+
+
+@contextmanager
+def span(name):
+    # (name, offset into the rerun, seconds); a no-op outside trace_rerun
+    trace = _trace.get()
+    if trace is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        trace[1].append((name, started - trace[0], time.perf_counter() - started))
+
+
+def slow_reruns():
+    with _slow_lock:
+        return list(_slow_reruns)
@@ -0,0 +1,446 @@
+# Versioned model registry with background loading and atomic hot swap
+#
+#   model_registry/
+#     ACTIVE                 <- name of the version being served (replaced atomically)
+#     <version>/
+#       manifest.json        <- checksums, feature list, metrics, golden inputs and outputs
+#       rf.pkl
+#       stack.pkl
+#
+#   python -m cardioguard.registry publish --rf rf.pkl --stack stack.pkl --metrics metrics.json --activate
+#   python -m cardioguard.registry activate <version>
+#   python -m cardioguard.registry list
+import argparse
+import hashlib
+import importlib
+import json
+import logging
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timezone
+
+import joblib
+import numpy as np
+import pandas as pd
+
+from cardioguard import models
+from cardioguard.features import DEFAULT_RECORD, FEATURE_COLUMNS, INPUT_BOUNDS, engineer_features
+
+log = logging.getLogger(__name__)
+
+REGISTRY_DIR = os.environ.get("CARDIOGUARD_REGISTRY_DIR", "model_registry")
+LEGACY_VERSION = "legacy"
+ARTIFACTS = ("rf", "stack")
+GOLDEN_TOLERANCE = 1e-6
+PRELOAD_MODULES = ("sklearn.ensemble", "sklearn.linear_model", "sklearn.tree")
+
+
+class ModelValidationError(Exception):
+    pass
+
+
+class ModelBundle:
+    def __init__(self, version, rf, stack, manifest=None, load_seconds=0.0):
+        self.version = version
+        self.rf = rf
+        self.stack = stack
+        self.manifest = manifest or {}
+        self.load_seconds = load_seconds
+        self.loaded_at = time.time()
+
+    @property
+    def ready(self):
+        # False while a background load has published only one of the two models
+        return self.rf is not None and self.stack is not None
+
+
+def sha256_file(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def golden_records():
+    # Form defaults, every slider at its lower and upper bound, then each yes/no field flipped
+    sliders = [column for column, bounds in INPUT_BOUNDS.items() if bounds != (0, 1)]
+    flags = [column for column, bounds in INPUT_BOUNDS.items() if bounds == (0, 1)]
+    records = [dict(DEFAULT_RECORD)]
+    for column in sliders:
+        for value in INPUT_BOUNDS[column]:
+            records.append(dict(DEFAULT_RECORD, **{column: value}))
+    for flag in flags:
+        records.append(dict(DEFAULT_RECORD, **{flag: 1 - DEFAULT_RECORD[flag]}))
+    return records
+
+
+def golden_inputs(records=None):
+    return engineer_features(pd.DataFrame(golden_records() if records is None else records))
+
+
+def legacy_fingerprint():
+    # Changes when either legacy pickle is replaced
+    fingerprint = []
+    for path in models.LEGACY_PATHS.values():
+        try:
+            stat = os.stat(path)
+            fingerprint.append((stat.st_size, stat.st_mtime_ns))
+        except FileNotFoundError:
+            fingerprint.append(None)
+    return tuple(fingerprint)
+
+
+def score_golden(bundle, inputs=None):
+    inputs = golden_inputs() if inputs is None else inputs
+    return {
+        "rf": bundle.rf.predict_proba(inputs)[:, 1],
+        "stack": bundle.stack.predict_proba(inputs)[:, 1],
+    }
+
+
+def manifest_inputs(manifest):
+    # The golden rows a manifest's outputs were scored on; the current golden set when it has none
+    return golden_inputs(manifest.get("golden_inputs"))
+
+
+def validate_model(version, name, model, manifest, inputs=None):
+    manifest_features = manifest.get("features", FEATURE_COLUMNS)
+    if list(manifest_features) != FEATURE_COLUMNS:
+        raise ModelValidationError(f"{version}: feature list does not match the app's inputs")
+    inputs = manifest_inputs(manifest) if inputs is None else inputs
+    proba = model.predict_proba(inputs)
+    if proba.shape != (len(inputs), 2) or not np.all(np.isfinite(proba)):
+        raise ModelValidationError(f"{version}: {name} returned malformed probabilities")
+    if np.any(proba < 0) or np.any(proba > 1) or not np.allclose(proba.sum(axis=1), 1.0):
+        raise ModelValidationError(f"{version}: {name} probabilities are out of range")
+    expected = manifest.get("golden", {}).get(name)
+    if expected is None:
+        return
+    if "golden_inputs" not in manifest:
+        # Outputs without the rows they were scored on cannot be matched up row by row
+        log.warning("%s: manifest has golden outputs but no golden inputs; republish to check them", version)
+        return
+    expected = np.asarray(expected, dtype=float)
+    if expected.shape != (len(inputs),):
+        raise ModelValidationError(
+            f"{version}: {name} has {expected.size} golden outputs for {len(inputs)} golden inputs"
+        )
+    deviation = np.abs(proba[:, 1] - expected)
+    worst = int(np.argmax(deviation))
+    if deviation[worst] > GOLDEN_TOLERANCE:
+        raise ModelValidationError(
+            f"{version}: {name} deviates from its golden outputs by {deviation[worst]:.2e} "
+            f"on golden row {worst} {manifest['golden_inputs'][worst]}"
+        )
+
+
+def validate_bundle(bundle):
+    inputs = manifest_inputs(bundle.manifest)
+    for name in ARTIFACTS:
+        validate_model(bundle.version, name, getattr(bundle, name), bundle.manifest, inputs)
+
+
+class ModelRegistry:
+    def __init__(self, root=REGISTRY_DIR, poll_interval=5.0):
+        self.root = root
+        self.poll_interval = poll_interval
+        self._current = None
+        self._swap_lock = threading.Lock()
+        self._failed = {}
+        # legacy_fingerprint() when the legacy pickles last failed to load; retried once they change
+        self._legacy_failed_at = None
+        self._on_swap = []
+        self._watcher = None
+        self._loading = False
+        self.load_error = None
+        self.swaps = 0
+        self.history = []
+        self.part_seconds = {}
+
+    # Readers take one reference per request; a swap never mutates a bundle in use
+    def current(self):
+        return self._current
+
+    def on_swap(self, callback):
+        self._on_swap.append(callback)
+
+    def active_version(self):
+        try:
+            with open(os.path.join(self.root, "ACTIVE")) as f:
+                return f.read().strip() or None
+        except FileNotFoundError:
+            return None
+
+    def manifest(self, version):
+        if version == LEGACY_VERSION:
+            return {}
+        with open(os.path.join(self.root, version, "manifest.json")) as f:
+            return json.load(f)
+
+    def load_artifact(self, version, name, manifest=None):
+        # One model of a version: checksum, unpickle, warm up, validate
+        manifest = self.manifest(version) if manifest is None else manifest
+        if version == LEGACY_VERSION:
+            model = models.load_model(models.LEGACY_PATHS[name])
+        else:
+            artifact = manifest["artifacts"][name]
+            path = os.path.join(self.root, version, artifact["file"])
+            if sha256_file(path) != artifact["sha256"]:
+                raise ModelValidationError(f"{version}: checksum mismatch for {artifact['file']}")
+            model = joblib.load(path)
+        models.warm_up(model)
+        validate_model(version, name, model, manifest)
+        return model
+
+    def load_version(self, version):
+        started = time.perf_counter()
+        manifest = self.manifest(version)
+        loaded = {name: self.load_artifact(version, name, manifest) for name in ARTIFACTS}
+        bundle = ModelBundle(version, loaded["rf"], loaded["stack"], manifest)
+        bundle.load_seconds = time.perf_counter() - started
+        return bundle
+
+    def load_in_background(self):
+        # First load without blocking the caller: rf and stack unpickle in parallel and each
+        # is served as soon as it is ready; the pair becomes a normal bundle once both are in
+        with self._swap_lock:
+            if self._current is not None or self._loading:
+                return
+            self._loading = True
+        version = self.active_version() or LEGACY_VERSION
+        if version in self._failed:
+            version = LEGACY_VERSION
+        state = {"parts": {}, "failed": False, "legacy": legacy_fingerprint()}
+        # Unpickling imports estimator modules lazily; two threads importing the same
+        # package at once can trip the import lock's deadlock detection
+        for module in PRELOAD_MODULES:
+            importlib.import_module(module)
+        started = time.perf_counter()
+        for name in ARTIFACTS:
+            threading.Thread(
+                target=self._load_part, args=(version, name, started, state),
+                name=f"model-load-{name}", daemon=True,
+            ).start()
+
+    def _load_part(self, version, name, started, state):
+        try:
+            manifest = self.manifest(version)
+            model = self.load_artifact(version, name, manifest)
+        except Exception as exc:
+            with self._swap_lock:
+                if state["failed"]:
+                    return
+                state["failed"] = True
+                self._current = None
+            if version == LEGACY_VERSION:
+                self.load_error = f"{name}: {exc}"
+                self._legacy_failed_at = state["legacy"]
+                self._loading = False
+                log.exception("Model %s could not be loaded", name)
+                return
+            self._failed[version] = repr(exc)
+            log.error("Model version %s rejected: %s", version, exc)
+            try:
+                self._swap(self.load_version(LEGACY_VERSION))
+            except Exception as fallback:
+                self.load_error = f"{LEGACY_VERSION}: {fallback}"
+                self._legacy_failed_at = state["legacy"]
+                log.exception("Fallback to the legacy models failed")
+            finally:
+                self._loading = False
+            return
+        seconds = time.perf_counter() - started
+        with self._swap_lock:
+            if state["failed"]:
+                return
+            self.part_seconds[name] = seconds
+            state["parts"][name] = model
+            parts = dict(state["parts"])
+            complete = len(parts) == len(ARTIFACTS)
+            if not complete:
+                self._current = ModelBundle(version, parts.get("rf"), parts.get("stack"), manifest, seconds)
+        log.info("Model %s of version %s ready after %.2fs", name, version, seconds)
+        models.mark_startup(f"{name}_ready")
+        if complete:
+            self._swap(ModelBundle(version, parts["rf"], parts["stack"], manifest, seconds))
+            self._loading = False
+            models.mark_startup("models_ready")
+
+    def refresh(self):
+        # Load the ACTIVE version if it differs from the one being served
+        if self._loading:
+            return False
+        wanted = self.active_version() or LEGACY_VERSION
+        current = self._current
+        if wanted in self._failed:
+            if current is not None:
+                return False
+            # Nothing is being served: fall back to the legacy pickles
+            wanted = LEGACY_VERSION
+        if current is not None and current.version == wanted:
+            return False
+        fingerprint = legacy_fingerprint() if wanted == LEGACY_VERSION else None
+        if fingerprint is not None and fingerprint == self._legacy_failed_at:
+            # The full unpickle is not retried every poll, only once a pickle has been replaced
+            return False
+        try:
+            bundle = self.load_version(wanted)
+        except Exception as exc:
+            if wanted == LEGACY_VERSION:
+                self._legacy_failed_at = fingerprint
+                if current is None:
+                    self.load_error = f"{LEGACY_VERSION}: {exc}"
+                    raise
+                log.error("Legacy models could not be loaded: %s", exc)
+                return False
+            self._failed[wanted] = repr(exc)
+            log.error("Model version %s rejected: %s", wanted, exc)
+            return self.refresh() if current is None else False
+        self._legacy_failed_at = None
+        self.load_error = None
+        self._swap(bundle)
+        return True
+
+    def _swap(self, bundle):
+        with self._swap_lock:
+            previous = self._current
+            self._current = bundle
+            self.swaps += 1
+            self.history.append({
+                "version": bundle.version,
+                "loaded_at": bundle.loaded_at,
+                "load_seconds": round(bundle.load_seconds, 3),
+            })
+            del self.history[:-20]
+        log.info("Serving model version %s (loaded in %.2fs)", bundle.version, bundle.load_seconds)
+        if previous is not None and previous.ready:
+            for callback in self._on_swap:
+                callback(previous, bundle)
+
+    def start_watcher(self):
+        if self._watcher is None:
+            self._watcher = threading.Thread(target=self._watch, name="model-registry", daemon=True)
+            self._watcher.start()
+        return self._watcher
+
+    def _watch(self):
+        while True:
+            time.sleep(self.poll_interval)
+            try:
+                self.refresh()
+            except Exception:
+                log.exception("Model registry refresh failed")
+
+    def stats(self):
+        current = self._current
+        return {
+            "version": current.version if current else None,
+            "load_seconds": current.load_seconds if current else None,
+            "loaded_at": current.loaded_at if current else None,
+            "ready": bool(current and current.ready),
+            "part_seconds": dict(self.part_seconds),
+            "swaps": self.swaps,
+            "rejected_versions": len(self._failed),
+        }
+
+    # Publishing
+    def list_versions(self):
+        if not os.path.isdir(self.root):
+            return []
+        return sorted(
+            entry for entry in os.listdir(self.root)
+            if os.path.isfile(os.path.join(self.root, entry, "manifest.json"))
+        )
+
+    def publish(self, rf_path, stack_path, metrics=None, version=None, notes=None):
+        version = version or datetime.now(timezone.utc).strftime("v%Y%m%d-%H%M%S")
+        final = os.path.join(self.root, version)
+        if os.path.exists(final):
+            raise FileExistsError(f"Model version {version} already exists")
+        os.makedirs(self.root, exist_ok=True)
+        staging = tempfile.mkdtemp(prefix=f".{version}-", dir=self.root)
+        try:
+            artifacts = {}
+            for name, source in (("rf", rf_path), ("stack", stack_path)):
+                target = os.path.join(staging, f"{name}.pkl")
+                shutil.copyfile(source, target)
+                artifacts[name] = {"file": f"{name}.pkl", "sha256": sha256_file(target)}
+            bundle = ModelBundle(
+                version,
+                joblib.load(os.path.join(staging, "rf.pkl")),
+                joblib.load(os.path.join(staging, "stack.pkl")),
+                {"features": FEATURE_COLUMNS},
+            )
+            validate_bundle(bundle)
+            records = golden_records()
+            golden = score_golden(bundle, golden_inputs(records))
+            manifest = {
+                "version": version,
+                "created": datetime.now(timezone.utc).isoformat(),
+                "artifacts": artifacts,
+                "features": FEATURE_COLUMNS,
+                "metrics": metrics or {},
+                "golden_inputs": records,
+                "golden": {name: values.tolist() for name, values in golden.items()},
+                "notes": notes,
+            }
+            with open(os.path.join(staging, "manifest.json"), "w") as f:
+                json.dump(manifest, f, indent=2)
+            os.replace(staging, final)
+        except BaseException:
+            shutil.rmtree(staging, ignore_errors=True)
+            raise
+        return version
+
+    def activate(self, version):
+        if version != LEGACY_VERSION and version not in self.list_versions():
+            raise KeyError(f"Unknown model version {version}")
+        os.makedirs(self.root, exist_ok=True)
+        pointer = os.path.join(self.root, "ACTIVE")
+        with open(pointer + ".tmp", "w") as f:
+            f.write(version + "\n")
+        os.replace(pointer + ".tmp", pointer)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Manage versioned CardioGuard models.")
+    parser.add_argument("--root", default=REGISTRY_DIR)
+    commands = parser.add_subparsers(dest="command", required=True)
+    publish = commands.add_parser("publish", help="add a new model version")
+    publish.add_argument("--rf", required=True)
+    publish.add_argument("--stack", required=True)
+    publish.add_argument("--metrics", help="JSON file with training/evaluation metrics")
+    publish.add_argument("--version")
+    publish.add_argument("--notes")
+    publish.add_argument("--activate", action="store_true")
+    activate = commands.add_parser("activate", help="serve a published version")
+    activate.add_argument("version")
+    commands.add_parser("list", help="list published versions")
+    args = parser.parse_args(argv)
+
+    registry = ModelRegistry(args.root)
+    if args.command == "publish":
+        metrics = None
+        if args.metrics:
+            with open(args.metrics) as f:
+                metrics = json.load(f)
+        version = registry.publish(args.rf, args.stack, metrics, args.version, args.notes)
+        print(version)
+        if args.activate:
+            registry.activate(version)
+    elif args.command == "activate":
+        registry.activate(args.version)
+    else:
+        active = registry.active_version()
+        for version in registry.list_versions():
+            print(("* " if version == active else "  ") + version)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
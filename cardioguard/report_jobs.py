@@ -0,0 +1,72 @@
+# Background PDF report rendering, cached per prediction
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+
+def prediction_key(user_data, rf_prob, stack_prob, model_version=None):
+    payload = json.dumps(
+        {
+            "inputs": user_data,
+            "rf": round(float(rf_prob), 6),
+            "stack": round(float(stack_prob), 6),
+            "model": model_version,
+        },
+        sort_keys=True,
+        default=str,
+    )
+    return hashlib.sha1(payload.encode("utf-8")).hexdigest()
+
+
+class ReportJobs:
+    def __init__(self, max_workers=2, max_entries=128):
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="pdf-report")
+        self._futures = OrderedDict()
+        self._lock = threading.Lock()
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+
+    def submit(self, key, render, *args):
+        # Reuse the in-flight or finished render for this prediction
+        with self._lock:
+            future = self._futures.get(key)
+            if future is not None and not (future.done() and future.exception() is not None):
+                self._futures.move_to_end(key)
+                self.hits += 1
+                return future
+            self.misses += 1
+            future = self._executor.submit(_render_bytes, render, *args)
+            self._futures[key] = future
+            while len(self._futures) > self.max_entries:
+                self._futures.popitem(last=False)
+            return future
+
+    def result(self, key, render, *args, timeout=None):
+        return self.submit(key, render, *args).result(timeout=timeout)
+
+    def clear(self):
+        with self._lock:
+            self._futures.clear()
+
+    def stats(self):
+        with self._lock:
+            pending = sum(1 for f in self._futures.values() if not f.done())
+            cached_bytes = sum(
+                len(f.result()) for f in self._futures.values()
+                if f.done() and f.exception() is None
+            )
+            return {
+                "entries": len(self._futures),
+                "pending": pending,
+                "cached_bytes": cached_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+            }
+
+
+def _render_bytes(render, *args):
+    buffer = render(*args)
+    return buffer.getvalue() if hasattr(buffer, "getvalue") else bytes(buffer)
@@ -0,0 +1,288 @@
+# Personalised recommendations and the PDF report, shared by the app and the bulk exporter
+from datetime import datetime
+from io import BytesIO
+
+from fpdf import FPDF
+
+from cardioguard.uncertainty import needs_review
+
+
+def get_risk_level(risk_percentage):
+    if risk_percentage < 30:
+        return "Low"
+    elif risk_percentage < 60:
+        return "Moderate"
+    else:
+        return "High"
+
+
+def generate_personalized_recommendations(risk_percentage, user_data):
+    recommendations = {
+        "nutrition": [],
+        "exercise": [],
+        "lifestyle": [],
+        "medical": [],
+        "mental_health": []
+    }
+    
+    # Risk-based recommendations
+    if risk_percentage < 30:  # Low Risk
+        recommendations["nutrition"] = [
+            "🥗 Maintain Mediterranean diet with olive oil, nuts, and fish",
+            "🍎 Include 5-7 servings of fruits and vegetables daily",
+            "🥜 Add omega-3 rich foods like salmon, walnuts, and flaxseeds",
+            "🧂 Keep sodium intake under 2300mg per day",
+            "🫐 Include antioxidant-rich berries and dark leafy greens"
+        ]
+        
+        recommendations["exercise"] = [
+            "🏃‍♂️ Maintain 150 minutes of moderate exercise weekly",
+            "💪 Include strength training 2-3 times per week",
+            "🚶‍♀️ Take 8,000-10,000 steps daily",
+            "🧘‍♀️ Practice yoga or stretching 3 times weekly",
+            "🏊‍♂️ Try swimming or cycling for cardiovascular health"
+        ]
+        
+        recommendations["lifestyle"] = [
+            "😴 Maintain 7-9 hours of quality sleep",
+            "🚭 Continue avoiding smoking and secondhand smoke",
+            "🍷 Limit alcohol to 1 drink/day (women) or 2 drinks/day (men)",
+            "💧 Stay hydrated with 8-10 glasses of water daily",
+            "🧘‍♂️ Practice stress management techniques"
+        ]
+        
+        recommendations["medical"] = [
+            "🩺 Annual health checkups with lipid panel",
+            "🩸 Monitor blood pressure monthly",
+            "📊 Track BMI and waist circumference",
+            "💉 Stay up-to-date with vaccinations",
+            "🦷 Regular dental checkups (poor oral health linked to heart disease)"
+        ]
+        
+        recommendations["mental_health"] = [
+            "🧠 Practice mindfulness meditation 10-15 minutes daily",
+            "👥 Maintain strong social connections",
+            "📚 Engage in mentally stimulating activities",
+            "🎯 Set and achieve personal goals",
+            "😊 Practice gratitude journaling"
+        ]
+    
+    elif risk_percentage < 60:  # Moderate Risk
+        recommendations["nutrition"] = [
+            "🥗 Adopt strict Mediterranean or DASH diet",
+            "🍎 Increase fruits and vegetables to 7-9 servings daily",
+            "🐟 Include fatty fish 3-4 times per week",
+            "🥜 Add plant-based proteins like beans and lentils",
+            "🧂 Reduce sodium to under 1500mg daily",
+            "🚫 Eliminate processed and trans fats completely",
+            "🌾 Choose whole grains over refined carbohydrates"
+        ]
+        
+        recommendations["exercise"] = [
+            "🏃‍♂️ Increase to 200-300 minutes of moderate exercise weekly",
+            "💪 Strength training 3-4 times per week",
+            "🚶‍♀️ Aim for 10,000+ steps daily",
+            "🏊‍♂️ Include 2-3 cardio sessions weekly",
+            "🧘‍♀️ Daily yoga or stretching routine",
+            "⏰ Break up sitting time every 30 minutes"
+        ]
+        
+        recommendations["lifestyle"] = [
+            "😴 Prioritize 7-9 hours of quality sleep",
+            "🚭 Smoking cessation programs if applicable",
+            "🍷 Limit alcohol to 3-4 drinks per week maximum",
+            "💧 Increase water intake to 10-12 glasses daily",
+            "🧘‍♂️ Daily stress management practices",
+            "📱 Limit screen time and blue light exposure"
+        ]
+        
+        recommendations["medical"] = [
+            "🩺 Bi-annual comprehensive health checkups",
+            "🩸 Weekly blood pressure monitoring",
+            "📊 Monthly weight and BMI tracking",
+            "💊 Discuss preventive medications with doctor",
+            "🏥 Consider cardiac calcium scoring",
+            "🩹 Monitor for diabetes risk factors"
+        ]
+        
+        recommendations["mental_health"] = [
+            "🧠 Daily meditation or mindfulness practice",
+            "👥 Build and maintain social support network",
+            "😌 Consider counseling for stress management",
+            "🎯 Set realistic health goals with professional guidance",
+            "😊 Practice positive psychology techniques"
+        ]
+    
+    else:  # High Risk
+        recommendations["nutrition"] = [
+            "🥗 Strict therapeutic diet (consult nutritionist)",
+            "🍎 9+ servings of fruits and vegetables daily",
+            "🐟 Fatty fish 4+ times per week",
+            "🥜 Daily nuts and seeds (unsalted)",
+            "🧂 Sodium restriction to 1000-1500mg daily",
+            "🚫 Complete elimination of processed foods",
+            "🌾 100% whole grain choices",
+            "🥛 Consider plant-based milk alternatives",
+            "☕ Limit caffeine to 1-2 cups daily"
+        ]
+        
+        recommendations["exercise"] = [
+            "🏃‍♂️ Supervised exercise program (300+ minutes weekly)",
+            "💪 Resistance training 4-5 times per week",
+            "🚶‍♀️ 12,000+ steps daily with activity tracking",
+            "🏊‍♂️ Low-impact cardio 4-5 times weekly",
+            "🧘‍♀️ Daily flexibility and mobility work",
+            "⏰ Active breaks every 20-30 minutes",
+            "🎯 Work with exercise physiologist"
+        ]
+        
+        recommendations["lifestyle"] = [
+            "😴 Optimize sleep hygiene (7-9 hours nightly)",
+            "🚭 Immediate smoking cessation with medical support",
+            "🍷 Eliminate or severely limit alcohol",
+            "💧 12+ glasses of water daily",
+            "🧘‍♂️ Multiple daily stress reduction sessions",
+            "📱 Digital detox periods",
+            "🌡️ Monitor environmental stressors"
+        ]
+        
+        recommendations["medical"] = [
+            "🩺 Quarterly comprehensive health monitoring",
+            "🩸 Daily blood pressure and heart rate monitoring",
+            "📊 Weekly weight and symptom tracking",
+            "💊 Medications as prescribed by cardiologist",
+            "🏥 Regular cardiac imaging and stress tests",
+            "🩹 Intensive diabetes and cholesterol management",
+            "🚨 Emergency action plan for cardiac events"
+        ]
+        
+        recommendations["mental_health"] = [
+            "🧠 Professional stress management therapy",
+            "👥 Cardiac rehabilitation support groups",
+            "😌 Regular counseling sessions",
+            "🎯 Professional goal setting and monitoring",
+            "😊 Positive psychology interventions",
+            "🧘‍♂️ Mindfulness-based stress reduction (MBSR)",
+            "📞 24/7 mental health support access"
+        ]
+    
+    # Personalized adjustments based on user data
+    age = user_data.get('age', 50)
+    sex = user_data.get('sex', 0)
+    smoking = user_data.get('is_smoking', 0)
+    diabetes = user_data.get('diabetes', 0)
+    hypertension = user_data.get('prevalentHyp', 0)
+    
+    # Age-specific adjustments
+    if age > 65:
+        recommendations["exercise"].append("🦴 Include balance training to prevent falls")
+        recommendations["medical"].append("🧠 Annual cognitive health screening")
+        recommendations["nutrition"].append("🥛 Ensure adequate calcium and vitamin D")
+    
+    # Gender-specific adjustments
+    if sex == 0:  # Female
+        recommendations["medical"].append("🩺 Discuss hormone replacement therapy risks/benefits")
+        recommendations["nutrition"].append("🌸 Include phytoestrogen-rich foods")
+    
+    # Condition-specific adjustments
+    if smoking:
+        recommendations["lifestyle"].insert(0, "🚭 URGENT: Smoking cessation is your #1 priority")
+        recommendations["medical"].append("🫁 Pulmonary function testing")
+    
+    if diabetes:
+        recommendations["nutrition"].append("🍯 Strict blood sugar management")
+        recommendations["medical"].append("📊 HbA1c monitoring every 3 months")
+    
+    if hypertension:
+        recommendations["nutrition"].append("🧂 Ultra-low sodium diet (<1500mg)")
+        recommendations["medical"].append("🩸 Home blood pressure monitoring")
+    
+    return recommendations
+
+
+def generate_advanced_pdf_report(input_data, rf_prob, stack_prob, recommendations, uncertainty=None, neighbors=None):
+    pdf = FPDF()
+    pdf.add_page()
+    
+    # Header
+    pdf.set_font("Arial", 'B', 20)
+    pdf.set_text_color(102, 126, 234)
+    pdf.cell(200, 15, "CardioGuard AI - Comprehensive CHD Risk Report", ln=True, align='C')
+    
+    # Date and time
+    pdf.set_font("Arial", '', 10)
+    pdf.set_text_color(128, 128, 128)
+    pdf.cell(200, 10, f"Generated on: {datetime.now().strftime('%B %d, %Y at %I:%M %p')}", ln=True, align='C')
+    
+    pdf.ln(10)
+    
+    # Executive Summary
+    pdf.set_font("Arial", 'B', 14)
+    pdf.set_text_color(0, 0, 0)
+    pdf.cell(200, 10, "Executive Summary", ln=True)
+    pdf.set_font("Arial", '', 12)
+    
+    risk_level = get_risk_level(stack_prob * 100)
+    pdf.multi_cell(200, 8, f"Based on advanced machine learning analysis, your 10-year CHD risk is {stack_prob:.1%} ({risk_level} Risk). This report provides personalized recommendations for optimal cardiovascular health.")
+    
+    pdf.ln(5)
+    
+    # Risk Analysis
+    pdf.set_font("Arial", 'B', 14)
+    pdf.cell(200, 10, "Risk Analysis", ln=True)
+    pdf.set_font("Arial", '', 12)
+    
+    pdf.cell(200, 8, f"Random Forest Model Prediction: {rf_prob:.2%}", ln=True)
+    pdf.cell(200, 8, f"Stacking Ensemble Model Prediction: {stack_prob:.2%}", ln=True)
+    if uncertainty:
+        pdf.cell(200, 8, f"Prediction Spread Across Trees: ±{uncertainty['stack_std']:.1%} "
+                         f"(80% range {uncertainty['stack_low']:.1%} - {uncertainty['stack_high']:.1%})", ln=True)
+        # The flag decided with the scoring model's threshold when the caller has it
+        if uncertainty.get('needs_review', needs_review(uncertainty['stack_std'])):
+            pdf.set_text_color(220, 53, 69)
+            pdf.cell(200, 8, "Low confidence: the models disagree on this profile; clinical review advised.", ln=True)
+            pdf.set_text_color(0, 0, 0)
+    pdf.cell(200, 8, f"Risk Classification: {risk_level}", ln=True)
+    
+    pdf.ln(5)
+    if neighbors:
+        pdf.set_font("Arial", 'B', 14)
+        pdf.cell(200, 10, "Similar Patients", ln=True)
+        pdf.set_font("Arial", '', 12)
+        pdf.multi_cell(200, 8, f"Of the {neighbors['k']} patients in our reference dataset most similar to you, "
+                               f"{neighbors['cases']} ({neighbors['rate']:.1%}) developed CHD within 10 years, "
+                               f"compared with {neighbors['base_rate']:.1%} of all {neighbors['patients']:,} patients. "
+                               "These are observed outcomes, not a prediction.")
+        pdf.ln(5)
+    
+    
+    # Patient Information
+    pdf.set_font("Arial", 'B', 14)
+    pdf.cell(200, 10, "Patient Information", ln=True)
+    pdf.set_font("Arial", '', 12)
+    
+    for key, value in input_data.items():
+        pdf.cell(200, 6, f"{key}: {value}", ln=True)
+    
+    pdf.ln(5)
+    
+    # Key Recommendations
+    pdf.set_font("Arial", 'B', 14)
+    pdf.cell(200, 10, "Key Recommendations", ln=True)
+    pdf.set_font("Arial", '', 12)
+    
+    # Add top 3 recommendations from each category
+    categories = ['nutrition', 'exercise', 'lifestyle', 'medical']
+    for category in categories:
+        if category in recommendations:
+            pdf.set_font("Arial", 'B', 12)
+            pdf.cell(200, 8, f"{category.title()}:", ln=True)
+            pdf.set_font("Arial", '', 10)
+            for i, rec in enumerate(recommendations[category][:3]):
+                safe_rec = rec.replace("•", "-").replace("🥗", "").replace("🍎", "").replace("🐟", "").replace("🥜", "").replace("🧂", "").replace("🚫", "").replace("🌾", "").replace("🥛", "").replace("☕", "").replace("🍳", "").replace("🥣", "").replace("🍞", "").replace("🥤", "").replace("🍲", "").replace("🍗", "").replace("🍝", "").replace("🥘", "").replace("🫐", "").replace("🍷", "").replace("💧", "").replace("🧘‍♂️", "").replace("🧠", "").replace("👥", "").replace("📚", "").replace("🎯", "").replace("😊", "").replace("🦴", "").replace("🩺", "").replace("🩸", "").replace("📊", "").replace("💉", "").replace("🦷", "").replace("🫁", "").replace("🍯", "").replace("🚭", "").replace("🩹", "").replace("🏥", "").replace("🚨", "").replace("📞", "").replace("😴", "").replace("📱", "").replace("🌡️", "").replace("😌", "").replace("🧘‍♀️", "").replace("🤸‍♂️", "").replace("🤲", "").replace("🏃‍♂️", "").replace("🏃‍♀️", "").replace("🚶‍♂️", "").replace("🚶‍♀️", "").replace("🚴‍♂️", "").replace("🏊‍♀️", "").replace("🏋️‍♂️", "").replace("💪", "").replace("🧘‍♂️", "").replace("🧘‍♀️", "").replace("🤸‍♀️", "").replace("🧘‍♂️", "").replace("🧘‍♀️", "").replace("🤸‍♂️", "").replace("🤲", "").replace("🧘‍♂️", "").replace("🧘‍♀️", "").replace("🤸‍♂️", "").replace("🤲", "").replace("🧘‍♂️", "").replace("🧘‍♀️", "").replace("🤸‍♂️", "").replace("🤲", "").replace("🧘‍♂️", "").replace("🧘‍♀️", "").replace("🤸‍♂️", "").replace("🤲", "").replace("🧘‍♂️", "").replace("🧘‍♀️", "").replace("🤸‍♂️", "").replace("🤲", "").replace("🧘‍♂️", "").replace("🧘‍♀️", "").replace("🤸‍♂️", "").replace("🤲", "").replace("🧘‍♂️", "").replace("🧘‍♀️", "").replace("🤸‍♂️", "").replace("🤲", "").replace("🧘‍♂️", "").replace("🧘‍♀️", "").replace("🤸‍♂️", "").replace("🤲", "").replace("🧘‍♂️", "").replace("🧘‍♀️", "").replace("🤸‍♂️", "").replace("🤲", "").replace("🧘‍♂️", "").replace("🧘‍♀️", "").replace("🤸‍♂️", "").replace("🤲", "").replace("🧘‍♂️", "").replace("🧘‍♀️", "").replace("🤸‍♂️", "").replace("🤲", "").replace("🧘‍♂️", "").replace("🧘‍♀️", "").replace("🤸‍♂️", "").replace("🤲", "").replace("🧘‍♂️", "").replace("🧘‍♀️", "").replace("🤸‍♂️", "").replace("🤲", "").replace("🧘‍♂️", "").replace("🧘‍♀️", "").replace("🤸‍♂️", "").replace("🤲", "").replace("🧘‍♂️", "").replace("🧘‍♀️", "").replace("🤸‍♂️", "").replace("🤲", "")
+                pdf.multi_cell(200, 6, f"- {safe_rec}")
+            pdf.ln(2)
+    
+    # Generate PDF bytes
+    pdf_bytes = pdf.output(dest='S').encode('latin-1')
+    return BytesIO(pdf_bytes)
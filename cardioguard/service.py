@@ -0,0 +1,675 @@
+# Risk service: streaming updates for embedded widgets, and bulk NDJSON scoring for EHR extracts
+#
+#   python -m cardioguard.service serve --port 8600 --workers 2
+#   python -m cardioguard.service bench-bulk --lines 1000000
+#
+# WebSocket  /ws?client=<id>          send {"sysBP": 150, ...}, receive {"event": "risk", ...}
+# SSE        GET  /events/<client>    EventSource stream of risk/error events
+#            POST /inputs/<client>    JSON body of changed fields
+# Bulk       POST /bulk               NDJSON records in, one NDJSON result per record out
+#
+# Each client's updates are merged into its current record. A client waiting to be
+# scored is queued once, however many updates arrive, and is scored with whatever
+# its record holds when the next micro-batch is cut, so a burst of slider drags
+# costs one prediction. Batches gather clients across all connections and run in a
+# process pool, keeping inference off the event loop. A result that a newer update
+# has already superseded is dropped; the client is queued again for its latest state.
+#
+# /bulk takes records in the Data_cardiovascular_risk.csv field names, one JSON
+# object per line. The body is read incrementally and cut into chunks of
+# --bulk-chunk-rows lines; parsing, validation, scoring and serialisation of a
+# chunk all run in the pool, a few chunks in flight at a time, and results are
+# streamed back in input order as each chunk finishes. Reading the body pauses
+# while the pipeline is full, so memory stays bounded however large the upload.
+# A record that cannot be scored gets {"line": n, "error": ...} in its place.
+# The features of scored records feed the service's input-drift monitor
+# (cardioguard.drift), exported on /metrics. Widget updates do not: a slider drag
+# is many states of one patient, not a population.
+import argparse
+import asyncio
+import http.client
+import json
+import logging
+import multiprocessing as mp
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.request
+import uuid
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import asynccontextmanager
+
+import numpy as np
+import pandas as pd
+
+from cardioguard import metrics
+from cardioguard.cohort import RISK_BINS, RISK_LABELS
+from cardioguard.drift import open_monitor
+from cardioguard.features import (
+    DATASET_PATH, DEFAULT_RECORD, FEATURE_COLUMNS, INPUT_BOUNDS, RAW_COLUMNS, engineer_features, scorable_features,
+)
+from cardioguard.registry import LEGACY_VERSION, ModelRegistry
+from cardioguard.reports import get_risk_level
+from cardioguard.settings import env_float, env_int
+from cardioguard.uncertainty import needs_review, review_std, score_columns
+
+log = logging.getLogger(__name__)
+
+BATCH_WINDOW = env_float("CARDIOGUARD_SERVICE_WINDOW", 0.005)
+MAX_BATCH = env_int("CARDIOGUARD_SERVICE_MAX_BATCH", 256)
+BULK_CHUNK_ROWS = env_int("CARDIOGUARD_BULK_CHUNK_ROWS", 5000)
+BULK_MAX_LINE_BYTES = env_int("CARDIOGUARD_BULK_MAX_LINE_BYTES", 1 << 20)
+ID_FIELDS = ("patient_id", "id")
+KEEPALIVE_SECONDS = 15
+
+# Set in each pool worker by _init_worker
+_bundle = None
+
+
+def _init_worker(version):
+    from cardioguard.batch import _single_threaded
+
+    global _bundle
+    _bundle = ModelRegistry().load_version(version)
+    _single_threaded(_bundle.rf)
+    _single_threaded(_bundle.stack)
+
+
+def score_rows(rows):
+    # Runs in a pool worker: raw records (RAW_COLUMNS order) -> score columns and review flags
+    features = engineer_features(pd.DataFrame(rows, columns=RAW_COLUMNS))
+    scores = score_columns(_bundle, features)
+    scores["needs_review"] = needs_review(scores["stack_std"], review_std(_bundle))
+    return _bundle.version, scores
+
+
+def _id_of(record):
+    return next((record[field] for field in ID_FIELDS if record.get(field) is not None), None)
+
+
+def score_ndjson(numbered_lines):
+    # Runs in a pool worker: [(line number, raw bytes)] ->
+    # (NDJSON results in input order, errors, features of the scored records)
+    output = [None] * len(numbered_lines)
+    observed = None
+    records, positions = [], []
+    for position, (number, line) in enumerate(numbered_lines):
+        if line is None:
+            output[position] = _compact({"line": number, "error": f"line longer than {BULK_MAX_LINE_BYTES} bytes"})
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError as exc:
+            output[position] = _compact({"line": number, "error": f"invalid JSON: {exc}"})
+            continue
+        if not isinstance(record, dict):
+            output[position] = _compact({"line": number, "error": "expected a JSON object"})
+            continue
+        records.append(record)
+        positions.append(position)
+    rejected = len(numbered_lines) - len(records)
+    if records:
+        frame = pd.DataFrame.from_records(records).reindex(columns=RAW_COLUMNS)
+        features, errors = scorable_features(frame)
+        errors = errors.to_numpy(copy=True)
+        lines = np.array([numbered_lines[position][0] for position in positions])
+        ids = np.array([_id_of(record) for record in records], dtype=object)
+        valid = errors == ""
+        try:
+            scores = score_columns(_bundle, features) if valid.any() else None
+        except Exception as exc:
+            # One record the checks above missed must not cost the rest of the upload its results
+            log.exception("bulk chunk could not be scored")
+            errors[valid] = f"could not be scored: {exc}"
+            valid[:] = False
+        rejected += int((~valid).sum())
+        for i in np.flatnonzero(~valid):
+            entry = {"line": int(lines[i]), "id": ids[i], "error": errors[i]}
+            output[positions[i]] = _compact(entry)
+        if valid.any():
+            results = pd.DataFrame({"line": lines[valid], "id": ids[valid]})
+            for column in ("rf_prob", "stack_prob", "stack_std"):
+                results[column] = scores[column]
+            results["risk_level"] = pd.cut(
+                scores["stack_prob"] * 100, RISK_BINS, labels=RISK_LABELS, right=False,
+            ).astype(str)
+            results["needs_review"] = needs_review(scores["stack_std"], review_std(_bundle))
+            serialised = results.to_json(orient="records", lines=True, double_precision=15).splitlines()
+            for i, text in zip(np.flatnonzero(valid), serialised):
+                output[positions[i]] = text
+            observed = features[FEATURE_COLUMNS].to_numpy(dtype=np.float32)
+    return ("\n".join(output) + "\n").encode(), rejected, observed
+
+
+def _compact(entry):
+    return json.dumps(entry, separators=(",", ":"), default=str)
+
+
+class NdjsonLines:
+    # Numbers the non-blank lines of a byte stream as they arrive. Only the unfinished line is
+    # buffered; one longer than max_bytes comes out as (number, None) and the rest of it is skipped
+    def __init__(self, max_bytes=BULK_MAX_LINE_BYTES):
+        self.max_bytes = max_bytes
+        self.number = 0
+        self._pending = bytearray()
+        self._oversized = False
+
+    def feed(self, piece):
+        start = 0
+        while (end := piece.find(b"\n", start)) >= 0:
+            self._hold(piece, start, end)
+            line = self._take()
+            if line[1] is None or line[1].strip():
+                yield line
+            start = end + 1
+        self._hold(piece, start, len(piece))
+
+    def close(self):
+        if self._oversized or self._pending.strip():
+            yield self._take()
+
+    def _hold(self, piece, start, end):
+        if self._oversized:
+            return
+        if len(self._pending) + end - start > self.max_bytes:
+            self._oversized = True
+            self._pending.clear()
+        else:
+            self._pending += piece[start:end]
+
+    def _take(self):
+        self.number += 1
+        line = None if self._oversized else bytes(self._pending)
+        self._pending.clear()
+        self._oversized = False
+        return self.number, line
+
+
+def chunk_errors(numbered_lines, message):
+    # The result lines for a chunk whose worker failed outright
+    return "".join(_compact({"line": number, "error": message}) + "\n" for number, _ in numbered_lines).encode()
+
+
+def validate_fields(fields):
+    # Returns (accepted, errors); invalid fields are reported and the rest still applied
+    if not isinstance(fields, dict):
+        return {}, {"_": "expected a JSON object of field: value"}
+    accepted, errors = {}, {}
+    for name, value in fields.items():
+        if name not in INPUT_BOUNDS:
+            errors[name] = "unknown field"
+            continue
+        try:
+            value = float(value)
+        except (TypeError, ValueError):
+            errors[name] = "not a number"
+            continue
+        low, high = INPUT_BOUNDS[name]
+        if not low <= value <= high:
+            errors[name] = f"outside [{low}, {high}]"
+        else:
+            accepted[name] = value
+    return accepted, errors
+
+
+class Client:
+    def __init__(self, client_id):
+        self.id = client_id
+        self.record = dict(DEFAULT_RECORD)
+        self.seq = 0
+        # Latest unsent message per event type; older ones are overwritten, not queued
+        self._outbox = {}
+        self._ready = asyncio.Event()
+
+    def push(self, message):
+        self._outbox[message["event"]] = message
+        self._ready.set()
+
+    async def messages(self):
+        await self._ready.wait()
+        self._ready.clear()
+        pending, self._outbox = list(self._outbox.values()), {}
+        return pending
+
+
+class MicroBatcher:
+    def __init__(self, executor, concurrency, window=BATCH_WINDOW, max_batch=MAX_BATCH):
+        self.executor = executor
+        self.window = window
+        self.max_batch = max_batch
+        self._slots = asyncio.Semaphore(concurrency)
+        self._queued = {}
+        self._wake = asyncio.Event()
+        self._in_flight = set()
+        self.batches = 0
+        self.rows = 0
+        self.stale = 0
+        self.last_batch_seconds = 0.0
+
+    def queue(self, client):
+        # Already-queued clients keep their place; they are scored with their latest record
+        self._queued.setdefault(client.id, client)
+        self._wake.set()
+
+    def discard(self, client):
+        self._queued.pop(client.id, None)
+
+    @property
+    def depth(self):
+        return len(self._queued)
+
+    async def run(self):
+        while True:
+            await self._wake.wait()
+            # Let the rest of a burst land before cutting the batch
+            await asyncio.sleep(self.window)
+            await self._slots.acquire()
+            batch = []
+            while self._queued and len(batch) < self.max_batch:
+                batch.append(self._queued.pop(next(iter(self._queued))))
+            if not self._queued:
+                self._wake.clear()
+            if not batch:
+                self._slots.release()
+                continue
+            task = asyncio.create_task(self._score(batch))
+            self._in_flight.add(task)
+            task.add_done_callback(self._in_flight.discard)
+
+    async def _score(self, batch):
+        snapshot = [(client, client.seq) for client in batch]
+        rows = np.array([[client.record[column] for column in RAW_COLUMNS] for client in batch], dtype=float)
+        started = time.perf_counter()
+        try:
+            version, scores = await asyncio.get_running_loop().run_in_executor(self.executor, score_rows, rows)
+        except Exception as exc:
+            log.exception("scoring a batch of %d failed", len(batch))
+            for client, seq in snapshot:
+                client.push({"event": "error", "seq": seq, "errors": {"_": f"scoring failed: {exc!r}"}})
+            return
+        finally:
+            self._slots.release()
+        self.last_batch_seconds = time.perf_counter() - started
+        self.batches += 1
+        self.rows += len(batch)
+        for i, (client, seq) in enumerate(snapshot):
+            if client.seq != seq:
+                # Superseded while scoring; the newer update has already re-queued the client
+                self.stale += 1
+                continue
+            stack_prob = float(scores["stack_prob"][i])
+            client.push({
+                "event": "risk",
+                "seq": seq,
+                "rf_prob": float(scores["rf_prob"][i]),
+                "stack_prob": stack_prob,
+                "stack_std": float(scores["stack_std"][i]),
+                "stack_low": float(scores["stack_low"][i]),
+                "stack_high": float(scores["stack_high"][i]),
+                "risk_level": get_risk_level(stack_prob * 100),
+                "needs_review": bool(scores["needs_review"][i]),
+                "model_version": version,
+            })
+
+
+class RiskService:
+    def __init__(self, executor, concurrency, window=BATCH_WINDOW, max_batch=MAX_BATCH):
+        self.clients = {}
+        self.batcher = MicroBatcher(executor, concurrency, window, max_batch)
+        self.updates = 0
+        self.rejected = 0
+        self.bulk_requests = 0
+        self.bulk_records = 0
+        self.bulk_rejected = 0
+        self.bulk_chunks_in_flight = 0
+
+    def connect(self, client_id):
+        client = self.clients.get(client_id)
+        if client is None:
+            client = self.clients[client_id] = Client(client_id)
+            # Score the starting record so the widget has a value before the first drag
+            self.batcher.queue(client)
+        return client
+
+    def disconnect(self, client):
+        if self.clients.get(client.id) is client:
+            del self.clients[client.id]
+        self.batcher.discard(client)
+
+    def submit(self, client, fields):
+        accepted, errors = validate_fields(fields)
+        self.updates += 1
+        if errors:
+            self.rejected += 1
+            client.push({"event": "error", "seq": client.seq, "errors": errors})
+        if accepted:
+            client.record.update(accepted)
+            client.seq += 1
+            self.batcher.queue(client)
+        return errors
+
+    def stats(self):
+        batcher = self.batcher
+        return {
+            "clients": len(self.clients),
+            "updates": self.updates,
+            "rejected": self.rejected,
+            "queue_depth": batcher.depth,
+            "batches": batcher.batches,
+            "rows_scored": batcher.rows,
+            "stale_results": batcher.stale,
+            "mean_batch_rows": batcher.rows / batcher.batches if batcher.batches else 0.0,
+            "last_batch_seconds": batcher.last_batch_seconds,
+            "bulk_requests": self.bulk_requests,
+            "bulk_records": self.bulk_records,
+            "bulk_rejected": self.bulk_rejected,
+            "bulk_chunks_in_flight": self.bulk_chunks_in_flight,
+        }
+
+
+def _parse(text):
+    try:
+        return json.loads(text)
+    except ValueError:
+        return None
+
+
+def create_app(version=None, workers=None, window=BATCH_WINDOW, max_batch=MAX_BATCH, bulk_chunk_rows=BULK_CHUNK_ROWS):
+    from starlette.applications import Starlette
+    from starlette.requests import ClientDisconnect, Request
+    from starlette.responses import JSONResponse, PlainTextResponse, StreamingResponse
+    from starlette.routing import Route, WebSocketRoute
+    from starlette.websockets import WebSocketDisconnect
+
+    workers = workers or os.cpu_count() or 1
+    state = {}
+
+    @asynccontextmanager
+    async def lifespan(app):
+        registry = ModelRegistry()
+        resolved = version or registry.active_version() or LEGACY_VERSION
+        # spawn, not fork: the parent is already running an event loop and its threads
+        executor = ProcessPoolExecutor(
+            workers, mp_context=mp.get_context("spawn"), initializer=_init_worker, initargs=(resolved,),
+        )
+        # Start every worker and load the models before accepting traffic
+        await asyncio.gather(*(
+            asyncio.get_running_loop().run_in_executor(executor, time.sleep, 0) for _ in range(workers)
+        ))
+        service = state["service"] = RiskService(executor, workers, window, max_batch)
+        state["executor"] = executor
+        state["drift"] = open_monitor(interval=env_float("CARDIOGUARD_DRIFT_INTERVAL", 60.0))
+        metrics.register_collector("service", service.stats)
+        if state["drift"] is not None:
+            metrics.register_collector("drift", state["drift"].stats)
+        runner = asyncio.create_task(service.batcher.run())
+        log.info("serving model version %s with %d workers", resolved, workers)
+        try:
+            yield
+        finally:
+            runner.cancel()
+            executor.shutdown(cancel_futures=True)
+
+    async def websocket(ws):
+        service = state["service"]
+        await ws.accept()
+        client = service.connect(ws.query_params.get("client") or uuid.uuid4().hex)
+
+        async def send():
+            while True:
+                for message in await client.messages():
+                    await ws.send_json(message)
+
+        sender = asyncio.create_task(send())
+        try:
+            while True:
+                fields = _parse(await ws.receive_text())
+                service.submit(client, fields)
+        except WebSocketDisconnect:
+            pass
+        finally:
+            sender.cancel()
+            service.disconnect(client)
+
+    async def events(request):
+        service = state["service"]
+        client = service.connect(request.path_params["client"])
+
+        async def stream():
+            try:
+                yield ": connected\n\n"
+                while True:
+                    try:
+                        pending = await asyncio.wait_for(client.messages(), KEEPALIVE_SECONDS)
+                    except asyncio.TimeoutError:
+                        yield ": keepalive\n\n"
+                        continue
+                    for message in pending:
+                        yield f"event: {message['event']}\ndata: {json.dumps(message)}\n\n"
+            finally:
+                service.disconnect(client)
+
+        return StreamingResponse(
+            stream(), media_type="text/event-stream",
+            headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        )
+
+    async def inputs(request):
+        service = state["service"]
+        client = service.clients.get(request.path_params["client"])
+        if client is None:
+            return JSONResponse({"error": "open /events/<client> first"}, status_code=404)
+        errors = service.submit(client, _parse(await request.body()))
+        return JSONResponse({"seq": client.seq, "errors": errors}, status_code=422 if errors else 202)
+
+    async def bulk_results(request):
+        # NDJSON result chunks in input order; reading pauses while 2 chunks per worker are pending
+        service, executor, drift = state["service"], state["executor"], state["drift"]
+        loop = asyncio.get_running_loop()
+        service.bulk_requests += 1
+        in_flight = deque()
+        chunk, splitter = [], NdjsonLines()
+
+        def submit():
+            service.bulk_records += len(chunk)
+            service.bulk_chunks_in_flight += 1
+            in_flight.append((chunk, loop.run_in_executor(executor, score_ndjson, chunk)))
+
+        async def finish():
+            lines, future = in_flight.popleft()
+            try:
+                payload, rejected, observed = await future
+            except Exception as exc:
+                # A worker that died (BrokenProcessPool) fails its chunk inline; the stream goes on
+                log.exception("bulk chunk of %d records failed", len(lines))
+                payload, rejected, observed = chunk_errors(lines, f"could not be scored: {exc}"), len(lines), None
+            if drift is not None and observed is not None:
+                drift.observe(observed)
+            service.bulk_chunks_in_flight -= 1
+            service.bulk_rejected += rejected
+            return payload
+
+        try:
+            async for piece in request.stream():
+                for line in splitter.feed(piece):
+                    chunk.append(line)
+                    if len(chunk) >= bulk_chunk_rows:
+                        submit()
+                        chunk = []
+                while len(in_flight) >= 2 * workers:
+                    yield await finish()
+            chunk.extend(splitter.close())
+            if chunk:
+                submit()
+            while in_flight:
+                yield await finish()
+        finally:
+            for _, future in in_flight:
+                future.cancel()
+            service.bulk_chunks_in_flight -= len(in_flight)
+
+    class BulkEndpoint:
+        # Plain ASGI rather than StreamingResponse: the response streams while the request
+        # body is still being read, and StreamingResponse would compete for receive()
+        async def __call__(self, scope, receive, send):
+            request = Request(scope, receive)
+            await send({
+                "type": "http.response.start", "status": 200,
+                "headers": [(b"content-type", b"application/x-ndjson")],
+            })
+            try:
+                async for payload in bulk_results(request):
+                    await send({"type": "http.response.body", "body": payload, "more_body": True})
+            except ClientDisconnect:
+                return
+            await send({"type": "http.response.body", "body": b"", "more_body": False})
+
+    async def health(request):
+        return JSONResponse(state["service"].stats())
+
+    async def prometheus(request):
+        return PlainTextResponse(metrics.render_prometheus(), media_type="text/plain; version=0.0.4")
+
+    return Starlette(
+        routes=[
+            WebSocketRoute("/ws", websocket),
+            Route("/events/{client}", events),
+            Route("/inputs/{client}", inputs, methods=["POST"]),
+            Route("/bulk", BulkEndpoint(), methods=["POST"]),
+            Route("/healthz", health),
+            Route("/metrics", prometheus),
+        ],
+        lifespan=lifespan,
+    )
+
+
+def write_ndjson(path, lines, dataset_path=DATASET_PATH, invalid_every=1000, seed=0):
+    # Dataset records resampled to `lines` lines, with one in every `invalid_every` made unscorable
+    frame = pd.read_csv(dataset_path)
+    with open(path, "w") as f:
+        for start in range(0, lines, 100_000):
+            rows = min(100_000, lines - start)
+            part = frame.sample(rows, replace=True, random_state=seed + start).reset_index(drop=True)
+            part.insert(0, "patient_id", np.arange(start, start + rows))
+            part.loc[part["patient_id"] % invalid_every == 0, "sex"] = "?"
+            f.write(part.to_json(orient="records", lines=True).rstrip("\n") + "\n")
+
+
+def _peak_rss(pid):
+    # VmHWM of a process and its direct children (the scoring pool), in bytes
+    def hwm(process):
+        try:
+            with open(f"/proc/{process}/status") as f:
+                return next(int(line.split()[1]) * 1024 for line in f if line.startswith("VmHWM"))
+        except (OSError, StopIteration):
+            return 0
+
+    try:
+        with open(f"/proc/{pid}/task/{pid}/children") as f:
+            children = [int(child) for child in f.read().split()]
+    except OSError:
+        children = []
+    return hwm(pid), max((hwm(child) for child in children), default=0)
+
+
+def bench_bulk(lines, workers, chunk_rows, port=8699):
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "extract.ndjson")
+        write_ndjson(path, lines)
+        size = os.path.getsize(path)
+        server = subprocess.Popen([
+            sys.executable, "-m", "cardioguard.service", "serve", "--port", str(port),
+            "--workers", str(workers), "--bulk-chunk-rows", str(chunk_rows),
+        ])
+        try:
+            for _ in range(240):
+                try:
+                    urllib.request.urlopen(f"http://127.0.0.1:{port}/healthz", timeout=1).read()
+                    break
+                except OSError:
+                    time.sleep(0.5)
+            sock = socket.create_connection(("127.0.0.1", port))
+            started = time.perf_counter()
+            sock.sendall(
+                f"POST /bulk HTTP/1.1\r\nHost: 127.0.0.1\r\nContent-Type: application/x-ndjson\r\n"
+                f"Content-Length: {size}\r\n\r\n".encode()
+            )
+
+            # Upload and download at once, as a streaming client must: the server stops reading
+            # the body while results it has produced are not being consumed
+            def upload():
+                with open(path, "rb") as f:
+                    for block in iter(lambda: f.read(1 << 16), b""):
+                        sock.sendall(block)
+
+            uploader = threading.Thread(target=upload, daemon=True)
+            uploader.start()
+            response = http.client.HTTPResponse(sock)
+            response.begin()
+            results = rejected = 0
+            first = None
+            for line in response:
+                if first is None:
+                    first = time.perf_counter() - started
+                results += 1
+                rejected += b'"error"' in line
+            elapsed = time.perf_counter() - started
+            uploader.join()
+            sock.close()
+            server_rss, worker_rss = _peak_rss(server.pid)
+        finally:
+            server.terminate()
+            server.wait()
+    return {
+        "lines": lines, "bytes": size, "results": results, "rejected": rejected, "seconds": elapsed,
+        "first_result_seconds": first, "server_peak_rss": server_rss, "worker_peak_rss": worker_rss,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve streaming and bulk risk scoring.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    serve = commands.add_parser("serve", help="serve WebSocket, SSE and bulk NDJSON endpoints")
+    serve.add_argument("--host", default="127.0.0.1")
+    serve.add_argument("--port", type=int, default=8600)
+    serve.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="scoring processes")
+    serve.add_argument("--version", help="registry version (default: ACTIVE)")
+    serve.add_argument("--window-ms", type=float, default=BATCH_WINDOW * 1000,
+                       help="how long a burst is gathered before a batch is cut")
+    serve.add_argument("--max-batch", type=int, default=MAX_BATCH)
+    serve.add_argument("--bulk-chunk-rows", type=int, default=BULK_CHUNK_ROWS)
+    bench = commands.add_parser("bench-bulk", help="time /bulk on a generated NDJSON extract")
+    bench.add_argument("--lines", type=int, default=1_000_000)
+    bench.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    bench.add_argument("--bulk-chunk-rows", type=int, default=BULK_CHUNK_ROWS)
+    bench.add_argument("--port", type=int, default=8699)
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(name)s %(message)s")
+
+    if args.command == "bench-bulk":
+        result = bench_bulk(args.lines, args.workers, args.bulk_chunk_rows, args.port)
+        print(
+            f"{result['results']:,} results ({result['rejected']:,} rejected) for {result['lines']:,} lines "
+            f"({result['bytes'] / 2**20:.0f}MB) in {result['seconds']:.1f}s: "
+            f"{result['lines'] / result['seconds']:,.0f} records/s, first result after {result['first_result_seconds']:.2f}s"
+        )
+        print(
+            f"peak rss: server {result['server_peak_rss'] / 2**20:.0f}MB, "
+            f"largest worker {result['worker_peak_rss'] / 2**20:.0f}MB (workers={args.workers}, cpu_count={os.cpu_count()})"
+        )
+        return 0
+
+    import uvicorn
+
+    app = create_app(args.version, args.workers, args.window_ms / 1000, args.max_batch, args.bulk_chunk_rows)
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
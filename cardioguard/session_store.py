@@ -0,0 +1,138 @@
+# Bounded server-side session records with idle spill to SQLite; spilled records
+# not touched for expire_seconds are deleted on the next sweep
+import json
+import sqlite3
+import threading
+import time
+import zlib
+
+
+class SessionTooLarge(ValueError):
+    pass
+
+
+def _jsonable(value):
+    # NumPy scalars and arrays; item() alone fails on arrays of more than one element
+    if hasattr(value, "tolist"):
+        return value.tolist()
+    if hasattr(value, "item"):
+        return value.item()
+    raise TypeError(f"Cannot store {type(value).__name__} in a session record")
+
+
+def encode_record(record):
+    raw = json.dumps(record, separators=(",", ":"), default=_jsonable).encode("utf-8")
+    return zlib.compress(raw, 6)
+
+
+def decode_record(blob):
+    return json.loads(zlib.decompress(blob).decode("utf-8"))
+
+
+class SessionStore:
+    def __init__(self, path, max_record_bytes=32 * 1024, idle_seconds=900,
+                 sweep_interval=60, transient_keys=(), expire_seconds=7 * 24 * 3600):
+        self.max_record_bytes = max_record_bytes
+        self.idle_seconds = idle_seconds
+        self.expire_seconds = expire_seconds
+        self.sweep_interval = sweep_interval
+        self.transient_keys = tuple(transient_keys)
+        self._live = {}  # session_id -> (last_access, compressed record)
+        self._lock = threading.Lock()
+        self._last_sweep = time.monotonic()
+        self._spilled = 0
+        self._reloaded = 0
+        self._trimmed = 0
+        self._rejected = 0
+        self._expired = 0
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS sessions ("
+            "session_id TEXT PRIMARY KEY, updated REAL NOT NULL, payload BLOB NOT NULL)"
+        )
+
+    def load(self, session_id):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._live.get(session_id)
+            if entry is not None:
+                self._live[session_id] = (now, entry[1])
+                return decode_record(entry[1])
+            row = self._db.execute(
+                "SELECT payload FROM sessions WHERE session_id = ?", (session_id,)
+            ).fetchone()
+            if row is None:
+                return {}
+            # Transparently bring a spilled session back into memory
+            self._db.execute("DELETE FROM sessions WHERE session_id = ?", (session_id,))
+            self._live[session_id] = (now, row[0])
+            self._reloaded += 1
+            return decode_record(row[0])
+
+    def save(self, session_id, record):
+        blob = encode_record(record)
+        trimmed = 0
+        if len(blob) > self.max_record_bytes:
+            record = dict(record)
+            for key in self.transient_keys:
+                if record.pop(key, None) is not None:
+                    trimmed += 1
+                    blob = encode_record(record)
+                    if len(blob) <= self.max_record_bytes:
+                        break
+            if len(blob) > self.max_record_bytes:
+                with self._lock:
+                    self._trimmed += trimmed
+                    self._rejected += 1
+                raise SessionTooLarge(
+                    f"Session record is {len(blob)} bytes, cap is {self.max_record_bytes}"
+                )
+        now = time.monotonic()
+        with self._lock:
+            self._trimmed += trimmed
+            self._live[session_id] = (now, blob)
+            due = now - self._last_sweep >= self.sweep_interval
+        if due:
+            self.sweep()
+
+    def discard(self, session_id):
+        with self._lock:
+            self._live.pop(session_id, None)
+            self._db.execute("DELETE FROM sessions WHERE session_id = ?", (session_id,))
+
+    def sweep(self, now=None):
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            self._last_sweep = now
+            wall = time.time()
+            if self.expire_seconds:
+                self._expired += self._db.execute(
+                    "DELETE FROM sessions WHERE updated < ?", (wall - self.expire_seconds,)
+                ).rowcount
+            idle = [sid for sid, (seen, _) in self._live.items() if now - seen >= self.idle_seconds]
+            if not idle:
+                return 0
+            self._db.executemany(
+                "INSERT OR REPLACE INTO sessions (session_id, updated, payload) VALUES (?, ?, ?)",
+                [(sid, wall, self._live[sid][1]) for sid in idle],
+            )
+            for sid in idle:
+                del self._live[sid]
+            self._spilled += len(idle)
+            return len(idle)
+
+    def stats(self):
+        with self._lock:
+            live_bytes = sum(len(blob) for _, blob in self._live.values())
+            spilled_now = self._db.execute("SELECT COUNT(*) FROM sessions").fetchone()[0]
+            return {
+                "live_sessions": len(self._live),
+                "live_bytes": live_bytes,
+                "spilled_sessions": spilled_now,
+                "spilled_total": self._spilled,
+                "reloaded_total": self._reloaded,
+                "trimmed_fields_total": self._trimmed,
+                "rejected_total": self._rejected,
+                "expired_total": self._expired,
+            }
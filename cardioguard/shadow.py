@@ -0,0 +1,150 @@
+# Shadow scoring: candidate models score real traffic off the request path
+import logging
+import queue
+import sqlite3
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+
+from cardioguard.features import FEATURE_COLUMNS
+
+log = logging.getLogger(__name__)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS shadow_batches (
+    id INTEGER PRIMARY KEY,
+    ts REAL NOT NULL,
+    primary_version TEXT NOT NULL,
+    candidate_version TEXT NOT NULL,
+    n INTEGER NOT NULL,
+    agree INTEGER NOT NULL,
+    sum_delta REAL NOT NULL,
+    sum_abs_delta REAL NOT NULL,
+    max_abs_delta REAL NOT NULL
+)
+"""
+
+
+class ShadowScorer:
+    def __init__(self, registry, candidate_versions, stats_path, max_queue=1024,
+                 batch_size=64, batch_wait=0.5, threshold=0.5):
+        self.registry = registry
+        self.candidate_versions = list(candidate_versions)
+        self.batch_size = batch_size
+        self.batch_wait = batch_wait
+        self.threshold = threshold
+        self.dropped = 0
+        self.scored = 0
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._totals = {}
+        self._lock = threading.Lock()
+        self._stats_path = stats_path
+        self._worker = threading.Thread(target=self._run, name="shadow-scorer", daemon=True)
+        self._worker.start()
+
+    def submit(self, features, primary_prob, primary_version):
+        # Never blocks the request: a full queue drops the sample
+        row = np.asarray(features, dtype=float).reshape(-1)
+        try:
+            self._queue.put_nowait((row, float(primary_prob), primary_version))
+            return True
+        except queue.Full:
+            with self._lock:
+                self.dropped += 1
+            return False
+
+    def _load_candidates(self):
+        candidates = {}
+        for version in self.candidate_versions:
+            try:
+                candidates[version] = self.registry.load_version(version).stack
+            except Exception as exc:
+                log.error("Shadow candidate %s could not be loaded: %s", version, exc)
+        return candidates
+
+    def _next_batch(self):
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.batch_wait
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        candidates = self._load_candidates()
+        db = sqlite3.connect(self._stats_path)
+        db.execute("PRAGMA journal_mode=WAL")
+        db.execute(_SCHEMA)
+        while True:
+            batch = self._next_batch()
+            try:
+                self._score(batch, candidates, db)
+            except Exception:
+                # A bad sample or candidate costs this batch, not the scorer
+                log.exception("Shadow batch of %d samples dropped", len(batch))
+                with self._lock:
+                    self.dropped += len(batch)
+
+    def _score(self, batch, candidates, db):
+        inputs = pd.DataFrame(np.vstack([row for row, _, _ in batch]), columns=FEATURE_COLUMNS)
+        primary = np.array([prob for _, prob, _ in batch])
+        primary_versions = np.array([version for _, _, version in batch])
+        rows = []
+        for version, model in candidates.items():
+            try:
+                candidate = model.predict_proba(inputs)[:, 1]
+            except Exception:
+                log.exception("Shadow candidate %s failed to score", version)
+                continue
+            for primary_version in np.unique(primary_versions):
+                mask = primary_versions == primary_version
+                rows.append(self._accumulate(str(primary_version), version, primary[mask], candidate[mask]))
+        with self._lock:
+            self.scored += len(batch)
+        if rows:
+            with db:
+                db.executemany(
+                    "INSERT INTO shadow_batches (ts, primary_version, candidate_version, n, agree, "
+                    "sum_delta, sum_abs_delta, max_abs_delta) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                    rows,
+                )
+
+    def _accumulate(self, primary_version, candidate_version, primary, candidate):
+        delta = candidate - primary
+        agree = int(np.sum((candidate >= self.threshold) == (primary >= self.threshold)))
+        row = (
+            time.time(), primary_version, candidate_version, len(delta), agree,
+            float(delta.sum()), float(np.abs(delta).sum()), float(np.abs(delta).max()),
+        )
+        with self._lock:
+            totals = self._totals.setdefault(
+                (primary_version, candidate_version),
+                {"n": 0, "agree": 0, "sum_delta": 0.0, "sum_abs_delta": 0.0, "max_abs_delta": 0.0},
+            )
+            totals["n"] += row[3]
+            totals["agree"] += row[4]
+            totals["sum_delta"] += row[5]
+            totals["sum_abs_delta"] += row[6]
+            totals["max_abs_delta"] = max(totals["max_abs_delta"], row[7])
+        return row
+
+    def stats(self):
+        with self._lock:
+            data = {"queue_depth": self._queue.qsize(), "dropped": self.dropped, "scored": self.scored}
+            for (primary_version, candidate_version), totals in self._totals.items():
+                n = totals["n"] or 1
+                data[f"{candidate_version}_vs_{primary_version}"] = {
+                    "n": totals["n"],
+                    "agreement": totals["agree"] / n,
+                    "mean_delta": totals["sum_delta"] / n,
+                    "mean_abs_delta": totals["sum_abs_delta"] / n,
+                    "max_abs_delta": totals["max_abs_delta"],
+                }
+        return data
@@ -0,0 +1,243 @@
+# Out-of-core scoring: bounded chunks in, appended results out, resumable after interruption
+#
+#   python -m cardioguard.stream extract.csv scores.csv --chunk-rows 50000
+#   python -m cardioguard.stream extract.parquet scores.parquet
+#
+# Input is CSV or Parquet; only one chunk is in memory at a time. CSV output is
+# appended to a single file; Parquet output is a directory of part files. After
+# every chunk the output is flushed and <output>.checkpoint.json is replaced
+# atomically, so a rerun of the same command resumes from the last committed
+# chunk (a partially written chunk is truncated away). Use --restart to start over.
+# Records that cannot be scored keep their row with empty scores and an error.
+# Input drift of the scored records against the training data is written to
+# <output>.drift.json when the job completes (see cardioguard.drift).
+import argparse
+import json
+import logging
+import os
+import resource
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+from cardioguard.drift import open_monitor, write_report
+from cardioguard.features import FEATURE_COLUMNS, scorable_features
+from cardioguard.registry import LEGACY_VERSION, ModelRegistry
+from cardioguard.uncertainty import SCORE_COLUMNS, needs_review, review_std, score_columns
+
+log = logging.getLogger(__name__)
+
+DEFAULT_CHUNK_ROWS = 50_000
+
+
+class CheckpointMismatch(Exception):
+    pass
+
+
+def _is_parquet(path):
+    return path.endswith((".parquet", ".pq"))
+
+
+def _fingerprint(path):
+    stat = os.stat(path)
+    return {"size": stat.st_size, "mtime": stat.st_mtime}
+
+
+def peak_rss():
+    # ru_maxrss is KiB on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def iter_csv(path, chunk_rows, skip_rows=0):
+    # A callable skiprows keeps resume constant-memory (a list/range is materialised as a set)
+    skip = (lambda i: 0 < i <= skip_rows) if skip_rows else None
+    yield from pd.read_csv(path, chunksize=chunk_rows, skiprows=skip)
+
+
+def iter_parquet(path, chunk_rows, skip_rows=0):
+    import pyarrow.parquet as pq
+
+    parquet = pq.ParquetFile(path)
+    # Whole row groups before the resume point are never read
+    row_groups = []
+    offset = skip_rows
+    for index in range(parquet.num_row_groups):
+        rows = parquet.metadata.row_group(index).num_rows
+        if offset >= rows:
+            offset -= rows
+        else:
+            row_groups.append(index)
+    pending = None
+    for batch in parquet.iter_batches(batch_size=chunk_rows, row_groups=row_groups):
+        frame = batch.to_pandas()
+        if offset:
+            frame = frame.iloc[offset:]
+            offset = 0
+        # Re-block so chunks stay chunk_rows long across row-group boundaries
+        pending = frame if pending is None else pd.concat([pending, frame], ignore_index=True)
+        while len(pending) >= chunk_rows:
+            yield pending.iloc[:chunk_rows].reset_index(drop=True)
+            pending = pending.iloc[chunk_rows:].reset_index(drop=True)
+    if pending is not None and len(pending):
+        yield pending
+
+
+def iter_chunks(path, chunk_rows, skip_rows=0):
+    reader = iter_parquet if _is_parquet(path) else iter_csv
+    return reader(path, chunk_rows, skip_rows)
+
+
+def score_chunk(frame, bundle, monitor=None):
+    # Rows that cannot be scored are kept, with empty scores and the reason in "error";
+    # the features of the rest go to the drift monitor if one is given
+    features, errors = scorable_features(frame)
+    if monitor is not None and len(features):
+        monitor.observe(features[FEATURE_COLUMNS].to_numpy())
+    scored = frame.copy()
+    for column in SCORE_COLUMNS:
+        scored[column] = np.nan
+    if len(features):
+        for column, values in score_columns(bundle, features).items():
+            scored.loc[features.index, column] = values
+    scored["needs_review"] = needs_review(scored["stack_std"], review_std(bundle))
+    scored["error"] = errors
+    return scored
+
+
+class Checkpoint:
+    def __init__(self, path, state):
+        self.path = path
+        self.state = state
+
+    @classmethod
+    def open(cls, output, input_path, chunk_rows, version, restart=False):
+        path = output + ".checkpoint.json"
+        fresh = {
+            "input": os.path.abspath(input_path),
+            "input_fingerprint": _fingerprint(input_path),
+            "chunk_rows": chunk_rows,
+            "model_version": version,
+            "chunks": 0,
+            "rows": 0,
+            "output_bytes": 0,
+            "started": time.time(),
+            "complete": False,
+        }
+        if restart or not os.path.exists(path):
+            return cls(path, fresh), False
+        with open(path) as f:
+            state = json.load(f)
+        if state["input_fingerprint"] != fresh["input_fingerprint"]:
+            raise CheckpointMismatch(f"{input_path} changed since {path} was written; rerun with --restart")
+        return cls(path, state), True
+
+    def commit(self, rows, output_bytes):
+        self.state["chunks"] += 1
+        self.state["rows"] += rows
+        self.state["output_bytes"] = output_bytes
+        self.state["updated"] = time.time()
+        self.save()
+
+    def save(self):
+        with open(self.path + ".tmp", "w") as f:
+            json.dump(self.state, f, indent=2)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(self.path + ".tmp", self.path)
+
+
+class CsvSink:
+    def __init__(self, path, checkpoint):
+        self.path = path
+        committed = checkpoint.state["output_bytes"] if checkpoint.state["chunks"] else 0
+        # Drop anything written after the last commit
+        with open(path, "ab") as f:
+            f.truncate(committed)
+        self.header = committed == 0
+
+    def write(self, frame, index):
+        with open(self.path, "a", newline="") as f:
+            frame.to_csv(f, index=False, header=self.header)
+            f.flush()
+            os.fsync(f.fileno())
+            size = f.tell()
+        self.header = False
+        return size
+
+
+class ParquetSink:
+    def __init__(self, path, checkpoint):
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+        committed = checkpoint.state["chunks"]
+        for name in os.listdir(path):
+            if name.startswith("part-") and (name.endswith(".tmp") or int(name[5:11]) >= committed):
+                os.remove(os.path.join(path, name))
+
+    def write(self, frame, index):
+        target = os.path.join(self.path, f"part-{index:06d}.parquet")
+        frame.to_parquet(target + ".tmp", index=False)
+        os.replace(target + ".tmp", target)
+        return sum(entry.stat().st_size for entry in os.scandir(self.path))
+
+
+def run(input_path, output, chunk_rows=DEFAULT_CHUNK_ROWS, restart=False, version=None):
+    registry = ModelRegistry()
+    checkpoint, resumed = Checkpoint.open(
+        output, input_path, chunk_rows, version or registry.active_version() or LEGACY_VERSION, restart,
+    )
+    state = checkpoint.state
+    if resumed and state["complete"]:
+        log.info("%s already complete (%d rows)", output, state["rows"])
+        return state
+    if resumed:
+        log.info("resuming %s at chunk %d (%d rows committed)", output, state["chunks"], state["rows"])
+    # Resumed jobs keep scoring with the version they started with
+    bundle = registry.load_version(state["model_version"])
+    sink = (ParquetSink if _is_parquet(output) else CsvSink)(output, checkpoint)
+    monitor = open_monitor(background=False)
+    if monitor is not None and state.get("drift"):
+        monitor.restore(state["drift"])
+    if not resumed:
+        checkpoint.save()
+
+    started = time.perf_counter()
+    scored = 0
+    for chunk in iter_chunks(input_path, state["chunk_rows"], state["rows"]):
+        size = sink.write(score_chunk(chunk, bundle, monitor), state["chunks"])
+        if monitor is not None:
+            state["drift"] = monitor.snapshot()
+        checkpoint.commit(len(chunk), size)
+        scored += len(chunk)
+        log.info(
+            "chunk %d: %d rows committed (%.0f rows/s, peak rss %.0fMB)",
+            state["chunks"], state["rows"], scored / (time.perf_counter() - started), peak_rss() / 2**20,
+        )
+    state["complete"] = True
+    checkpoint.save()
+    if monitor is not None:
+        write_report(monitor, output + ".drift.json")
+    return state
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Score a CSV/Parquet file larger than memory, resumably.")
+    parser.add_argument("input")
+    parser.add_argument("output")
+    parser.add_argument("--chunk-rows", type=int, default=DEFAULT_CHUNK_ROWS)
+    parser.add_argument("--version", help="registry version for a new job (default: ACTIVE)")
+    parser.add_argument("--restart", action="store_true", help="ignore an existing checkpoint")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(name)s %(message)s")
+    try:
+        state = run(args.input, args.output, args.chunk_rows, args.restart, args.version)
+    except CheckpointMismatch as exc:
+        parser.error(str(exc))
+    print(f"{state['rows']} rows in {state['chunks']} chunks -> {args.output} (peak rss {peak_rss() / 2**20:.0f}MB)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
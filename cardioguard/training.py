@@ -0,0 +1,424 @@
+# Training pipeline for the stacking model, with cached out-of-fold base-learner predictions
+#
+#   python -m cardioguard.training fit --output-dir build/model [--meta-C 1.0] [--publish]
+#   python -m cardioguard.training meta --C 0.01 0.1 1 10
+#   python -m cardioguard.training update --from-dir build/model --batch outcomes.csv --output-dir build/model-2 [--compare]
+#
+# Mirrors CR_Prediction.ipynb: SMOTE, an 80/20 stratified split, then a
+# StackingClassifier over an L1 logistic regression and the tuned 200-tree forest.
+# The expensive part of fitting that stack is the 5-fold cross_val_predict of the
+# base learners plus their full-data refit. Both are cached per base learner under
+# data/training_cache, keyed on the training data, the learner's hyperparameters,
+# the CV scheme and the scikit-learn version. Changing only the meta learner or the
+# threshold reuses them and fits in seconds.
+#
+# update folds a batch of newly labelled patients into an existing fit without the
+# full retrain. Before anything changes, the current base learners score the batch;
+# those patients are unseen by them, so the scores are out-of-fold and join the
+# cached out-of-fold matrix. The forest then grows --trees new trees on the batch
+# alone (warm start) and retires as many of its oldest trees, and the logistic meta
+# learner is refit on the whole out-of-fold matrix. The L1 logistic base learner is
+# kept as it is. The matrix and the batches seen so far are kept in
+# update_state.joblib next to the pickles, so updates chain. --compare also runs the
+# full pipeline on the training split plus every batch and reports both on the same
+# held-out split.
+#
+# Both fit and update record review_std in metrics.json: the low-confidence
+# threshold on the stacked score's tree spread, calibrated on the real patients of
+# the training split (see cardioguard.uncertainty).
+import argparse
+import hashlib
+import json
+import logging
+import os
+import sys
+import tempfile
+import time
+
+import joblib
+import numpy as np
+import pandas as pd
+import sklearn
+from sklearn.base import clone
+from sklearn.ensemble import RandomForestClassifier, StackingClassifier
+from sklearn.linear_model import LogisticRegression
+from sklearn.metrics import accuracy_score, f1_score, precision_score, recall_score, roc_auc_score
+from sklearn.model_selection import StratifiedKFold, cross_val_predict, train_test_split
+from sklearn.utils.class_weight import compute_class_weight
+
+from cardioguard.features import (
+    DATASET_PATH, FEATURE_COLUMNS, TARGET_COLUMN, dataset_errors, engineer_features, load_dataset, prepare_dataset,
+)
+from cardioguard.settings import data_path
+from cardioguard.uncertainty import calibrate_review_std
+
+log = logging.getLogger(__name__)
+
+CV_FOLDS = 5
+RANDOM_STATE = 42
+STACK_THRESHOLD = 0.42
+UPDATE_TREES = 20
+UPDATE_STATE = "update_state.joblib"
+
+
+def base_learners():
+    return [
+        ('lr', LogisticRegression(C=1, max_iter=1000, penalty='l1', solver='liblinear', random_state=RANDOM_STATE)),
+        ('best_rf', RandomForestClassifier(
+            bootstrap=False, max_depth=20, max_features='sqrt', min_samples_leaf=1,
+            min_samples_split=2, n_estimators=200, random_state=RANDOM_STATE, class_weight='balanced',
+        )),
+    ]
+
+
+def meta_learner(**params):
+    return LogisticRegression(**{"max_iter": 1000, "random_state": RANDOM_STATE, **params})
+
+
+def training_data(path=DATASET_PATH, smote=True):
+    raw, y = load_dataset(path)
+    X = engineer_features(raw)
+    if smote:
+        from imblearn.over_sampling import SMOTE
+
+        X, y = SMOTE(sampling_strategy='minority', random_state=RANDOM_STATE).fit_resample(X, y)
+    return train_test_split(X, y, test_size=0.2, stratify=y, random_state=RANDOM_STATE)
+
+
+def cv_splitter():
+    # What StackingClassifier(cv=5) resolves to for a classifier
+    return StratifiedKFold(n_splits=CV_FOLDS)
+
+
+def _digest(*parts):
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update(part if isinstance(part, bytes) else str(part).encode())
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+def data_key(X, y):
+    return _digest(
+        json.dumps(list(X.columns)),
+        np.ascontiguousarray(X.to_numpy(dtype=np.float64)).tobytes(),
+        np.ascontiguousarray(np.asarray(y, dtype=np.int64)).tobytes(),
+    )
+
+
+def learner_key(data_digest, name, estimator, cv):
+    params = json.dumps(estimator.get_params(deep=True), sort_keys=True, default=repr)
+    return _digest(data_digest, name, type(estimator).__name__, params, repr(cv), sklearn.__version__)
+
+
+class OOFCache:
+    def __init__(self, directory=None):
+        self.directory = directory or data_path("training_cache")
+        os.makedirs(self.directory, exist_ok=True)
+        self.hits = 0
+        self.misses = 0
+
+    def _path(self, key):
+        return os.path.join(self.directory, f"{key}.joblib")
+
+    def get(self, key):
+        path = self._path(key)
+        if not os.path.exists(path):
+            self.misses += 1
+            return None
+        self.hits += 1
+        return joblib.load(path)
+
+    def put(self, key, entry):
+        path = self._path(key)
+        joblib.dump(entry, path + ".tmp")
+        os.replace(path + ".tmp", path)
+
+
+def base_predictions(X, y, estimators, cache, n_jobs=-1):
+    # Returns (oof, fitted): out-of-fold P(y=1) per base learner and the full-data fits
+    digest = data_key(X, y)
+    cv = cv_splitter()
+    columns, fitted = [], []
+    for name, estimator in estimators:
+        key = learner_key(digest, name, estimator, cv)
+        entry = cache.get(key)
+        if entry is None:
+            started = time.perf_counter()
+            oof = cross_val_predict(clone(estimator), X, y, cv=cv, method="predict_proba", n_jobs=n_jobs)[:, 1]
+            entry = {"name": name, "oof": oof, "estimator": clone(estimator).fit(X, y),
+                     "seconds": time.perf_counter() - started}
+            cache.put(key, entry)
+            log.info("%s: out-of-fold predictions computed in %.1fs", name, entry["seconds"])
+        else:
+            log.info("%s: out-of-fold predictions reused (saved %.1fs)", name, entry["seconds"])
+        columns.append(entry["oof"])
+        fitted.append(entry["estimator"])
+    return np.column_stack(columns), fitted
+
+
+def assemble_stack(estimators, fitted, meta, X, y, oof):
+    # A plain StackingClassifier: base learners attached as prefit, meta learner fit on the cached OOF
+    stack = StackingClassifier(
+        estimators=[(name, model) for (name, _), model in zip(estimators, fitted)],
+        final_estimator=meta, cv="prefit",
+    )
+    stack.fit(X, y)
+    stack.final_estimator_ = clone(meta).fit(oof, np.searchsorted(stack.classes_, y))
+    # Report the notebook's parameters, not the assembly trick
+    stack.set_params(estimators=estimators, cv=CV_FOLDS)
+    return stack
+
+
+def evaluate(model, X, y, threshold=0.5):
+    proba = model.predict_proba(X)[:, 1]
+    predicted = (proba >= threshold).astype(int)
+    return {
+        "roc_auc": float(roc_auc_score(y, proba)),
+        "threshold": threshold,
+        "accuracy": float(accuracy_score(y, predicted)),
+        "precision": float(precision_score(y, predicted, zero_division=0)),
+        "recall": float(recall_score(y, predicted, zero_division=0)),
+        "f1": float(f1_score(y, predicted, zero_division=0)),
+    }
+
+
+def meta_scores(oof, y, candidates):
+    # Cross-validated AUC of each candidate meta learner on the cached OOF features
+    scores = {}
+    for label, meta in candidates.items():
+        proba = cross_val_predict(meta, oof, y, cv=cv_splitter(), method="predict_proba")[:, 1]
+        scores[label] = float(roc_auc_score(y, proba))
+    return scores
+
+
+def fit_stack(meta_params=None, threshold=STACK_THRESHOLD, cache=None, dataset_path=DATASET_PATH):
+    X_train, X_test, y_train, y_test = training_data(dataset_path)
+    estimators = base_learners()
+    oof, fitted = base_predictions(X_train, y_train, estimators, cache or OOFCache())
+    started = time.perf_counter()
+    stack = assemble_stack(estimators, fitted, meta_learner(**(meta_params or {})), X_train, y_train, oof)
+    # The tuned forest shipped as the standalone model is the stack's best_rf base learner
+    rf = stack.named_estimators_["best_rf"]
+    metrics = {
+        "stack": evaluate(stack, X_test, y_test, threshold),
+        "rf": evaluate(rf, X_test, y_test),
+        "meta_params": meta_params or {},
+        "train_rows": len(X_train),
+        "test_rows": len(X_test),
+        "assemble_seconds": time.perf_counter() - started,
+    }
+    return rf, stack, metrics, (X_train, y_train)
+
+
+def review_calibration(stack, dataset_path=DATASET_PATH):
+    # SMOTE's synthetic rows are left out: the threshold is set on patients like those being scored
+    X_train, _, _, _ = training_data(dataset_path, smote=False)
+    calibration = calibrate_review_std(stack, X_train)
+    log.info("review threshold: stack spread >= %.4f (%dth percentile of %d training patients)",
+             calibration["threshold"], calibration["percentile"], calibration["patients"])
+    return calibration
+
+
+def labelled_batch(path):
+    # Dataset-style records with a known outcome -> (features, y, rows skipped)
+    frame = pd.read_csv(path)
+    outcomes = pd.to_numeric(frame[TARGET_COLUMN], errors="coerce") if TARGET_COLUMN in frame else None
+    if outcomes is None:
+        raise ValueError(f"{path}: no {TARGET_COLUMN} column")
+    usable = outcomes.isin([0, 1]) & (dataset_errors(frame) == "")
+    X = engineer_features(prepare_dataset(frame[usable])).reset_index(drop=True)
+    return X, outcomes[usable].astype(int).reset_index(drop=True), int((~usable).sum())
+
+
+def initial_state(dataset_path=DATASET_PATH, cache=None):
+    # Out-of-fold matrix of the fit being updated, from the training cache
+    X_train, _, y_train, _ = training_data(dataset_path)
+    oof, _ = base_predictions(X_train, y_train, base_learners(), cache or OOFCache())
+    return {
+        "oof": oof,
+        "y": np.asarray(y_train, dtype=np.int64),
+        "X_batches": pd.DataFrame(columns=FEATURE_COLUMNS, dtype=np.float64),
+        "y_batches": np.empty(0, dtype=np.int64),
+        "batches": [],
+        "trees_grown": 0,
+    }
+
+
+def update_forest(forest, X, y, add, retire, seed):
+    # Warm start grows `add` trees on this batch alone; the `retire` oldest trees are then dropped
+    if retire >= len(forest.estimators_) + add:
+        raise ValueError(f"cannot retire {retire} of {len(forest.estimators_) + add} trees")
+    class_weight = forest.class_weight
+    if class_weight == "balanced":
+        # The existing trees saw SMOTE-balanced data; new trees are weighted to the same balance on their batch
+        weights = compute_class_weight("balanced", classes=forest.classes_, y=y)
+        forest.set_params(class_weight=dict(zip(forest.classes_, weights)))
+    forest.set_params(warm_start=True, n_estimators=len(forest.estimators_) + add, random_state=seed)
+    forest.fit(X, y)
+    forest.estimators_ = forest.estimators_[retire:]
+    forest.set_params(warm_start=False, n_estimators=len(forest.estimators_), class_weight=class_weight)
+
+
+def update_stack(stack, state, X, y, add=UPDATE_TREES, retire=None):
+    # In place: stack's best_rf gains `add` trees and loses `retire` (default: as many), meta learner refit
+    if len(np.unique(y)) < len(stack.classes_):
+        raise ValueError("a batch needs patients with and without the outcome")
+    retire = add if retire is None else retire
+    started = time.perf_counter()
+    # Scored before the update, so these are out-of-fold for the batch
+    oof = np.column_stack([model.predict_proba(X)[:, 1] for model in stack.estimators_])
+    update_forest(stack.named_estimators_["best_rf"], X, y, add, retire, RANDOM_STATE + 1 + state["trees_grown"])
+    state["oof"] = np.vstack([state["oof"], oof])
+    state["y"] = np.concatenate([state["y"], np.asarray(y, dtype=np.int64)])
+    stack.final_estimator_ = clone(stack.final_estimator_).fit(state["oof"], np.searchsorted(stack.classes_, state["y"]))
+    state["X_batches"] = pd.concat([state["X_batches"], X], ignore_index=True)
+    state["y_batches"] = np.concatenate([state["y_batches"], np.asarray(y, dtype=np.int64)])
+    state["trees_grown"] += add
+    entry = {
+        "rows": len(X), "positives": int(np.sum(y)), "trees_added": add, "trees_retired": retire,
+        "trees": len(stack.named_estimators_["best_rf"].estimators_), "meta_rows": len(state["y"]),
+        "seconds": time.perf_counter() - started,
+    }
+    state["batches"].append(entry)
+    return entry
+
+
+def full_retrain(stack, state, dataset_path=DATASET_PATH):
+    # What fit would produce with every batch added to its training split; fresh cache, so it is timed honestly
+    X_train, _, y_train, _ = training_data(dataset_path)
+    X = pd.concat([X_train, state["X_batches"]], ignore_index=True)
+    y = np.concatenate([np.asarray(y_train, dtype=np.int64), state["y_batches"]])
+    estimators = base_learners()
+    started = time.perf_counter()
+    with tempfile.TemporaryDirectory() as directory:
+        oof, fitted = base_predictions(X, y, estimators, OOFCache(directory))
+    retrained = assemble_stack(estimators, fitted, clone(stack.final_estimator_), X, y, oof)
+    return retrained, time.perf_counter() - started
+
+
+def _format_comparison(rows):
+    header = f"{'':<14}{'stack auc':>10}{'f1':>8}{'recall':>8}{'precision':>10}{'rf auc':>9}{'seconds':>9}"
+    lines = [header]
+    for label, result in rows.items():
+        stack, rf = result["stack"], result["rf"]
+        seconds = f"{result['seconds']:.1f}" if result.get("seconds") is not None else "-"
+        lines.append(
+            f"{label:<14}{stack['roc_auc']:>10.4f}{stack['f1']:>8.4f}{stack['recall']:>8.4f}"
+            f"{stack['precision']:>10.4f}{rf['roc_auc']:>9.4f}{seconds:>9}"
+        )
+    return "\n".join(lines)
+
+
+def run_update(args, cache):
+    stack = joblib.load(os.path.join(args.from_dir, "stack.pkl"))
+    state_path = os.path.join(args.from_dir, UPDATE_STATE)
+    state = joblib.load(state_path) if os.path.exists(state_path) else initial_state(args.dataset, cache)
+    _, X_test, _, y_test = training_data(args.dataset)
+    comparison = {"before": {"stack": evaluate(stack, X_test, y_test, args.threshold),
+                             "rf": evaluate(stack.named_estimators_["best_rf"], X_test, y_test), "seconds": None}}
+    seconds = 0.0
+    for path in args.batch:
+        X, y, skipped = labelled_batch(path)
+        entry = update_stack(stack, state, X, y, args.trees, args.retire)
+        entry["file"], entry["skipped"] = os.path.abspath(path), skipped
+        seconds += entry["seconds"]
+        log.info("%s: %d patients (%d skipped), +%d/-%d trees, meta refit on %d rows in %.2fs",
+                 path, entry["rows"], skipped, entry["trees_added"], entry["trees_retired"], entry["meta_rows"], entry["seconds"])
+    rf = stack.named_estimators_["best_rf"]
+    comparison["incremental"] = {"stack": evaluate(stack, X_test, y_test, args.threshold),
+                                 "rf": evaluate(rf, X_test, y_test), "seconds": seconds}
+    if args.compare:
+        retrained, retrain_seconds = full_retrain(stack, state, args.dataset)
+        comparison["full retrain"] = {"stack": evaluate(retrained, X_test, y_test, args.threshold),
+                                      "rf": evaluate(retrained.named_estimators_["best_rf"], X_test, y_test),
+                                      "seconds": retrain_seconds}
+
+    os.makedirs(args.output_dir, exist_ok=True)
+    rf_path = os.path.join(args.output_dir, "rf.pkl")
+    stack_path = os.path.join(args.output_dir, "stack.pkl")
+    joblib.dump(rf, rf_path)
+    joblib.dump(stack, stack_path)
+    joblib.dump(state, os.path.join(args.output_dir, UPDATE_STATE))
+    metrics = {
+        "stack": comparison["incremental"]["stack"],
+        "rf": comparison["incremental"]["rf"],
+        "update": {"from": os.path.abspath(args.from_dir), "batches": state["batches"][-len(args.batch):]},
+        "comparison": comparison,
+        "review_std": review_calibration(stack, args.dataset),
+    }
+    with open(os.path.join(args.output_dir, "metrics.json"), "w") as f:
+        json.dump(metrics, f, indent=2)
+    print(f"held-out split ({len(y_test)} rows), stack threshold {args.threshold:g}:")
+    print(_format_comparison(comparison))
+    if args.publish:
+        from cardioguard.registry import ModelRegistry
+
+        print(ModelRegistry().publish(rf_path, stack_path, metrics, notes=f"incremental update of {args.from_dir}"))
+    return 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Train the CardioGuard models with cached base-learner predictions.")
+    parser.add_argument("--dataset", default=DATASET_PATH)
+    parser.add_argument("--cache-dir")
+    commands = parser.add_subparsers(dest="command", required=True)
+    fit = commands.add_parser("fit", help="fit rf.pkl and stack.pkl")
+    fit.add_argument("--output-dir", required=True)
+    fit.add_argument("--meta-C", type=float, default=1.0)
+    fit.add_argument("--threshold", type=float, default=STACK_THRESHOLD)
+    fit.add_argument("--publish", action="store_true", help="publish the result to the model registry")
+    fit.add_argument("--verify", action="store_true",
+                     help="also fit StackingClassifier end to end and check the predictions match")
+    meta = commands.add_parser("meta", help="compare meta-learner C values on the cached OOF predictions")
+    meta.add_argument("--C", type=float, nargs="+", default=[0.01, 0.1, 1.0, 10.0])
+    update = commands.add_parser("update", help="fold newly labelled patients into an existing fit")
+    update.add_argument("--from-dir", required=True, help="output of fit or of a previous update")
+    update.add_argument("--batch", required=True, nargs="+", help="CSV files in the dataset layout, with TenYearCHD")
+    update.add_argument("--output-dir", required=True)
+    update.add_argument("--trees", type=int, default=UPDATE_TREES, help="trees grown per batch")
+    update.add_argument("--retire", type=int, help="oldest trees dropped per batch (default: --trees)")
+    update.add_argument("--threshold", type=float, default=STACK_THRESHOLD)
+    update.add_argument("--compare", action="store_true", help="also run a full retrain and compare")
+    update.add_argument("--publish", action="store_true", help="publish the result to the model registry")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(name)s %(message)s")
+    cache = OOFCache(args.cache_dir)
+
+    if args.command == "meta":
+        X_train, _, y_train, _ = training_data(args.dataset)
+        oof, _ = base_predictions(X_train, y_train, base_learners(), cache)
+        for label, auc in meta_scores(oof, y_train, {C: meta_learner(C=C) for C in args.C}).items():
+            print(f"C={label:<8g} cv roc_auc={auc:.4f}")
+        return 0
+
+    if args.command == "update":
+        return run_update(args, cache)
+
+    started = time.perf_counter()
+    rf, stack, metrics, (X_train, y_train) = fit_stack({"C": args.meta_C}, args.threshold, cache, args.dataset)
+    if args.verify:
+        reference = StackingClassifier(base_learners(), final_estimator=meta_learner(C=args.meta_C), cv=CV_FOLDS)
+        reference.fit(X_train, y_train)
+        deviation = float(np.max(np.abs(reference.predict_proba(X_train) - stack.predict_proba(X_train))))
+        metrics["verify_max_deviation"] = deviation
+        log.info("max deviation from an end-to-end StackingClassifier fit: %.2e", deviation)
+    metrics["review_std"] = review_calibration(stack, args.dataset)
+    os.makedirs(args.output_dir, exist_ok=True)
+    rf_path = os.path.join(args.output_dir, "rf.pkl")
+    stack_path = os.path.join(args.output_dir, "stack.pkl")
+    joblib.dump(rf, rf_path)
+    joblib.dump(stack, stack_path)
+    with open(os.path.join(args.output_dir, "metrics.json"), "w") as f:
+        json.dump(metrics, f, indent=2)
+    log.info("fit in %.1fs (cache hits=%d misses=%d)", time.perf_counter() - started, cache.hits, cache.misses)
+    print(json.dumps(metrics["stack"], indent=2))
+    if args.publish:
+        from cardioguard.registry import ModelRegistry
+
+        print(ModelRegistry().publish(rf_path, stack_path, metrics, notes=f"meta C={args.meta_C}"))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
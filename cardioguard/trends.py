@@ -0,0 +1,51 @@
+# Server-side downsampling and calendar bucketing for risk trend charts
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+
+MAX_TREND_POINTS = 300
+
+
+def lttb_indices(x, y, threshold):
+    # Largest-Triangle-Three-Buckets: keeps the visual shape of a series with `threshold` points
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    n = len(x)
+    if threshold >= n or threshold < 3:
+        return np.arange(n)
+
+    selected = np.empty(threshold, dtype=np.int64)
+    selected[0] = 0
+    selected[-1] = n - 1
+    edges = np.linspace(1, n - 1, threshold - 1).astype(np.int64)
+    a = 0
+    for i in range(threshold - 2):
+        start, stop = edges[i], edges[i + 1]
+        next_start, next_stop = edges[i + 1], edges[i + 2] if i + 2 < len(edges) else n
+        avg_x = x[next_start:next_stop].mean()
+        avg_y = y[next_start:next_stop].mean()
+        area = np.abs(
+            (x[a] - avg_x) * (y[start:stop] - y[a])
+            - (x[a] - x[start:stop]) * (avg_y - y[a])
+        )
+        a = start + int(np.argmax(area))
+        selected[i + 1] = a
+    return selected
+
+
+def downsample_history(history, max_points=MAX_TREND_POINTS, column="stack_prob"):
+    if len(history) <= max_points:
+        return history
+    keep = lttb_indices(history["ts"].to_numpy(), history[column].to_numpy(), max_points)
+    return history.iloc[keep]
+
+
+def bucket_start(ts, period):
+    moment = datetime.fromtimestamp(ts, tz=timezone.utc)
+    if period == "week":
+        day = moment.date() - timedelta(days=moment.weekday())
+    elif period == "month":
+        day = moment.date().replace(day=1)
+    else:
+        raise ValueError(f"Unknown rollup period: {period!r}")
+    return datetime(day.year, day.month, day.day, tzinfo=timezone.utc).timestamp()
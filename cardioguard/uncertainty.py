@@ -0,0 +1,138 @@
+# Prediction uncertainty from tree-vote dispersion, computed in the same pass as the probability.
+# Rows are scored in blocks of BLOCK_ROWS; the review threshold is calibrated per model at training.
+import numpy as np
+from sklearn.ensemble import RandomForestClassifier, StackingClassifier
+
+from cardioguard.settings import env_float
+
+INTERVAL = (10, 90)
+BLOCK_ROWS = 2048
+# Flag the 5% of training patients whose stacked score varies most across trees
+REVIEW_PERCENTILE = 95
+# Fallback for models trained before the threshold was recorded
+REVIEW_STD = 0.05
+
+
+def _tree_input(forest, X):
+    names = getattr(forest, "feature_names_in_", None)
+    if names is not None and hasattr(X, "columns") and list(X.columns) != list(names):
+        raise ValueError("Feature names do not match the columns the forest was trained on")
+    return np.ascontiguousarray(X, dtype=np.float32)
+
+
+def tree_probabilities(forest, X):
+    # (n_trees, n_samples, n_classes); averaging in tree order reproduces predict_proba exactly
+    X = _tree_input(forest, X)
+    return np.stack([tree.predict_proba(X, check_input=False) for tree in forest.estimators_])
+
+
+def _forest_mean(per_tree):
+    total = np.zeros(per_tree.shape[1:])
+    for proba in per_tree:
+        total += proba
+    return total / len(per_tree)
+
+
+def _summary(proba, spread):
+    # spread: (n_draws, n_samples) of P(y=1)
+    low, high = np.percentile(spread, INTERVAL, axis=0)
+    return {
+        "proba": proba,
+        "prob": proba[:, 1],
+        "pred": np.argmax(proba, axis=1),
+        "std": spread.std(axis=0),
+        "low": low,
+        "high": high,
+    }
+
+
+def _forest_prediction(forest, X):
+    per_tree = tree_probabilities(forest, X)
+    return _summary(_forest_mean(per_tree), per_tree[:, :, 1])
+
+
+def _stack_prediction(stack, X):
+    columns, forest_column, per_tree = [], None, None
+    for estimator, method in zip(stack.estimators_, stack.stack_method_):
+        if isinstance(estimator, RandomForestClassifier) and method == "predict_proba" and per_tree is None:
+            trees = tree_probabilities(estimator, X)
+            output = _forest_mean(trees)
+            forest_column, per_tree = len(columns), trees[:, :, 1]
+        else:
+            output = getattr(estimator, method)(X)
+        output = np.asarray(output)
+        if output.ndim == 1:
+            output = output[:, None]
+        elif method == "predict_proba" and output.shape[1] == 2:
+            # Binary problems feed only P(y=1) to the meta learner, as StackingClassifier does
+            output = output[:, 1:]
+        columns.append(output)
+    meta_input = np.hstack(columns)
+    proba = stack.final_estimator_.predict_proba(meta_input)
+    if per_tree is None:
+        return _summary(proba, proba[None, :, 1])
+    # Meta-learner output with each tree's vote standing in for the forest average
+    draws = np.repeat(meta_input[None], len(per_tree), axis=0)
+    draws[:, :, forest_column] = per_tree
+    spread = stack.final_estimator_.predict_proba(draws.reshape(-1, meta_input.shape[1]))[:, 1]
+    return _summary(proba, spread.reshape(len(per_tree), -1))
+
+
+def _predict_block(model, X):
+    if isinstance(model, RandomForestClassifier):
+        return _forest_prediction(model, X)
+    if isinstance(model, StackingClassifier) and not model.passthrough:
+        return _stack_prediction(model, X)
+    proba = model.predict_proba(X)
+    return _summary(proba, proba[None, :, 1])
+
+
+def predict_with_dispersion(model, X):
+    # Returns prob / pred (as predict_proba / predict would) plus std, low and high across trees
+    if len(X) <= BLOCK_ROWS:
+        return _predict_block(model, X)
+    rows = X.iloc if hasattr(X, "iloc") else X
+    parts = [_predict_block(model, rows[start:start + BLOCK_ROWS]) for start in range(0, len(X), BLOCK_ROWS)]
+    return {key: np.concatenate([part[key] for part in parts]) for key in parts[0]}
+
+
+def calibrate_review_std(stack, X, percentile=REVIEW_PERCENTILE):
+    # The review threshold for a model: a percentile of its stacked-score spread over X
+    spread = predict_with_dispersion(stack, X)["std"]
+    return {
+        "threshold": float(np.percentile(spread, percentile)),
+        "percentile": percentile,
+        "patients": len(spread),
+        "spread_percentiles": {str(q): float(np.percentile(spread, q)) for q in (50, 75, 90, 95, 99)},
+    }
+
+
+def review_std(bundle=None):
+    # CARDIOGUARD_REVIEW_STD, else the threshold recorded for the bundle's model, else REVIEW_STD
+    override = env_float("CARDIOGUARD_REVIEW_STD", None)
+    if override is not None:
+        return override
+    manifest = getattr(bundle, "manifest", None) or {}
+    recorded = manifest.get("metrics", {}).get("review_std")
+    return recorded["threshold"] if recorded else REVIEW_STD
+
+
+def needs_review(std, threshold=None):
+    return np.asarray(std) >= (review_std() if threshold is None else threshold)
+
+
+SCORE_COLUMNS = ["rf_prob", "stack_prob", "rf_std", "stack_std", "stack_low", "stack_high"]
+
+
+def score_columns(bundle, X):
+    # Both models' probabilities and their dispersion, keyed by SCORE_COLUMNS; one traversal per model
+    rf = predict_with_dispersion(bundle.rf, X)
+    stack = predict_with_dispersion(bundle.stack, X)
+    return {
+        "rf_prob": rf["prob"],
+        "stack_prob": stack["prob"],
+        "rf_std": rf["std"],
+        "stack_std": stack["std"],
+        "stack_low": stack["low"],
+        "stack_high": stack["high"],
+    }
@@ -0,0 +1,38 @@
+import os
+
+import pytest
+
+from cardioguard.features import DATASET_PATH, engineer_features, load_dataset
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DATASET = os.path.join(ROOT, DATASET_PATH)
+
+
+@pytest.fixture(scope="session")
+def dataset_path():
+    return DATASET
+
+
+@pytest.fixture(scope="session")
+def dataset():
+    # (engineered features, outcomes) of Data_cardiovascular_risk.csv
+    raw, y = load_dataset(DATASET)
+    return engineer_features(raw), y
+
+
+@pytest.fixture(scope="session")
+def bundle(dataset):
+    # A small forest and stack of the app's shape, fitted on the dataset
+    from sklearn.ensemble import RandomForestClassifier, StackingClassifier
+    from sklearn.linear_model import LogisticRegression
+
+    from cardioguard.registry import ModelBundle
+
+    features, y = dataset
+    rf = RandomForestClassifier(n_estimators=20, max_depth=8, class_weight="balanced", random_state=0)
+    stack = StackingClassifier(
+        [("lr", LogisticRegression(solver="liblinear")), ("best_rf", rf)],
+        final_estimator=LogisticRegression(max_iter=1000), cv=3,
+    )
+    stack.fit(features, y)
+    return ModelBundle("test", stack.named_estimators_["best_rf"], stack)
@@ -0,0 +1,20 @@
+import numpy as np
+
+from cardioguard.batch import OUTPUT_COLUMNS, score_matrix
+
+
+def test_score_matrix_matches_predict_proba_across_processes(bundle, dataset):
+    features, _ = dataset
+    # A shuffled index checks results land on their own rows, not in completion order
+    features = features.sample(frac=1, random_state=0)
+    output = score_matrix(features, processes=2, chunk_rows=500, bundle=bundle)
+    assert output.index.equals(features.index)
+    np.testing.assert_allclose(output["stack_prob"], bundle.stack.predict_proba(features)[:, 1], rtol=0, atol=1e-12)
+    np.testing.assert_allclose(output["rf_prob"], bundle.rf.predict_proba(features)[:, 1], rtol=0, atol=1e-12)
+    assert not output[OUTPUT_COLUMNS].isna().any().any()
+
+
+def test_score_matrix_of_no_rows(bundle, dataset):
+    features, _ = dataset
+    output = score_matrix(features.head(0), processes=2, bundle=bundle)
+    assert output.empty and list(output.columns) == [*OUTPUT_COLUMNS, "needs_review"]
@@ -0,0 +1,21 @@
+import os
+
+import pytest
+
+from cardioguard.bulk_reports import _unique_name, export_reports
+
+
+def test_repeated_ids_never_collide_with_later_real_ones():
+    seen = set()
+    for name in ("p.pdf", "p.pdf", "p_2.pdf", "p.pdf", "q.pdf"):
+        name = _unique_name(name, seen)
+        assert name not in seen
+        seen.add(name)
+    assert seen == {"p.pdf", "p_2.pdf", "p_2_2.pdf", "p_3.pdf", "q.pdf"}
+
+
+def test_a_failed_export_leaves_no_temporary_file(tmp_path):
+    destination = str(tmp_path / "reports.zip")
+    with pytest.raises(FileNotFoundError):
+        export_reports(str(tmp_path / "missing.csv"), destination, processes=1)
+    assert os.listdir(tmp_path) == []
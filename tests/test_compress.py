@@ -0,0 +1,52 @@
+from copy import deepcopy
+
+import numpy as np
+import pytest
+from sklearn.tree import DecisionTreeClassifier
+
+from cardioguard.compress import _prune_mask, _rebuild, forests, keep_trees, node_count, prune_forest, tree_order
+
+
+def test_lossless_collapse_keeps_predictions(bundle, dataset):
+    features, _ = dataset
+    forest = bundle.rf
+    pruned = prune_forest(deepcopy(forest), 0.0)
+    assert np.array_equal(pruned.predict_proba(features), forest.predict_proba(features))
+    assert node_count(pruned) <= node_count(forest)
+
+
+@pytest.mark.parametrize("alpha", [3e-4, 5e-4, 1e-3, 5e-3])
+def test_rebuild_matches_sklearn_cost_complexity_pruning(dataset, alpha):
+    features, y = dataset
+    full = DecisionTreeClassifier(random_state=0).fit(features, y)
+    reference = DecisionTreeClassifier(random_state=0, ccp_alpha=alpha).fit(features, y)
+    rebuilt = deepcopy(full)
+    rebuilt.tree_ = _rebuild(full.tree_, _prune_mask(full.tree_, alpha))
+    assert rebuilt.tree_.node_count <= reference.tree_.node_count
+    assert np.array_equal(rebuilt.predict_proba(features), reference.predict_proba(features))
+
+
+def test_rebuilt_tree_is_compact(dataset):
+    features, y = dataset
+    tree = DecisionTreeClassifier(random_state=0, max_depth=12).fit(features, y).tree_
+    rebuilt = _rebuild(tree, _prune_mask(tree, 1e-3))
+    assert rebuilt.node_count < tree.node_count
+    leaves = rebuilt.children_left == -1
+    assert np.all(rebuilt.children_right[leaves] == -1)
+    assert np.all(rebuilt.children_left[~leaves] > np.flatnonzero(~leaves))
+    assert rebuilt.max_depth <= tree.max_depth
+
+
+def test_keep_trees_uses_the_selection_order(bundle, dataset):
+    features, y = dataset
+    forest = deepcopy(bundle.rf)
+    order = tree_order(forest, features, y)
+    assert sorted(order) == list(range(len(bundle.rf.estimators_)))
+    kept = keep_trees(forest, order, 5)
+    assert kept.n_estimators == 5
+    originals = [bundle.rf.estimators_[i] for i in sorted(order[:5])]
+    assert all(np.array_equal(a.tree_.threshold, b.tree_.threshold) for a, b in zip(kept.estimators_, originals))
+
+
+def test_forests_finds_the_stacked_forest(bundle):
+    assert list(forests(bundle.stack)) == [bundle.stack.named_estimators_["best_rf"]]
@@ -0,0 +1,92 @@
+import numpy as np
+import pytest
+
+from cardioguard.drift import DriftMonitor, FeatureSketch, build_reference, ks_distance, psi
+from cardioguard.features import FEATURE_COLUMNS
+
+
+@pytest.fixture(scope="module")
+def reference(dataset_path):
+    return build_reference(dataset_path)
+
+
+def test_psi_and_ks_of_identical_distributions_are_zero():
+    expected = np.array([0.1, 0.2, 0.3, 0.4])
+    assert psi(expected, expected) == pytest.approx(0.0)
+    assert ks_distance(expected, expected) == pytest.approx(0.0)
+
+
+def test_psi_and_ks_grow_with_the_shift():
+    expected = np.full(4, 0.25)
+    small = np.array([0.2, 0.25, 0.25, 0.3])
+    large = np.array([0.05, 0.15, 0.3, 0.5])
+    assert 0 < psi(expected, small) < psi(expected, large)
+    assert ks_distance(expected, small) == pytest.approx(0.05)
+    assert ks_distance(expected, large) == pytest.approx(0.3)
+
+
+def test_psi_tolerates_empty_bins():
+    assert np.isfinite(psi(np.array([0.5, 0.5, 0.0]), np.array([0.0, 0.5, 0.5])))
+
+
+def test_sketch_matches_numpy_across_batches():
+    rng = np.random.default_rng(0)
+    values = rng.normal(50, 10, size=10_000)
+    edges = np.quantile(values, np.linspace(0, 1, 11)[1:-1])
+    sketch = FeatureSketch(edges)
+    for batch in np.array_split(values, 37):
+        sketch.update(batch)
+    assert sketch.n == len(values)
+    assert sketch.mean == pytest.approx(values.mean())
+    assert sketch.variance == pytest.approx(values.var())
+    assert sketch.counts.sum() == len(values)
+    assert np.array_equal(sketch.counts, np.bincount(np.searchsorted(edges, values, side="right"), minlength=len(edges) + 1))
+
+
+def test_training_data_does_not_drift_from_itself(reference, dataset):
+    features, _ = dataset
+    monitor = DriftMonitor(reference, background=False)
+    monitor.observe(features[FEATURE_COLUMNS].to_numpy())
+    scores = monitor.compute_scores()
+    for column in FEATURE_COLUMNS:
+        assert scores[column]["n"] == len(features)
+        assert scores[column]["psi"] == pytest.approx(0.0, abs=1e-6)
+        assert scores[column]["ks"] == pytest.approx(0.0, abs=1e-9)
+
+
+def test_shifted_inputs_are_detected(reference, dataset):
+    features, _ = dataset
+    shifted = features[FEATURE_COLUMNS].copy()
+    shifted["age"] += 15
+    monitor = DriftMonitor(reference, background=False)
+    monitor.observe(shifted.to_numpy())
+    scores = monitor.compute_scores()
+    assert scores["age"]["psi"] > 0.25
+    assert scores["age"]["mean_shift"] == pytest.approx(15 / reference["age"]["std"])
+    assert scores["sysBP"]["psi"] == pytest.approx(0.0, abs=1e-6)
+
+
+def test_window_resets_but_totals_do_not(reference, dataset):
+    features, _ = dataset
+    monitor = DriftMonitor(reference, background=False, min_window=30)
+    monitor.observe(features[FEATURE_COLUMNS].to_numpy()[:100])
+    assert monitor.compute_scores()["age"]["window_n"] == 100
+    scores = monitor.compute_scores()
+    assert "window_n" not in scores["age"] and scores["age"]["n"] == 100
+
+
+def test_snapshot_restore_round_trip(reference, dataset):
+    features, _ = dataset
+    rows = features[FEATURE_COLUMNS].to_numpy()
+    whole = DriftMonitor(reference, background=False)
+    whole.observe(rows)
+    first = DriftMonitor(reference, background=False)
+    first.observe(rows[:1000])
+    resumed = DriftMonitor(reference, background=False)
+    resumed.restore(first.snapshot())
+    resumed.observe(rows[1000:])
+    expected, actual = whole.compute_scores(), resumed.compute_scores()
+    for column in FEATURE_COLUMNS:
+        assert actual[column]["n"] == expected[column]["n"]
+        assert actual[column]["psi"] == pytest.approx(expected[column]["psi"])
+        assert actual[column]["mean"] == pytest.approx(expected[column]["mean"])
@@ -0,0 +1,55 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from cardioguard.features import dataset_errors, scorable_features
+
+
+@pytest.fixture
+def records(dataset_path):
+    return pd.read_csv(dataset_path).head(20).reset_index(drop=True)
+
+
+def test_dataset_rows_are_all_scorable(dataset_path):
+    frame = pd.read_csv(dataset_path)
+    assert (dataset_errors(frame) == "").all()
+    features, errors = scorable_features(frame)
+    assert len(features) == len(frame) and (errors == "").all()
+
+
+@pytest.mark.parametrize("column, value, message", [
+    ("sex", None, "sex: missing"),
+    ("sex", "X", "sex: expected M/F or 1/0"),
+    ("is_smoking", "maybe", "is_smoking: expected YES/NO or 1/0"),
+    ("sysBP", "high", "sysBP: not a number"),
+    ("totChol", -5, "totChol: out of range"),
+    ("glucose", np.inf, "glucose: out of range"),
+    ("age", 0, "age: must be greater than 0"),
+    ("diaBP", 0, "diaBP: must be greater than 0"),
+    ("diabetes", 2, "diabetes: expected 0 or 1"),
+])
+def test_dataset_errors_explain_the_bad_row(records, column, value, message):
+    records[column] = records[column].astype(object)
+    records.loc[3, column] = value
+    errors = dataset_errors(records)
+    assert errors[3] == message
+    assert (errors.drop(index=3) == "").all()
+
+
+def test_gaps_are_imputed_not_rejected(records):
+    records.loc[1, ["glucose", "BMI", "is_smoking"]] = np.nan
+    assert dataset_errors(records)[1] == ""
+
+
+def test_missing_columns_are_gaps(records):
+    assert (dataset_errors(records.drop(columns=["glucose"])) == "").all()
+    assert (dataset_errors(records.drop(columns=["sex"])) == "sex: missing").all()
+
+
+def test_scorable_features_drop_rejected_rows_and_stay_finite(records):
+    records.loc[[2, 5], "age"] = 0
+    records.loc[7, "diaBP"] = 0
+    features, errors = scorable_features(records)
+    assert list(features.index) == [i for i in range(20) if i not in (2, 5, 7)]
+    assert np.isfinite(features.to_numpy(dtype=float)).all()
+    assert list(errors[errors != ""].index) == [2, 5, 7]
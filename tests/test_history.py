@@ -0,0 +1,52 @@
+from datetime import datetime, timezone
+
+import pytest
+
+from cardioguard.history import HistoryStore
+
+
+def utc(*args):
+    return datetime(*args, tzinfo=timezone.utc).timestamp()
+
+
+@pytest.fixture
+def store(tmp_path):
+    return HistoryStore(str(tmp_path / "history.sqlite3"), batch_size=1, flush_interval=0.01)
+
+
+def test_writes_are_read_back_after_a_flush(store):
+    store.record_assessment("a", {"age": 50}, 0.2, 0.3, "Low", ts=utc(2024, 3, 4))
+    store.record_assessment("a", {"age": 51}, 0.4, 0.5, "Moderate", ts=utc(2024, 3, 6))
+    store.record_assessment("b", {"age": 60}, 0.7, 0.8, "High", ts=utc(2024, 3, 5))
+    store.save_checklist("a", "Low", [True, False])
+    store.flush()
+    assert store.count("a") == 2 and store.count("c") == 0
+    history = store.history("a")
+    assert list(history["stack_prob"]) == [0.3, 0.5]
+    assert list(history["risk_level"]) == ["Low", "Moderate"]
+    assert store.checklist("a", "Low") == [True, False]
+    assert store.checklist("a", "High") is None
+
+
+def test_rollups_count_each_assessment_once(store):
+    for ts, stack_prob in ((utc(2024, 3, 4), 0.2), (utc(2024, 3, 7), 0.4), (utc(2024, 4, 2), 0.9)):
+        store.record_assessment("a", {}, 0.1, stack_prob, "Low", ts=ts)
+    weekly = store.rollup("a", "week")
+    assert list(weekly["n"]) == [2, 1]
+    assert weekly["stack_mean"].iloc[0] == pytest.approx(0.3)
+    assert (weekly["stack_min"].iloc[0], weekly["stack_max"].iloc[0]) == (0.2, 0.4)
+    assert list(store.rollup("a", "month")["n"]) == [2, 1]
+    with pytest.raises(ValueError):
+        store.rollup("a", "year")
+
+
+def test_the_writer_survives_a_failed_write(store):
+    # risk_level cannot be bound, so the insert fails; its rollups must not be committed without it
+    store.record_assessment("a", {}, 0.1, 0.2, ["not", "a", "level"], ts=utc(2024, 3, 4))
+    store.flush()
+    assert store.stats()["batches_failed"] == 1
+    assert store.count("a") == 0 and store.rollup("a", "week").empty
+    store.record_assessment("a", {}, 0.1, 0.2, "Low", ts=utc(2024, 3, 4))
+    assert store.count("a") == 1
+    assert list(store.rollup("a", "week")["n"]) == [1]
+    assert store.stats()["rows_dropped"] == 3
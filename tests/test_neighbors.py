@@ -0,0 +1,61 @@
+import logging
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from cardioguard.features import engineer_features, prepare_dataset
+from cardioguard.neighbors import NeighborIndex, load_index
+
+
+@pytest.fixture
+def lines(dataset_path):
+    with open(dataset_path, "rb") as f:
+        return f.read().splitlines(keepends=True)
+
+
+@pytest.fixture
+def queries(dataset_path):
+    frame = pd.read_csv(dataset_path).sample(25, random_state=0)
+    return engineer_features(prepare_dataset(frame))
+
+
+def neighbours(index, queries):
+    return [index.tree.query((queries.iloc[[i]].to_numpy() - index.mean) / index.scale, k=20)[1][0]
+            for i in range(len(queries))]
+
+
+def assert_same_index(index, rebuilt, queries):
+    np.testing.assert_array_equal(index.features, rebuilt.features)
+    np.testing.assert_array_equal(index.outcomes, rebuilt.outcomes)
+    assert (index.dataset_bytes, index.dataset_sha256) == (rebuilt.dataset_bytes, rebuilt.dataset_sha256)
+    for found, expected in zip(neighbours(index, queries), neighbours(rebuilt, queries)):
+        np.testing.assert_array_equal(found, expected)
+    assert index.query(queries.iloc[[0]]) | {"seconds": 0} == rebuilt.query(queries.iloc[[0]]) | {"seconds": 0}
+
+
+def test_appended_rows_extend_the_index_to_what_a_rebuild_gives(tmp_path, lines, queries, caplog):
+    csv, path = tmp_path / "patients.csv", str(tmp_path / "neighbors.joblib")
+    csv.write_bytes(b"".join(lines[:2001]))
+    assert load_index(path, str(csv)).patients == 2000
+    csv.write_bytes(b"".join(lines))
+    with caplog.at_level(logging.INFO, logger="cardioguard.neighbors"):
+        index = load_index(path, str(csv))
+    assert "extended by" in caplog.text and "built" not in caplog.text
+    assert index.patients == len(lines) - 1
+    assert_same_index(index, NeighborIndex.build(str(csv)), queries)
+    # The extended index was persisted
+    assert_same_index(load_index(path, str(csv)), index, queries)
+
+
+def test_an_edit_that_is_not_an_append_forces_a_rebuild(tmp_path, lines, queries, caplog):
+    csv, path = tmp_path / "patients.csv", str(tmp_path / "neighbors.joblib")
+    csv.write_bytes(b"".join(lines))
+    load_index(path, str(csv))
+    # Two existing rows swapped, then a row appended: the file grew, but not only at the end
+    edited = [lines[0], lines[2], lines[1], *lines[3:], lines[10]]
+    csv.write_bytes(b"".join(edited))
+    with caplog.at_level(logging.INFO, logger="cardioguard.neighbors"):
+        index = load_index(path, str(csv))
+    assert "built over" in caplog.text and "extended" not in caplog.text
+    assert_same_index(index, NeighborIndex.build(str(csv)), queries)
@@ -0,0 +1,109 @@
+import json
+import os
+
+import joblib
+import numpy as np
+import pytest
+
+from cardioguard.registry import (
+    ModelRegistry, ModelValidationError, golden_inputs, golden_records, validate_bundle,
+)
+
+
+@pytest.fixture
+def pickles(tmp_path, bundle):
+    paths = {}
+    for name in ("rf", "stack"):
+        paths[name] = str(tmp_path / f"{name}.pkl")
+        joblib.dump(getattr(bundle, name), paths[name])
+    return paths
+
+
+@pytest.fixture
+def registry(tmp_path):
+    return ModelRegistry(str(tmp_path / "registry"))
+
+
+def edit_manifest(registry, version, edit):
+    path = os.path.join(registry.root, version, "manifest.json")
+    with open(path) as f:
+        manifest = json.load(f)
+    edit(manifest)
+    with open(path, "w") as f:
+        json.dump(manifest, f)
+
+
+def test_publish_stores_golden_inputs_next_to_their_outputs(registry, pickles, bundle):
+    version = registry.publish(pickles["rf"], pickles["stack"], {"auc": 0.7}, version="v1")
+    assert registry.list_versions() == ["v1"]
+    assert not [entry for entry in os.listdir(registry.root) if entry.startswith(".")]
+    manifest = registry.manifest(version)
+    assert manifest["golden_inputs"] == golden_records()
+    expected = bundle.stack.predict_proba(golden_inputs(manifest["golden_inputs"]))[:, 1]
+    assert np.allclose(manifest["golden"]["stack"], expected, rtol=0, atol=1e-12)
+    with pytest.raises(FileExistsError):
+        registry.publish(pickles["rf"], pickles["stack"], version="v1")
+
+
+def test_golden_outputs_are_compared_row_by_row(registry, pickles):
+    registry.publish(pickles["rf"], pickles["stack"], version="v1")
+    loaded = registry.load_version("v1")
+    # Reordered rows with their outputs still validate
+    reordered = dict(loaded.manifest)
+    order = np.arange(len(reordered["golden_inputs"]))[::-1]
+    reordered["golden_inputs"] = [reordered["golden_inputs"][i] for i in order]
+    reordered["golden"] = {name: [values[i] for i in order] for name, values in reordered["golden"].items()}
+    loaded.manifest = reordered
+    validate_bundle(loaded)
+
+    edit_manifest(registry, "v1", lambda manifest: manifest["golden"]["rf"].__setitem__(3, 0.5))
+    with pytest.raises(ModelValidationError, match="rf deviates .* on golden row 3"):
+        registry.load_version("v1")
+
+
+def test_a_tampered_artifact_is_rejected(registry, pickles):
+    registry.publish(pickles["rf"], pickles["stack"], version="v1")
+    with open(os.path.join(registry.root, "v1", "rf.pkl"), "ab") as f:
+        f.write(b"\0")
+    with pytest.raises(ModelValidationError, match="checksum mismatch"):
+        registry.load_version("v1")
+
+
+def test_activate_swaps_and_rollback_swaps_back(registry, pickles):
+    for version in ("v1", "v2"):
+        registry.publish(pickles["rf"], pickles["stack"], version=version)
+    with pytest.raises(KeyError):
+        registry.activate("v3")
+    swaps = []
+    registry.on_swap(lambda previous, bundle: swaps.append((previous.version, bundle.version)))
+
+    registry.activate("v1")
+    assert registry.active_version() == "v1"
+    assert not os.path.exists(os.path.join(registry.root, "ACTIVE.tmp"))
+    assert registry.refresh() and registry.current().version == "v1"
+    assert not registry.refresh()
+
+    registry.activate("v2")
+    held = registry.current()
+    assert registry.refresh()
+    registry.activate("v1")
+    assert registry.refresh()
+    assert registry.current().version == "v1"
+    assert swaps == [("v1", "v2"), ("v2", "v1")]
+    # A reader holding the old bundle keeps a complete, untouched one
+    assert held.version == "v1" and held.ready
+    assert registry.current() is not held
+
+
+def test_a_version_that_fails_validation_is_never_served(registry, pickles):
+    for version in ("v1", "v2"):
+        registry.publish(pickles["rf"], pickles["stack"], version=version)
+    registry.activate("v1")
+    registry.refresh()
+    edit_manifest(registry, "v2", lambda manifest: manifest["golden"]["stack"].__setitem__(0, -1.0))
+    registry.activate("v2")
+    assert not registry.refresh()
+    assert registry.current().version == "v1"
+    assert registry.stats()["rejected_versions"] == 1
+    # Rejected once, not reloaded on every poll
+    assert not registry.refresh()
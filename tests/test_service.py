@@ -0,0 +1,138 @@
+import asyncio
+import io
+import json
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from cardioguard import service
+from cardioguard.features import scorable_features
+from cardioguard.service import RiskService, validate_fields
+
+
+@pytest.fixture
+def worker_bundle(monkeypatch, bundle):
+    # What _init_worker sets in each pool process
+    monkeypatch.setattr(service, "_bundle", bundle)
+    return bundle
+
+
+def test_validate_fields_keeps_the_valid_ones():
+    accepted, errors = validate_fields({"sysBP": "150", "age": 200, "colour": 1, "BMI": "heavy"})
+    assert accepted == {"sysBP": 150.0}
+    assert errors == {"age": "outside [18, 100]", "colour": "unknown field", "BMI": "not a number"}
+    assert validate_fields([1, 2]) == ({}, {"_": "expected a JSON object of field: value"})
+
+
+def test_a_burst_of_updates_is_scored_once_with_the_latest_record(worker_bundle):
+    async def scenario():
+        with ThreadPoolExecutor(1) as executor:
+            risk = RiskService(executor, concurrency=1, window=0.01)
+            client = risk.connect("widget")
+            for value in range(100, 150):
+                risk.submit(client, {"sysBP": value})
+            assert risk.batcher.depth == 1
+            runner = asyncio.create_task(risk.batcher.run())
+            messages = await asyncio.wait_for(client.messages(), 5)
+            runner.cancel()
+            return risk, client, messages
+
+    risk, client, messages = asyncio.run(scenario())
+    assert client.record["sysBP"] == 149
+    assert [message["event"] for message in messages] == ["risk"]
+    assert messages[0]["seq"] == client.seq == 50
+    assert risk.batcher.batches == 1 and risk.batcher.rows == 1
+    assert 0 <= messages[0]["stack_prob"] <= 1
+
+
+def test_invalid_update_is_reported_and_not_queued(worker_bundle):
+    async def scenario():
+        risk = RiskService(None, concurrency=1)
+        client = risk.connect("widget")
+        risk.batcher.discard(client)
+        errors = risk.submit(client, {"glucose": 1000})
+        return risk, client, errors, await client.messages()
+
+    risk, client, errors, messages = asyncio.run(scenario())
+    assert errors == {"glucose": "outside [50, 300]"}
+    assert risk.batcher.depth == 0 and client.seq == 0
+    assert messages == [{"event": "error", "seq": 0, "errors": errors}]
+
+
+def ndjson_lines(dataset_path, count):
+    frame = pd.read_csv(dataset_path).head(count)
+    return [(i + 1, line.encode()) for i, line in enumerate(frame.to_json(orient="records", lines=True).splitlines())]
+
+
+def test_ndjson_bad_lines_get_inline_errors(worker_bundle, dataset_path):
+    lines = ndjson_lines(dataset_path, 6)
+    lines[1] = (2, b'{"age": 50, "sex": "M"')
+    lines[2] = (3, b'[1, 2, 3]')
+    lines[3] = (4, lines[3][1].replace(b'"age":', b'"patient_id":"p4","age":0,"x":'))
+    payload, rejected, observed = service.score_ndjson(lines)
+    results = [json.loads(line) for line in payload.decode().splitlines()]
+    assert [result["line"] for result in results] == [1, 2, 3, 4, 5, 6]
+    assert rejected == 3 and len(observed) == 3
+    assert results[1]["error"].startswith("invalid JSON")
+    assert results[2]["error"] == "expected a JSON object"
+    assert results[3] == {"line": 4, "id": "p4", "error": "age: must be greater than 0"}
+    for result in (results[0], results[4], results[5]):
+        assert "error" not in result and 0 <= result["stack_prob"] <= 1
+
+
+def test_ndjson_results_match_direct_scoring(worker_bundle, dataset_path):
+    payload, rejected, _ = service.score_ndjson(ndjson_lines(dataset_path, 50))
+    results = pd.read_json(io.StringIO(payload.decode()), lines=True)
+    features, _ = scorable_features(pd.read_csv(dataset_path).head(50))
+    assert rejected == 0
+    np.testing.assert_allclose(results["stack_prob"], worker_bundle.stack.predict_proba(features)[:, 1], atol=1e-12)
+
+
+def test_ndjson_scoring_failure_fails_only_its_rows(worker_bundle, dataset_path, monkeypatch):
+    def broken(bundle, features):
+        raise ValueError("boom")
+
+    monkeypatch.setattr(service, "score_columns", broken)
+    lines = ndjson_lines(dataset_path, 4)
+    lines[0] = (1, b"not json")
+    payload, rejected, observed = service.score_ndjson(lines)
+    results = [json.loads(line) for line in payload.decode().splitlines()]
+    assert rejected == 4 and observed is None
+    assert results[0]["error"].startswith("invalid JSON")
+    assert all(result["error"] == "could not be scored: boom" for result in results[1:])
+
+
+def test_chunk_errors_cover_every_line():
+    payload = service.chunk_errors([(7, b"{}"), (9, b"{}")], "could not be scored: worker died")
+    assert [json.loads(line) for line in payload.decode().splitlines()] == [
+        {"line": 7, "error": "could not be scored: worker died"},
+        {"line": 9, "error": "could not be scored: worker died"},
+    ]
+
+
+def split(pieces, max_bytes):
+    splitter = service.NdjsonLines(max_bytes)
+    lines = [line for piece in pieces for line in splitter.feed(piece)]
+    return lines + list(splitter.close())
+
+
+def test_ndjson_lines_are_numbered_across_pieces():
+    assert split([b'{"a":', b' 1}\n\n{"b"', b": 2}\n", b'{"c": 3}'], 64) == [
+        (1, b'{"a": 1}'), (3, b'{"b": 2}'), (4, b'{"c": 3}'),
+    ]
+
+
+def test_an_overlong_line_gets_an_inline_error_and_is_skipped(worker_bundle, dataset_path):
+    (_, first), (_, last) = ndjson_lines(dataset_path, 2)
+    # The long line arrives in small pieces and never completes before the limit
+    pieces = [first + b"\n", b'{"notes": "'] + [b"x" * 100] * 50 + [b'"}\n', last]
+    lines = split(pieces, 1000)
+    assert [number for number, _ in lines] == [1, 2, 3]
+    assert lines[1] == (2, None)
+    payload, rejected, _ = service.score_ndjson(lines)
+    results = [json.loads(line) for line in payload.decode().splitlines()]
+    assert rejected == 1
+    assert results[1] == {"line": 2, "error": f"line longer than {service.BULK_MAX_LINE_BYTES} bytes"}
+    assert "error" not in results[0] and "error" not in results[2]
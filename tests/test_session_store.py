@@ -0,0 +1,63 @@
+import json
+import sqlite3
+import time
+
+import numpy as np
+import pytest
+
+from cardioguard.session_store import SessionStore, SessionTooLarge, decode_record, encode_record
+
+
+@pytest.fixture
+def path(tmp_path):
+    return str(tmp_path / "sessions.sqlite3")
+
+
+def test_records_round_trip_compressed():
+    record = {"risk_percentage": np.float64(42.5), "flags": np.array([True, False]), "user_data": {"age": 50}}
+    blob = encode_record(record)
+    assert decode_record(blob) == {"risk_percentage": 42.5, "flags": [True, False], "user_data": {"age": 50}}
+    repetitive = {"history": [{"age": 50, "sysBP": 120}] * 200}
+    assert len(encode_record(repetitive)) < len(json.dumps(repetitive)) / 10
+    with pytest.raises(TypeError):
+        encode_record({"when": object()})
+
+
+def test_transient_keys_are_trimmed_before_a_record_is_rejected(path):
+    store = SessionStore(path, max_record_bytes=2048, transient_keys=("progress_checklist", "scratch"))
+    noise = np.random.default_rng(0).bytes(4096).hex()
+    store.save("a", {"risk_level": "Low", "progress_checklist": noise})
+    assert store.load("a") == {"risk_level": "Low"}
+    assert store.stats()["trimmed_fields_total"] == 1
+
+    with pytest.raises(SessionTooLarge):
+        store.save("b", {"notes": noise, "scratch": [1]})
+    assert store.load("b") == {}
+    stats = store.stats()
+    assert stats["trimmed_fields_total"] == 2 and stats["rejected_total"] == 1
+
+
+def test_idle_sessions_spill_and_reload(path):
+    store = SessionStore(path, idle_seconds=0.2, sweep_interval=3600)
+    store.save("idle", {"risk_level": "High"})
+    time.sleep(0.3)
+    store.save("busy", {"risk_level": "Low"})
+    assert store.sweep() == 1
+    stats = store.stats()
+    assert stats["live_sessions"] == 1 and stats["spilled_sessions"] == 1
+    # A restarted app finds the spilled session in the database
+    assert SessionStore(path).load("idle") == {"risk_level": "High"}
+    assert store.stats()["spilled_sessions"] == 0
+
+
+def test_spilled_sessions_expire(path):
+    store = SessionStore(path, idle_seconds=0, expire_seconds=3600)
+    store.save("old", {"risk_level": "High"})
+    store.save("recent", {"risk_level": "Low"})
+    assert store.sweep() == 2
+    with sqlite3.connect(path) as db:
+        db.execute("UPDATE sessions SET updated = updated - 7200 WHERE session_id = 'old'")
+    store.sweep()
+    assert store.load("old") == {}
+    assert store.load("recent") == {"risk_level": "Low"}
+    assert store.stats()["expired_total"] == 1
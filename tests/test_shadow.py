@@ -0,0 +1,52 @@
+import time
+
+import numpy as np
+
+from cardioguard.features import FEATURE_COLUMNS
+from cardioguard.shadow import ShadowScorer
+
+
+class FlakyCandidate:
+    # Answers the first batch with the wrong number of rows, then scores everything 0.75
+    def __init__(self):
+        self.calls = 0
+
+    def predict_proba(self, inputs):
+        self.calls += 1
+        rows = 1 if self.calls == 1 else len(inputs)
+        return np.tile([0.25, 0.75], (rows, 1))
+
+
+class Registry:
+    def __init__(self, model):
+        self.model = model
+
+    def load_version(self, version):
+        return type("Bundle", (), {"stack": self.model})()
+
+
+def wait_for(scorer, **counts):
+    deadline = time.monotonic() + 5
+    while time.monotonic() < deadline:
+        stats = scorer.stats()
+        if all(stats[key] >= value for key, value in counts.items()):
+            return stats
+        time.sleep(0.01)
+    raise AssertionError(f"shadow scorer stuck at {scorer.stats()}")
+
+
+def test_the_worker_survives_a_failing_candidate(tmp_path):
+    scorer = ShadowScorer(Registry(FlakyCandidate()), ["candidate"], str(tmp_path / "shadow.sqlite3"),
+                          batch_size=3, batch_wait=1)
+    row = np.zeros(len(FEATURE_COLUMNS))
+    for _ in range(3):
+        scorer.submit(row, 0.4, "primary")
+    assert wait_for(scorer, dropped=3)["scored"] == 0
+
+    for prob in (0.4, 0.9):
+        scorer.submit(row, prob, "primary")
+    stats = wait_for(scorer, scored=2)
+    assert stats["dropped"] == 3
+    totals = stats["candidate_vs_primary"]
+    assert totals["n"] == 2 and totals["agreement"] == 0.5
+    assert np.isclose(totals["mean_delta"], ((0.75 - 0.4) + (0.75 - 0.9)) / 2)
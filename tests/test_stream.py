@@ -0,0 +1,123 @@
+import os
+import shutil
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from cardioguard import stream
+
+
+class Interrupted(Exception):
+    pass
+
+
+@pytest.fixture
+def job(tmp_path, monkeypatch, bundle, dataset_path):
+    # A 1,000-row extract scored against the test bundle in place of the registry
+    class Registry:
+        def active_version(self):
+            return "test"
+
+        def load_version(self, version):
+            return bundle
+
+    monkeypatch.setattr(stream, "ModelRegistry", Registry)
+    monkeypatch.setattr(stream, "open_monitor", lambda **kwargs: None)
+    source = tmp_path / "extract.csv"
+    pd.read_csv(dataset_path).head(1000).to_csv(source, index=False)
+    return str(source)
+
+
+def interrupt_after(monkeypatch, chunks):
+    commit = stream.Checkpoint.commit
+
+    def failing(self, rows, output_bytes):
+        commit(self, rows, output_bytes)
+        if self.state["chunks"] == chunks:
+            raise Interrupted
+
+    monkeypatch.setattr(stream.Checkpoint, "commit", failing)
+
+
+def test_run_scores_every_row(job, tmp_path):
+    output = str(tmp_path / "scores.csv")
+    state = stream.run(job, output, chunk_rows=300)
+    scored = pd.read_csv(output)
+    assert state["complete"] and state["rows"] == 1000 and state["chunks"] == 4
+    assert len(scored) == 1000
+    assert scored["stack_prob"].between(0, 1).all()
+
+
+@pytest.mark.parametrize("suffix", [".csv", ".parquet"])
+def test_resume_matches_an_uninterrupted_run(job, tmp_path, monkeypatch, suffix):
+    expected = str(tmp_path / f"expected{suffix}")
+    stream.run(job, expected, chunk_rows=300)
+    output = str(tmp_path / f"scores{suffix}")
+    with monkeypatch.context() as patch:
+        interrupt_after(patch, 2)
+        with pytest.raises(Interrupted):
+            stream.run(job, output, chunk_rows=300)
+    state = stream.run(job, output, chunk_rows=300)
+    assert state["complete"] and state["rows"] == 1000
+    pd.testing.assert_frame_equal(pd.read_csv(output) if suffix == ".csv" else pd.read_parquet(output),
+                                  pd.read_csv(expected) if suffix == ".csv" else pd.read_parquet(expected))
+
+
+def test_partial_chunk_is_truncated_on_resume(job, tmp_path, monkeypatch):
+    expected = str(tmp_path / "expected.csv")
+    stream.run(job, expected, chunk_rows=300)
+    output = str(tmp_path / "scores.csv")
+    with monkeypatch.context() as patch:
+        interrupt_after(patch, 1)
+        with pytest.raises(Interrupted):
+            stream.run(job, output, chunk_rows=300)
+    # A crash halfway through writing the next chunk
+    with open(output, "a") as f:
+        f.write("1,2,3\n4,5")
+    stream.run(job, output, chunk_rows=300)
+    pd.testing.assert_frame_equal(pd.read_csv(output), pd.read_csv(expected))
+
+
+def test_parquet_part_files_past_the_checkpoint_are_removed(job, tmp_path, monkeypatch):
+    output = str(tmp_path / "scores.parquet")
+    with monkeypatch.context() as patch:
+        interrupt_after(patch, 2)
+        with pytest.raises(Interrupted):
+            stream.run(job, output, chunk_rows=300)
+    # An uncommitted part and a half-written temporary file
+    shutil.copy(os.path.join(output, "part-000001.parquet"), os.path.join(output, "part-000002.parquet"))
+    open(os.path.join(output, "part-000003.parquet.tmp"), "wb").close()
+    stream.run(job, output, chunk_rows=300)
+    assert sorted(os.listdir(output)) == [f"part-{i:06d}.parquet" for i in range(4)]
+    assert len(pd.read_parquet(output)) == 1000
+
+
+def test_completed_job_is_not_rescored(job, tmp_path, monkeypatch):
+    output = str(tmp_path / "scores.csv")
+    stream.run(job, output, chunk_rows=300)
+    monkeypatch.setattr(stream, "score_chunk", lambda *args: pytest.fail("rescored a complete job"))
+    assert stream.run(job, output, chunk_rows=300)["rows"] == 1000
+
+
+def test_changed_input_refuses_to_resume(job, tmp_path, monkeypatch):
+    output = str(tmp_path / "scores.csv")
+    with monkeypatch.context() as patch:
+        interrupt_after(patch, 1)
+        with pytest.raises(Interrupted):
+            stream.run(job, output, chunk_rows=300)
+    with open(job, "a") as f:
+        f.write(f"{','.join(['1'] * len(pd.read_csv(job).columns))}\n")
+    with pytest.raises(stream.CheckpointMismatch):
+        stream.run(job, output, chunk_rows=300)
+    assert stream.run(job, output, chunk_rows=300, restart=True)["rows"] == 1001
+
+
+def test_unscorable_rows_keep_their_place(job, bundle):
+    frame = pd.read_csv(job).head(5)
+    frame.loc[2, "age"] = 0
+    scored = stream.score_chunk(frame, bundle)
+    assert len(scored) == 5
+    assert np.isnan(scored.loc[2, "stack_prob"]) and "age" in scored.loc[2, "error"]
+    assert scored.drop(index=2)["stack_prob"].notna().all()
+    assert (scored.drop(index=2)["error"] == "").all()
@@ -0,0 +1,79 @@
+import warnings
+from copy import deepcopy
+
+import numpy as np
+import pandas as pd
+import pytest
+from sklearn.ensemble import RandomForestClassifier
+
+from cardioguard.features import FEATURE_COLUMNS
+from cardioguard.training import update_forest, update_stack
+
+
+@pytest.fixture
+def batch(dataset):
+    features, y = dataset
+    return features.tail(400).reset_index(drop=True), y.tail(400).reset_index(drop=True)
+
+
+def test_update_forest_grows_new_trees_and_retires_the_oldest(bundle, batch):
+    forest = deepcopy(bundle.rf)
+    before = list(forest.estimators_)
+    update_forest(forest, *batch, add=6, retire=4, seed=7)
+    assert len(forest.estimators_) == forest.n_estimators == len(before) + 2
+    # The 4 oldest are gone, the rest keep their order, and 6 new trees follow
+    assert all(a is b for a, b in zip(forest.estimators_[:len(before) - 4], before[4:]))
+    assert not any(tree in before for tree in forest.estimators_[-6:])
+    assert forest.class_weight == "balanced" and not forest.warm_start
+
+
+def test_updated_forest_predicts_as_the_mean_of_its_trees(bundle, batch):
+    forest = deepcopy(bundle.rf)
+    update_forest(forest, *batch, add=5, retire=5, seed=1)
+    X = np.asarray(batch[0], dtype=np.float32)
+    mean = np.mean([tree.predict_proba(X) for tree in forest.estimators_], axis=0)
+    np.testing.assert_allclose(forest.predict_proba(batch[0]), mean, atol=1e-12)
+
+
+def test_new_trees_weight_the_batch_balanced_without_warnings(batch):
+    X, y = batch
+    assert np.mean(y) < 0.3
+    forest = RandomForestClassifier(n_estimators=3, class_weight="balanced", random_state=0).fit(X, y)
+    with warnings.catch_warnings():
+        # sklearn warns about class_weight="balanced" with warm_start
+        warnings.simplefilter("error")
+        update_forest(forest, X, y, add=2, retire=0, seed=3)
+    for tree in forest.estimators_[-2:]:
+        root = tree.tree_.value[0, 0]
+        # Root class weights are balanced over the batch (bootstrap draws aside)
+        assert root[1] / root.sum() == pytest.approx(0.5, abs=0.1)
+
+
+def test_update_forest_cannot_retire_every_tree(bundle, batch):
+    forest = deepcopy(bundle.rf)
+    with pytest.raises(ValueError):
+        update_forest(forest, *batch, add=2, retire=len(forest.estimators_) + 2, seed=0)
+
+
+def test_update_stack_refits_the_meta_learner_on_all_oof_rows(bundle, batch):
+    stack = deepcopy(bundle.stack)
+    state = {
+        "oof": np.zeros((10, 2)), "y": np.array([0, 1] * 5),
+        "X_batches": pd.DataFrame(columns=FEATURE_COLUMNS, dtype=np.float64),
+        "y_batches": np.empty(0, dtype=np.int64), "batches": [], "trees_grown": 0,
+    }
+    X, y = batch
+    entry = update_stack(stack, state, X, y, add=4)
+    assert entry["rows"] == len(X) and entry["meta_rows"] == 10 + len(X)
+    assert entry["trees"] == len(bundle.rf.estimators_)
+    assert state["oof"].shape == (10 + len(X), 2) and state["trees_grown"] == 4
+    assert len(state["X_batches"]) == len(X)
+    # The batch rows were scored by the base learners before the forest changed
+    np.testing.assert_allclose(state["oof"][10:, 1], bundle.stack.named_estimators_["best_rf"].predict_proba(X)[:, 1])
+    assert stack.final_estimator_ is not bundle.stack.final_estimator_
+
+
+def test_update_stack_needs_both_outcomes(bundle, batch):
+    X, y = batch
+    with pytest.raises(ValueError):
+        update_stack(deepcopy(bundle.stack), {}, X, np.zeros(len(X), dtype=int))
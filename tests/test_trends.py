@@ -0,0 +1,48 @@
+from datetime import datetime, timezone
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from cardioguard.trends import bucket_start, downsample_history, lttb_indices
+
+
+def test_lttb_keeps_endpoints_and_threshold_points():
+    rng = np.random.default_rng(0)
+    x = np.arange(1000, dtype=float)
+    y = rng.normal(size=1000)
+    keep = lttb_indices(x, y, 50)
+    assert len(keep) == 50
+    assert keep[0] == 0 and keep[-1] == 999
+    assert np.all(np.diff(keep) > 0)
+
+
+def test_lttb_keeps_an_isolated_spike():
+    x = np.arange(500, dtype=float)
+    y = np.zeros(500)
+    y[237] = 10.0
+    assert 237 in lttb_indices(x, y, 20)
+
+
+@pytest.mark.parametrize("threshold", [2, 10, 11])
+def test_lttb_returns_everything_when_it_cannot_reduce(threshold):
+    x = np.arange(10, dtype=float)
+    assert np.array_equal(lttb_indices(x, x, threshold), np.arange(10))
+
+
+def test_downsample_history_bounds_points():
+    history = pd.DataFrame({"ts": np.arange(5000, dtype=float), "stack_prob": np.linspace(0, 1, 5000)})
+    sampled = downsample_history(history, max_points=300)
+    assert len(sampled) == 300
+    assert sampled["ts"].iloc[0] == 0 and sampled["ts"].iloc[-1] == 4999
+    short = history.head(100)
+    assert downsample_history(short, max_points=300) is short
+
+
+def test_bucket_start():
+    # Thursday 2024-03-14 12:30 UTC
+    ts = datetime(2024, 3, 14, 12, 30, tzinfo=timezone.utc).timestamp()
+    assert bucket_start(ts, "week") == datetime(2024, 3, 11, tzinfo=timezone.utc).timestamp()
+    assert bucket_start(ts, "month") == datetime(2024, 3, 1, tzinfo=timezone.utc).timestamp()
+    with pytest.raises(ValueError):
+        bucket_start(ts, "year")
@@ -0,0 +1,64 @@
+import numpy as np
+import pytest
+from sklearn.linear_model import LogisticRegression
+
+from cardioguard import uncertainty
+from cardioguard.registry import ModelBundle
+from cardioguard.uncertainty import needs_review, predict_with_dispersion, review_std, score_columns
+
+
+@pytest.mark.parametrize("name", ["rf", "stack"])
+def test_dispersion_mean_is_predict_proba(bundle, dataset, name):
+    features, _ = dataset
+    model = getattr(bundle, name)
+    out = predict_with_dispersion(model, features)
+    expected = model.predict_proba(features)
+    np.testing.assert_allclose(out["proba"], expected, rtol=0, atol=1e-12)
+    assert np.array_equal(out["pred"], model.predict(features))
+    assert np.all(out["std"] >= 0)
+    assert np.all(out["low"] <= out["high"])
+
+
+@pytest.mark.parametrize("name", ["rf", "stack"])
+def test_blocks_do_not_change_results(bundle, dataset, monkeypatch, name):
+    features, _ = dataset
+    model = getattr(bundle, name)
+    whole = predict_with_dispersion(model, features)
+    monkeypatch.setattr(uncertainty, "BLOCK_ROWS", 257)
+    blocked = predict_with_dispersion(model, features)
+    # The linear parts may round differently at another matrix shape (BLAS), by at most a few ulps
+    for key in whole:
+        np.testing.assert_allclose(blocked[key], whole[key], rtol=0, atol=1e-12, err_msg=key)
+
+
+def test_models_without_trees_have_no_spread(dataset):
+    features, y = dataset
+    model = LogisticRegression(solver="liblinear").fit(features, y)
+    out = predict_with_dispersion(model, features)
+    np.testing.assert_array_equal(out["prob"], model.predict_proba(features)[:, 1])
+    assert np.all(out["std"] == 0)
+
+
+def test_score_columns(bundle, dataset):
+    features, _ = dataset
+    scores = score_columns(bundle, features.head(10))
+    assert list(scores) == uncertainty.SCORE_COLUMNS
+    np.testing.assert_allclose(scores["stack_prob"], bundle.stack.predict_proba(features.head(10))[:, 1], atol=1e-12)
+
+
+def test_review_threshold_precedence(monkeypatch):
+    monkeypatch.delenv("CARDIOGUARD_REVIEW_STD", raising=False)
+    calibrated = ModelBundle("v", None, None, {"metrics": {"review_std": {"threshold": 0.03}}})
+    assert review_std(calibrated) == 0.03
+    assert review_std(ModelBundle("legacy", None, None)) == uncertainty.REVIEW_STD
+    monkeypatch.setenv("CARDIOGUARD_REVIEW_STD", "0.1")
+    assert review_std(calibrated) == 0.1
+    assert list(needs_review([0.05, 0.1, 0.2])) == [False, True, True]
+
+
+def test_calibration_flags_the_chosen_share(bundle, dataset):
+    features, _ = dataset
+    calibration = uncertainty.calibrate_review_std(bundle.stack, features, percentile=90)
+    spread = predict_with_dispersion(bundle.stack, features)["std"]
+    assert calibration["patients"] == len(features)
+    assert np.mean(needs_review(spread, calibration["threshold"])) == pytest.approx(0.1, abs=0.01)